@@ -0,0 +1,49 @@
+// API URL from environment variable
+const API_URL = process.env.NEXT_PUBLIC_API_URL || "http://localhost:8000"
+
+export async function POST(req: Request) {
+  const body = await req.json()
+
+  // Extract the session ID and messages from the request body
+  const sessionId = body.session_ids
+  const messages = body.messages || []
+
+  try {
+    const response = await fetch(`${API_URL}/chat/stream`, {
+      method: "POST",
+      headers: {
+        "Content-Type": "application/json",
+      },
+      body: JSON.stringify({
+        messages: messages[0].content, // Just send the current message
+        session_ids: sessionId,
+        device_id: body.device_id,
+      }),
+    })
+
+    if (!response.ok || !response.body) {
+      throw new Error(`Failed to communicate with backend: ${response.statusText}`)
+    }
+
+    // Pass the Server-Sent Events through as they arrive instead of buffering the answer
+    return new Response(response.body, {
+      headers: {
+        "Content-Type": "text/event-stream",
+        "Cache-Control": "no-cache",
+        Connection: "keep-alive",
+      },
+    })
+  } catch (error) {
+    console.error("Error forwarding chat stream request:", error)
+    return new Response(
+      JSON.stringify({
+        error: "Failed to communicate with backend",
+        details: error instanceof Error ? error.message : "Unknown error",
+      }),
+      {
+        status: 500,
+        headers: { "Content-Type": "application/json" },
+      },
+    )
+  }
+}
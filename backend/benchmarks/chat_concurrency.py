@@ -0,0 +1,77 @@
+"""Measure /chat throughput as the number of concurrent clients grows.
+
+Run from the backend directory:
+
+    python -m benchmarks.chat_concurrency --llm-latency 0.2 --concurrency 1 2 4 8 16 32
+
+With a non-blocking chat path, throughput should grow roughly linearly with
+concurrency until the fake LLM latency stops being the bottleneck.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+from benchmarks.common import load_app, percentile, wait_until_processed
+
+DOCUMENT_TEXT = "The refund policy allows returns within thirty days of purchase. " * 200
+
+
+async def _create_sessions(client, count):
+    session_ids = []
+    for i in range(count):
+        response = await client.post(
+            "/upload",
+            files={"file": (f"doc-{i}.txt", DOCUMENT_TEXT.encode("utf-8"), "text/plain")},
+        )
+        response.raise_for_status()
+        doc_id = response.json()["id"]
+        await wait_until_processed(client, doc_id)
+        (await client.post(f"/create_session/{doc_id}", json={})).raise_for_status()
+        session_ids.append(doc_id)
+    return session_ids
+
+
+async def _run_level(client, session_ids, concurrency, requests_per_client):
+    latencies = []
+
+    async def worker(session_id):
+        for _ in range(requests_per_client):
+            started = time.perf_counter()
+            response = await client.post("/chat", json={"messages": "What is the refund policy?",
+                                                        "session_ids": session_id})
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(session_ids[i]) for i in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+    }
+
+
+async def main(args):
+    api = load_app(llm_latency=args.llm_latency, embedding_latency=args.embedding_latency)
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for concurrency in args.concurrency:
+            # Every client gets a fresh session so the 20-message limit never kicks in
+            session_ids = await _create_sessions(client, concurrency)
+            result = await _run_level(client, session_ids, concurrency, args.requests_per_client)
+            print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--embedding-latency", type=float, default=0.02)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--requests-per-client", type=int, default=5)
+    asyncio.run(main(parser.parse_args()))
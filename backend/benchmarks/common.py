@@ -0,0 +1,69 @@
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import uvicorn
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_app(llm_latency: float = 0.0, embedding_latency: float = 0.0, workdir: str = None, llm_capacity: int = 0):
+    """Import the real FastAPI app inside a scratch directory with offline fake models.
+
+    llm_capacity limits how many LLM calls the fake model serves at once (0 = unlimited).
+    """
+    if BACKEND_DIR not in sys.path:
+        sys.path.insert(0, BACKEND_DIR)
+    workdir = workdir or tempfile.mkdtemp(prefix="senseai-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    # All data directories in config.settings are relative to the working directory
+    os.chdir(workdir)
+    os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+    from benchmarks.fakes import FakeChatModel, FakeEmbeddings
+    import routes.api as api
+
+    # Keep the real embedding cache in front of the fake embedder
+    api.embeddings.embeddings = FakeEmbeddings(latency=embedding_latency)
+    api.llm = FakeChatModel(latency=llm_latency, capacity=llm_capacity)
+    return api
+
+
+def serve_in_thread(app):
+    """Serve an app with uvicorn on its own event loop in a background thread.
+
+    Returns (server, thread, loop, base URL); stop it with server.should_exit = True
+    and thread.join().
+    """
+    loop = asyncio.new_event_loop()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=0, log_level="warning", loop="asyncio"))
+    thread = threading.Thread(target=loop.run_until_complete, args=(server.serve(),), daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    return server, thread, loop, f"http://127.0.0.1:{port}"
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def wait_until_processed(client, doc_id: str, timeout: float = 120.0):
+    """Poll the status endpoint until ingestion of a document or URL finished."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        status = (await client.get(f"/documents/{doc_id}/status")).json()
+        if status["status"] == "done":
+            return status
+        if status["status"] == "failed":
+            raise RuntimeError(f"Processing {doc_id} failed: {status.get('error')}")
+        await asyncio.sleep(0.05)
+    raise TimeoutError(f"Processing {doc_id} did not finish within {timeout}s")
@@ -0,0 +1,110 @@
+"""Measure site crawl throughput (pages per second) against a local test site.
+
+Run from the backend directory:
+
+    python -m benchmarks.crawl_throughput --pages 300 --latency 0.05 --concurrency 1 4 16
+
+The test site is a tree of linked pages with a sitemap and a robots.txt that
+disallows /private/; every response is delayed by --latency to mimic a remote
+server. The crawler is first run on its own per concurrency level, then the full
+/add_site ingestion (crawl + embed + index) is timed once.
+"""
+import argparse
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+
+from benchmarks.common import load_app, wait_until_processed
+
+FANOUT = 10
+
+
+def _page_html(page: int, pages: int) -> str:
+    children = [child for child in range(page * FANOUT + 1, page * FANOUT + FANOUT + 1) if child < pages]
+    links = "".join(f'<a href="/page/{child}">Page {child}</a> ' for child in children)
+    text = " ".join(f"Page {page} paragraph {i} documents feature {page * 7 + i}." for i in range(40))
+    return (f"<html lang='en'><head><title>Page {page}</title></head><body><p>{text}</p>{links}"
+            f"<a href='/private/{page}'>private</a></body></html>")
+
+
+def _serve(pages: int, latency: float) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(latency)
+            if self.path == "/robots.txt":
+                body, content_type = "User-agent: *\nDisallow: /private/\n", "text/plain"
+            elif self.path == "/sitemap.xml":
+                host = self.headers["Host"]
+                locations = "".join(f"<url><loc>http://{host}/page/{i}</loc></url>" for i in range(pages))
+                body = ('<?xml version="1.0"?><urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+                        f"{locations}</urlset>")
+                content_type = "application/xml"
+            elif self.path.startswith("/page/") and int(self.path.rsplit("/", 1)[1]) < pages:
+                body, content_type = _page_html(int(self.path.rsplit("/", 1)[1]), pages), "text/html"
+            else:
+                self.send_error(404)
+                return
+            payload = body.encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+async def main(args):
+    api = load_app()
+    from utils.crawler import SiteCrawler
+
+    server = _serve(args.pages, args.latency)
+    base = f"http://127.0.0.1:{server.server_port}"
+    depth = 0
+    while sum(FANOUT ** level for level in range(depth + 1)) < args.pages:
+        depth += 1
+
+    for concurrency in args.concurrency:
+        crawler = SiteCrawler(concurrency, concurrency, timeout=30, user_agent="senseai-bench")
+        started = time.perf_counter()
+        pages = 0
+        async for _ in crawler.crawl(root_url=f"{base}/page/0", max_depth=depth, max_pages=args.pages):
+            pages += 1
+        elapsed = time.perf_counter() - started
+        print(json.dumps({
+            "mode": "crawler", "concurrency": concurrency, "pages": pages,
+            "pages_per_s": round(pages / elapsed, 1), **crawler.stats
+        }))
+
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        started = time.perf_counter()
+        response = await client.post("/add_site", json={"sitemap_url": f"{base}/sitemap.xml", "max_pages": args.pages})
+        response.raise_for_status()
+        site_id = response.json()["id"]
+        await wait_until_processed(client, site_id)
+        elapsed = time.perf_counter() - started
+        metadata = api.document_catalog.get(site_id)
+        print(json.dumps({
+            "mode": "add_site", "pages": metadata["pages"], "chunks": metadata["chunks"],
+            "pages_per_s": round(metadata["pages"] / elapsed, 1), "seconds": round(elapsed, 2)
+        }))
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=300)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    asyncio.run(main(parser.parse_args()))
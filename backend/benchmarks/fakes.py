@@ -0,0 +1,161 @@
+import asyncio
+import contextlib
+import hashlib
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import PrivateAttr
+
+
+class FakeEmbeddings(Embeddings):
+    """Deterministic offline embeddings with optional artificial latency per call."""
+
+    def __init__(self, size: int = 64, latency: float = 0.0, model: str = "fake-embedding"):
+        self.size = size
+        self.latency = latency
+        self.model = model
+        self.calls = 0
+        self.texts_embedded = 0
+
+    def _vector(self, text: str) -> List[float]:
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:4], "little")
+        vector = np.random.default_rng(seed).standard_normal(self.size)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.calls += 1
+        self.texts_embedded += len(texts)
+        if self.latency:
+            time.sleep(self.latency)
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.calls += 1
+        self.texts_embedded += len(texts)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return [self._vector(text) for text in texts]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+
+class FakeChatModel(BaseChatModel):
+    """Chat model that answers with a canned sentence after an artificial delay.
+
+    With a capacity, at most that many async calls are served at once and the rest wait
+    for a turn, like an upstream API at its rate limit.
+    """
+
+    latency: float = 0.0
+    answer: str = "This is a canned answer from the benchmark chat model."
+    capacity: int = 0
+    _upstream: Optional[asyncio.Semaphore] = PrivateAttr(default=None)
+
+    def _upstream_slot(self):
+        if not self.capacity:
+            return contextlib.nullcontext()
+        if self._upstream is None:
+            self._upstream = asyncio.Semaphore(self.capacity)
+        return self._upstream
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def get_num_tokens(self, text: str) -> int:
+        # Whitespace tokens; the default tokenizer needs a download
+        return len(text.split())
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        if self.latency:
+            time.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.answer))])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        async with self._upstream_slot():
+            if self.latency:
+                await asyncio.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.answer))])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Any = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        words = self.answer.split(" ")
+        for i, word in enumerate(words):
+            if self.latency:
+                time.sleep(self.latency / len(words))
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=word if i == 0 else " " + word))
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Any = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        words = self.answer.split(" ")
+        async with self._upstream_slot():
+            for i, word in enumerate(words):
+                if self.latency:
+                    await asyncio.sleep(self.latency / len(words))
+                chunk = ChatGenerationChunk(message=AIMessageChunk(content=word if i == 0 else " " + word))
+                if run_manager:
+                    await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                yield chunk
+
+
+class FakePage:
+    """A web page of numbered paragraphs, served by serve_page; edit paragraphs to change it."""
+
+    def __init__(self, paragraphs: int):
+        self.paragraphs = [
+            f"Section {i}. " + " ".join(f"Paragraph {i} sentence {j} describes item {i * 31 + j}." for j in range(12))
+            for i in range(paragraphs)
+        ]
+        # Without validators every fetch returns the full page
+        self.send_etag = True
+        self.requests = 0
+        self.not_modified = 0
+
+    def html(self) -> bytes:
+        body = "".join(f"<p>{paragraph}</p>\n" for paragraph in self.paragraphs)
+        return f"<html lang='en'><head><title>Stand-in page</title></head><body>{body}</body></html>".encode("utf-8")
+
+
+def serve_page(page: FakePage) -> ThreadingHTTPServer:
+    """Serve a page on a local port, answering conditional requests with 304 when its ETag matches."""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            page.requests += 1
+            content = page.html()
+            etag = '"' + hashlib.sha256(content).hexdigest()[:16] + '"'
+            if page.send_etag and self.headers.get("If-None-Match") == etag:
+                page.not_modified += 1
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(content)))
+            if page.send_etag:
+                self.send_header("ETag", etag)
+            self.end_headers()
+            self.wfile.write(content)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
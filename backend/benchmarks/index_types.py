@@ -0,0 +1,85 @@
+"""Compare recall, search latency and memory of the FAISS index types against flat search.
+
+Run from the backend directory:
+
+    python -m benchmarks.index_types --vectors 100000 --dimension 1536
+
+Vectors are synthetic: Gaussian clusters in a low-dimensional latent space, roughly like
+embeddings of related chunks. Recall@k is measured against the exact results of the
+flat index.
+"""
+import argparse
+import json
+import sys
+import time
+
+import faiss
+import numpy as np
+
+from benchmarks.common import BACKEND_DIR, percentile
+
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from utils.document_processing import INDEX_TYPES, build_index  # noqa: E402
+
+
+def _synthetic_vectors(count: int, projection: np.ndarray, centers: np.ndarray, rng) -> np.ndarray:
+    # Real embeddings have a much lower intrinsic dimension than their size, so points are
+    # drawn around cluster centers in a small latent space and projected up
+    labels = rng.integers(0, len(centers), count)
+    latent = centers[labels] + 0.5 * rng.standard_normal((count, centers.shape[1])).astype(np.float32)
+    vectors = latent @ projection
+    # Embedding models return unit-length vectors
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def _run(index_type: str, vectors: np.ndarray, queries: np.ndarray, truth: np.ndarray, k: int) -> dict:
+    started = time.perf_counter()
+    index = build_index(vectors, index_type)
+    build_seconds = time.perf_counter() - started
+
+    latencies, found = [], []
+    for query in queries:
+        started = time.perf_counter()
+        _, ids = index.search(query[None, :], k)
+        latencies.append(time.perf_counter() - started)
+        found.append(ids[0])
+
+    recall = np.mean([len(set(ids) & set(expected)) / k for ids, expected in zip(found, truth)])
+    return {
+        "index_type": index_type,
+        "vectors": len(vectors),
+        "build_s": round(build_seconds, 2),
+        "recall_at_k": round(float(recall), 4),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "size_mb": round(len(faiss.serialize_index(index)) / (1024 * 1024), 1),
+    }
+
+
+def main(args):
+    rng = np.random.default_rng(args.seed)
+    projection = rng.standard_normal((args.latent_dimension, args.dimension)).astype(np.float32)
+    centers = rng.standard_normal((args.clusters, args.latent_dimension)).astype(np.float32)
+    vectors = _synthetic_vectors(args.vectors, projection, centers, rng)
+    queries = _synthetic_vectors(args.queries, projection, centers, rng)
+
+    # Ground truth from exact search
+    _, truth = build_index(vectors, "flat").search(queries, args.k)
+
+    for index_type in args.types:
+        print(json.dumps(_run(index_type, vectors, queries, truth, args.k)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--vectors", type=int, default=50000)
+    parser.add_argument("--dimension", type=int, default=1536)
+    parser.add_argument("--latent-dimension", type=int, default=32)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--types", nargs="+", default=list(INDEX_TYPES), choices=INDEX_TYPES)
+    main(parser.parse_args())
@@ -0,0 +1,189 @@
+"""Load-test the API served by several uvicorn worker processes sharing one data directory.
+
+Run from the backend directory:
+
+    python -m benchmarks.multi_worker --workers 1 2 4 --concurrency 32 --requests 400
+
+For each worker count the app (with the offline fake models) is started with
+`uvicorn --workers N` on a fresh data directory. The run first checks what shared
+session state must guarantee across workers, using a new connection per request so
+requests land on different workers:
+
+- ingestion status is visible from every worker (no "unknown" while processing),
+- concurrent messages to one session never get past the 20-message limit,
+- conversation memory includes turns answered by other workers (the condense
+  prompt grows with every turn),
+
+then reports /chat throughput over many sessions, which should grow with the
+worker count up to the number of cores.
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.common import BACKEND_DIR, load_app, percentile, wait_until_processed
+
+WORKDIR_ENV = "SENSEAI_BENCH_WORKDIR"
+LLM_LATENCY_ENV = "SENSEAI_BENCH_LLM_LATENCY"
+# Short enough to be a single chunk, so every turn retrieves the same context
+DOCUMENT = "Item 1 ships within 2 days. Item 2 ships within 5 days. Returns are accepted for 30 days."
+
+
+def create_app():
+    """uvicorn factory, called in every worker: the real app with fake models in the shared data directory."""
+    api = load_app(llm_latency=float(os.environ.get(LLM_LATENCY_ENV, 0)), workdir=os.environ[WORKDIR_ENV])
+    return api.app
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def _start_server(workers: int, llm_latency: float):
+    port = _free_port()
+    env = dict(os.environ, PYTHONPATH=BACKEND_DIR, CHAT_MEMORY_MODE="buffer")
+    env[WORKDIR_ENV] = tempfile.mkdtemp(prefix="senseai-bench-workers-")
+    env[LLM_LATENCY_ENV] = str(llm_latency)
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "benchmarks.multi_worker:create_app", "--factory",
+         "--workers", str(workers), "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 120
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while time.monotonic() < deadline:
+            try:
+                (await client.get("/")).raise_for_status()
+                return process, base_url
+            except httpx.TransportError:
+                await asyncio.sleep(0.2)
+    process.terminate()
+    raise TimeoutError("Server did not start within 120s")
+
+
+def _spread_client(base_url: str) -> httpx.AsyncClient:
+    # No keep-alive: every request opens a connection, which any worker may accept
+    return httpx.AsyncClient(base_url=base_url, timeout=None, limits=httpx.Limits(max_keepalive_connections=0))
+
+
+async def _upload(client, name: str) -> str:
+    response = await client.post("/upload", files={"file": (name, DOCUMENT.encode(), "text/plain")})
+    response.raise_for_status()
+    return response.json()["id"]
+
+
+async def _check_job_status(client) -> dict:
+    """Poll a new upload's status from whichever worker accepts each request."""
+    doc_id = await _upload(client, "status.txt")
+    polls, unknown = 0, 0
+    deadline = time.monotonic() + 120
+    while time.monotonic() < deadline:
+        status = (await client.get(f"/documents/{doc_id}/status")).json()["status"]
+        polls += 1
+        unknown += status == "unknown"
+        if status in ("done", "failed"):
+            break
+        await asyncio.sleep(0.02)
+    return {"status_polls": polls, "status_unknown_polls": unknown, "status_final": status}
+
+
+async def _check_message_limit(client, attempts: int) -> dict:
+    """Send more concurrent messages to one fresh session than its limit allows."""
+    session_id = await _upload(client, "limit.txt")
+    await wait_until_processed(client, session_id)
+    responses = await asyncio.gather(*(
+        client.post("/chat", json={"messages": f"Limit question {i}?", "session_ids": session_id})
+        for i in range(attempts)
+    ))
+    answered = [response.json() for response in responses if "cached" in response.json()]
+    remaining = sorted(reply["messages_remaining"] for reply in answered)
+    return {
+        "limit_attempts": attempts,
+        "limit_answered": len(answered),
+        "limit_ok": len(answered) == 20 and remaining == list(range(20)),
+    }
+
+
+async def _check_history(client, turns: int) -> dict:
+    """Ask consecutive questions in one session, each on a new connection."""
+    session_id = await _upload(client, "history.txt")
+    await wait_until_processed(client, session_id)
+    prompt_tokens = []
+    for turn in range(turns):
+        response = await client.post("/chat", json={
+            "messages": f"History question {turn:03d}?", "session_ids": session_id
+        })
+        response.raise_for_status()
+        prompt_tokens.append(response.json()["usage"]["prompt_tokens"])
+    # Every turn's condense prompt repeats all earlier turns, so a memory missing one grows less
+    grows = all(later > earlier for earlier, later in zip(prompt_tokens[1:], prompt_tokens[2:]))
+    return {"history_turns": turns, "history_ok": grows}
+
+
+async def _chat_throughput(base_url: str, concurrency: int, requests: int) -> dict:
+    async with _spread_client(base_url) as client:
+        # Identical content is deduplicated, so these sessions share one index
+        session_ids = [await _upload(client, f"chat-{i}.txt") for i in range(requests // 20 + 1)]
+        for session_id in session_ids:
+            await wait_until_processed(client, session_id)
+
+    latencies = []
+    pending = iter(range(requests))
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=None, limits=limits) as client:
+        async def chat_client():
+            for i in pending:
+                started = time.perf_counter()
+                response = await client.post("/chat", json={
+                    "messages": f"When does item {i} ship?", "session_ids": session_ids[i // 20]
+                })
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(chat_client() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return {
+        "chat_requests": requests,
+        "chat_throughput_rps": round(requests / elapsed, 2),
+        "chat_p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "chat_p99_ms": round(percentile(latencies, 99) * 1000, 1),
+    }
+
+
+async def main(args):
+    for workers in args.workers:
+        process, base_url = await _start_server(workers, args.llm_latency)
+        try:
+            async with _spread_client(base_url) as client:
+                result = {"workers": workers, "concurrency": args.concurrency}
+                result.update(await _check_job_status(client))
+                result.update(await _check_message_limit(client, args.limit_attempts))
+                result.update(await _check_history(client, args.history_turns))
+            result.update(await _chat_throughput(base_url, args.concurrency, args.requests))
+            print(json.dumps(result))
+        finally:
+            process.terminate()
+            process.wait(timeout=60)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--llm-latency", type=float, default=0.0)
+    parser.add_argument("--limit-attempts", type=int, default=30)
+    parser.add_argument("--history-turns", type=int, default=8)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,146 @@
+"""Compare /chat under overload with and without admission control.
+
+Run from the backend directory:
+
+    python -m benchmarks.overload --rate 30 --duration 10 --llm-latency 0.5 --llm-capacity 8
+
+The app runs under uvicorn in a background thread with a fake LLM that serves at most
+--llm-capacity calls at once, like an upstream at its rate limit. Requests arrive at a
+fixed --rate (open loop) from --devices devices, one of which sends --heavy-share of
+them, and clients give up after --client-timeout seconds. The run is repeated with
+admission control off (CHAT_MAX_CONCURRENT=0) and on, reporting answered, rejected
+(429/503) and timed-out requests and the latency of answered ones, overall and for the
+heavy and the other devices.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+from benchmarks.common import load_app, percentile, serve_in_thread, wait_until_processed
+from utils.admission import AdmissionController
+
+DOCUMENT = b"Item 1 ships within 2 days. Item 2 ships within 5 days. Returns are accepted for 30 days."
+HEAVY_DEVICE = "device-heavy"
+
+
+def _device_for(i: int, devices: int, heavy_share: float) -> str:
+    # Spread the heavy device's requests evenly over the run instead of front-loading them
+    if int((i + 1) * heavy_share) > int(i * heavy_share):
+        return HEAVY_DEVICE
+    return f"device-{i % (devices - 1)}"
+
+
+async def _create_sessions(client, device_ids: list, per_device: int) -> dict:
+    sessions = {}
+    for device_id in device_ids:
+        sessions[device_id] = []
+        for _ in range(per_device):
+            response = await client.post("/upload", files={"file": ("doc.txt", DOCUMENT, "text/plain")},
+                                         data={"device_id": device_id})
+            response.raise_for_status()
+            sessions[device_id].append(response.json()["id"])
+    for ids in sessions.values():
+        for session_id in ids:
+            await wait_until_processed(client, session_id)
+    return sessions
+
+
+def _latencies(results: list, heavy=None) -> dict:
+    ok = [r["latency"] for r in results if r["outcome"] == "ok" and (heavy is None or r["heavy"] == heavy)]
+    return {"p50_ms": round(percentile(ok, 50) * 1000, 1), "p99_ms": round(percentile(ok, 99) * 1000, 1)}
+
+
+async def _run(api, base_url: str, args, label: str, sessions: dict) -> dict:
+    results = []
+    sent = {device_id: 0 for device_id in sessions}
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.client_timeout, limits=limits) as client:
+        async def send(i: int):
+            device_id = _device_for(i, args.devices, args.heavy_share)
+            # Sessions stop answering after 20 messages
+            session_id = sessions[device_id][sent[device_id] // 20]
+            sent[device_id] += 1
+            started = time.perf_counter()
+            try:
+                response = await client.post("/chat", json={
+                    "messages": f"{label} question {i}: when does item {i} ship?",
+                    "session_ids": session_id,
+                    "device_id": device_id
+                })
+                outcome = "ok" if response.status_code == 200 else str(response.status_code)
+            except httpx.TimeoutException:
+                outcome = "client_timeout"
+            results.append({"outcome": outcome, "latency": time.perf_counter() - started,
+                            "heavy": device_id == HEAVY_DEVICE})
+
+        total = int(args.rate * args.duration)
+        tasks = []
+        started = time.perf_counter()
+        for i in range(total):
+            await asyncio.sleep(max(0.0, started + i / args.rate - time.perf_counter()))
+            tasks.append(asyncio.create_task(send(i)))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+
+    # Requests whose clients gave up may still be running; let them finish before the next run
+    while api.chains_in_use:
+        await asyncio.sleep(0.1)
+
+    outcomes = {}
+    for result in results:
+        outcomes[result["outcome"]] = outcomes.get(result["outcome"], 0) + 1
+    return {
+        "admission": label,
+        "offered_rps": args.rate,
+        "requests": total,
+        "goodput_rps": round(outcomes.get("ok", 0) / elapsed, 2),
+        "outcomes": outcomes,
+        **_latencies(results),
+        "light": _latencies(results, heavy=False),
+        "heavy": _latencies(results, heavy=True),
+        "server": {key: value for key, value in api.admission.stats().items() if key not in ("active", "queued")},
+    }
+
+
+async def main(args):
+    api = load_app(llm_latency=args.llm_latency, llm_capacity=args.llm_capacity)
+    # Every question must reach the LLM
+    api.ANSWER_CACHE_ENABLED = False
+    server, thread, _, base_url = serve_in_thread(api.app)
+
+    device_ids = [HEAVY_DEVICE] + [f"device-{i}" for i in range(args.devices - 1)]
+    per_device = int(args.rate * args.duration * max(args.heavy_share, 1 / args.devices)) // 20 + 2
+    async with httpx.AsyncClient(base_url=base_url, timeout=None) as client:
+        configs = [("off", 0), ("on", args.max_concurrent)]
+        for label, max_active in configs:
+            # Fresh sessions, so both runs start with the same message budgets
+            sessions = await _create_sessions(client, device_ids, per_device)
+            api.admission = AdmissionController(max_active, args.max_queue, args.max_queue_per_device)
+            api.CHAT_QUEUE_TIMEOUT = args.queue_timeout
+            print(json.dumps(await _run(api, base_url, args, label, sessions)))
+
+    while api.ingestion.pending():
+        await asyncio.sleep(0.1)
+    server.should_exit = True
+    thread.join()
+    api.ingestion.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rate", type=float, default=30.0)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--devices", type=int, default=10)
+    parser.add_argument("--heavy-share", type=float, default=0.5)
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--llm-capacity", type=int, default=8)
+    parser.add_argument("--client-timeout", type=float, default=10.0)
+    parser.add_argument("--max-concurrent", type=int, default=8)
+    parser.add_argument("--max-queue", type=int, default=32)
+    parser.add_argument("--max-queue-per-device", type=int, default=8)
+    parser.add_argument("--queue-timeout", type=float, default=5.0)
+    asyncio.run(main(parser.parse_args()))
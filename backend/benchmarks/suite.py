@@ -0,0 +1,323 @@
+"""Offline benchmark suite over the upload, URL, session, chat and listing hot paths.
+
+Run from the backend directory:
+
+    python -m benchmarks.suite --documents 10 1000 --concurrency 1 8 64 --output results.jsonl
+    python -m benchmarks.suite --documents 10 1000 --concurrency 1 8 64 --baseline results.jsonl
+
+The real app runs against deterministic fake embeddings and chat model (with the
+given artificial latencies) and a local HTTP server for /add_url, so no network or
+API key is needed. For each corpus size the corpus is grown to that many documents
+through /upload, then /documents, /create_session and /chat are measured at each
+concurrency level. Every result is one JSON line with throughput, p50/p99 latency
+and resident memory; --baseline compares against an earlier run and exits non-zero
+on regressions beyond --tolerance.
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import psutil
+
+from benchmarks.common import BACKEND_DIR, load_app, percentile, wait_until_processed
+
+CORPUS_DEVICE = "bench-corpus"
+CHAT_DEVICE = "bench-chat"
+# Chat sessions stop answering after 20 messages
+MESSAGES_PER_SESSION = 20
+# Pause before retrying an upload refused because the ingestion queue is full
+QUEUE_FULL_BACKOFF = 0.05
+
+
+def _document_text(i: int) -> str:
+    return f"Document {i} covers topic {i % 97}. " + " ".join(
+        f"Clause {i}.{j} states that item {i * 13 + j} ships within {j + 1} days." for j in range(30)
+    )
+
+
+def _commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _memory() -> dict:
+    # ru_maxrss is in kilobytes on Linux
+    return {
+        "rss_mb": round(psutil.Process().memory_info().rss / (1024 * 1024), 1),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def _summary(scenario: str, documents: int, concurrency: int, latencies: list, elapsed: float, **extra) -> dict:
+    return {
+        "scenario": scenario,
+        "documents": documents,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        **extra,
+        **_memory(),
+    }
+
+
+async def _run_clients(concurrency: int, jobs: list):
+    """Run the request coroutine factories in jobs with `concurrency` clients; returns (latencies, seconds)."""
+    latencies = []
+    pending = iter(jobs)
+
+    async def client():
+        for job in pending:
+            started = time.perf_counter()
+            await job()
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return latencies, time.perf_counter() - started
+
+
+async def _upload(client, name: str, content: bytes, device_id: str, stats: dict) -> str:
+    while True:
+        response = await client.post("/upload", files={"file": (name, content, "text/plain")},
+                                     data={"device_id": device_id})
+        if response.status_code != 503:
+            response.raise_for_status()
+            return response.json()["id"]
+        stats["queue_full_retries"] += 1
+        await asyncio.sleep(QUEUE_FULL_BACKOFF)
+
+
+async def _grow_corpus(client, corpus: list, size: int, concurrency: int) -> dict:
+    """Upload documents until the corpus has `size` of them and wait until all are indexed."""
+    start = len(corpus)
+    stats = {"queue_full_retries": 0}
+
+    def job(i):
+        async def upload():
+            corpus.append(await _upload(client, f"doc-{i}.txt", _document_text(i).encode(), CORPUS_DEVICE, stats))
+        return upload
+
+    started = time.perf_counter()
+    latencies, _ = await _run_clients(concurrency, [job(i) for i in range(start, size)])
+    for doc_id in corpus[start:]:
+        await wait_until_processed(client, doc_id, timeout=3600)
+    ingest_elapsed = time.perf_counter() - started
+    return _summary("upload", size, concurrency, latencies, ingest_elapsed,
+                    ingested_docs_per_s=round((size - start) / ingest_elapsed, 2) if size > start else 0.0, **stats)
+
+
+async def _list_documents(client, documents: int, concurrency: int, requests: int, limit=None) -> dict:
+    params = {"device_id": CORPUS_DEVICE}
+    if limit:
+        params["limit"] = limit
+
+    async def request():
+        (await client.get("/documents", params=params)).raise_for_status()
+
+    latencies, elapsed = await _run_clients(concurrency, [request] * requests)
+    return _summary("documents" if not limit else f"documents_page_{limit}", documents, concurrency,
+                    latencies, elapsed)
+
+
+async def _create_sessions(api, client, corpus: list, documents: int, concurrency: int, requests: int,
+                           cold: bool) -> dict:
+    doc_ids = [corpus[i % len(corpus)] for i in range(requests)]
+    if cold:
+        # Force every request to open its index from disk
+        for doc_id in set(doc_ids):
+            api.vectorstore_cache.invalidate(api._get_vectorstore_path(doc_id))
+
+    def job(doc_id):
+        async def request():
+            (await client.post(f"/create_session/{doc_id}", json={})).raise_for_status()
+        return request
+
+    latencies, elapsed = await _run_clients(concurrency, [job(doc_id) for doc_id in doc_ids])
+    return _summary("create_session_cold" if cold else "create_session_warm", documents, concurrency,
+                    latencies, elapsed)
+
+
+async def _chat(client, documents: int, concurrency: int, requests_per_client: int) -> dict:
+    # Sessions share one document's content, so all but the first upload are deduplicated and skip ingestion
+    sessions_needed = concurrency * -(-requests_per_client // MESSAGES_PER_SESSION)
+    stats = {"queue_full_retries": 0}
+    content = _document_text(0).encode()
+    session_ids = [await _upload(client, f"chat-{i}.txt", content, CHAT_DEVICE, stats)
+                   for i in range(sessions_needed)]
+    await wait_until_processed(client, session_ids[0])
+    sessions = iter(session_ids)
+
+    latencies = []
+
+    async def client_run(i):
+        session_id, used = next(sessions), 0
+        for turn in range(requests_per_client):
+            if used == MESSAGES_PER_SESSION:
+                session_id, used = next(sessions), 0
+            started = time.perf_counter()
+            response = await client.post("/chat", json={
+                "messages": f"When does item {turn * 13 + i} ship?", "session_ids": session_id
+            })
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - started)
+            used += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client_run(i) for i in range(concurrency)))
+    return _summary("chat", documents, concurrency, latencies, time.perf_counter() - started)
+
+
+def _serve_pages() -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            page = int(self.path.rsplit("/", 1)[-1]) if self.path.rsplit("/", 1)[-1].isdigit() else 0
+            body = (f"<html lang='en'><head><title>Page {page}</title></head>"
+                    f"<body><p>{_document_text(100000 + page)}</p></body></html>").encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+async def _add_urls(client, base_url: str, documents: int, concurrency: int, count: int) -> dict:
+    url_ids = []
+    stats = {"queue_full_retries": 0}
+
+    def job(i):
+        async def request():
+            while True:
+                response = await client.post("/add_url", json={"url": f"{base_url}/page/{i}",
+                                                               "device_id": CORPUS_DEVICE})
+                if response.status_code != 503:
+                    break
+                stats["queue_full_retries"] += 1
+                await asyncio.sleep(QUEUE_FULL_BACKOFF)
+            response.raise_for_status()
+            url_ids.append(response.json()["id"])
+        return request
+
+    started = time.perf_counter()
+    latencies, _ = await _run_clients(concurrency, [job(i) for i in range(count)])
+    for url_id in url_ids:
+        await wait_until_processed(client, url_id)
+    elapsed = time.perf_counter() - started
+    return _summary("add_url", documents, concurrency, latencies, elapsed,
+                    ingested_docs_per_s=round(count / elapsed, 2), **stats)
+
+
+def _key(result: dict) -> tuple:
+    return result["scenario"], result["documents"], result["concurrency"]
+
+
+def compare(results: list, baseline_path: str, tolerance: float) -> bool:
+    """Print how each result moved against the baseline run; returns True if any regressed."""
+    with open(baseline_path) as f:
+        baseline = {_key(result): result for result in map(json.loads, f) if result.get("scenario")}
+
+    regressed = False
+    for result in results:
+        before = baseline.get(_key(result))
+        if before is None:
+            continue
+        # Ratios above 1 are worse for every metric
+        ratios = {
+            "throughput": before["throughput_rps"] / result["throughput_rps"] if result["throughput_rps"] else None,
+            "p99": result["p99_ms"] / before["p99_ms"] if before["p99_ms"] else None,
+            "peak_rss": result["peak_rss_mb"] / before["peak_rss_mb"] if before["peak_rss_mb"] else None,
+        }
+        worse = [name for name, ratio in ratios.items() if ratio is not None and ratio > 1 + tolerance]
+        regressed = regressed or bool(worse)
+        print(json.dumps({
+            "compare": dict(zip(("scenario", "documents", "concurrency"), _key(result))),
+            "baseline_commit": before.get("commit"),
+            **{f"{name}_ratio": round(ratio, 3) for name, ratio in ratios.items() if ratio is not None},
+            "regressed": worse,
+        }))
+    return regressed
+
+
+async def main(args) -> list:
+    api = load_app(llm_latency=args.llm_latency, embedding_latency=args.embedding_latency)
+    commit = _commit()
+    results = []
+
+    def report(result):
+        result["commit"] = commit
+        results.append(result)
+        print(json.dumps(result), flush=True)
+
+    server = _serve_pages()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    transport = httpx.ASGITransport(app=api.app)
+    corpus = []
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        # Warm up the ingestion worker processes, so their start-up isn't measured as upload time
+        warm_up = await _upload(client, "chat-0.txt", _document_text(0).encode(), CHAT_DEVICE,
+                                {"queue_full_retries": 0})
+        await wait_until_processed(client, warm_up)
+
+        for documents in sorted(args.documents):
+            report(await _grow_corpus(client, corpus, documents, max(args.concurrency)))
+            for concurrency in args.concurrency:
+                requests = max(concurrency, args.requests)
+                report(await _list_documents(client, documents, concurrency, requests))
+                report(await _list_documents(client, documents, concurrency, requests, limit=50))
+                report(await _create_sessions(api, client, corpus, documents, concurrency, requests, cold=True))
+                report(await _create_sessions(api, client, corpus, documents, concurrency, requests, cold=False))
+                report(await _chat(client, documents, concurrency, args.chat_requests_per_client))
+        report(await _add_urls(client, base_url, len(corpus), max(args.concurrency), args.urls))
+
+        # Let background jobs finish before the event loop goes away
+        while api.ingestion.pending():
+            await asyncio.sleep(0.1)
+    server.shutdown()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--documents", type=int, nargs="+", default=[10, 1000],
+                        help="corpus sizes to measure at, e.g. 10 1000 50000")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 64],
+                        help="concurrent clients, e.g. 1 8 64 200")
+    parser.add_argument("--requests", type=int, default=100, help="requests per listing/session measurement")
+    parser.add_argument("--chat-requests-per-client", type=int, default=5)
+    parser.add_argument("--urls", type=int, default=20)
+    parser.add_argument("--llm-latency", type=float, default=0.05)
+    parser.add_argument("--embedding-latency", type=float, default=0.01)
+    parser.add_argument("--output", help="also write the results as JSON lines to this file")
+    parser.add_argument("--baseline", help="JSON lines of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed relative slowdown or memory growth before a result counts as regressed")
+    args = parser.parse_args()
+    # load_app changes into a scratch directory
+    args.output = args.output and os.path.abspath(args.output)
+    args.baseline = args.baseline and os.path.abspath(args.baseline)
+
+    results = asyncio.run(main(args))
+    if args.output:
+        with open(args.output, "w") as f:
+            f.writelines(json.dumps(result) + "\n" for result in results)
+    if args.baseline and compare(results, args.baseline, args.tolerance):
+        raise SystemExit(1)
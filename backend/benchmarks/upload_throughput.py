@@ -0,0 +1,87 @@
+"""Measure /upload write throughput and event-loop stalls under concurrent large uploads.
+
+Run from the backend directory:
+
+    python -m benchmarks.upload_throughput --size-mb 50 --concurrency 1 4 8
+
+The app runs under uvicorn on its own event loop in a background thread, and each
+level sends that many uploads of random content at once over HTTP. While they run,
+a ticker task on the server loop measures how late the loop wakes it up, i.e. how
+long request handling blocks it. The run ends with one upload over MAX_UPLOAD_BYTES,
+which must be refused with 413.
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+import httpx
+
+from benchmarks.common import load_app, percentile, serve_in_thread
+
+TICK = 0.005
+
+
+async def _measure_loop_lag(lags: list, stop: asyncio.Event):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lags.append(time.perf_counter() - started - TICK)
+
+
+async def _run_level(client, server_loop, concurrency: int, size: int):
+    # Random bytes under a .pdf name: unique content (no deduplication) that fails parsing quickly
+    payloads = [os.urandom(size) for _ in range(concurrency)]
+    latencies, lags = [], []
+    stop = asyncio.Event()  # Only touched from the server loop
+    ticker = asyncio.run_coroutine_threadsafe(_measure_loop_lag(lags, stop), server_loop)
+
+    async def upload(i):
+        started = time.perf_counter()
+        response = await client.post("/upload", files={"file": (f"upload-{i}.pdf", payloads[i], "application/pdf")})
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(upload(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    server_loop.call_soon_threadsafe(stop.set)
+    await asyncio.wrap_future(ticker)
+    return {
+        "concurrency": concurrency,
+        "mb_per_s": round(concurrency * size / (1024 * 1024) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "loop_lag_p99_ms": round(percentile(lags, 99) * 1000, 1),
+        "loop_lag_max_ms": round(max(lags, default=0.0) * 1000, 1),
+    }
+
+
+async def main(args):
+    api = load_app()
+    size = args.size_mb * 1024 * 1024
+    server, thread, server_loop, base_url = serve_in_thread(api.app)
+    async with httpx.AsyncClient(base_url=base_url, timeout=None) as client:
+        for concurrency in args.concurrency:
+            result = await _run_level(client, server_loop, concurrency, size)
+            print(json.dumps({"size_mb": args.size_mb, **result}))
+
+        oversized = api.MAX_UPLOAD_BYTES + 1
+        response = await client.post(
+            "/upload", files={"file": ("too-large.pdf", b"\0" * oversized, "application/pdf")}
+        )
+        print(json.dumps({"oversized_bytes": oversized, "status": response.status_code}))
+
+    # Let the (failing) ingestion jobs finish before the server loop goes away
+    while api.ingestion.pending():
+        await asyncio.sleep(0.1)
+    server.should_exit = True
+    thread.join()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size-mb", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8])
+    asyncio.run(main(parser.parse_args()))
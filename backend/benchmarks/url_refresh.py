@@ -0,0 +1,62 @@
+"""Measure what a URL refresh re-embeds, against a local stand-in web server.
+
+Run from the backend directory:
+
+    python -m benchmarks.url_refresh --paragraphs 200 --changed 5
+
+The stand-in server answers conditional requests with 304 when the page's ETag
+matches. The script adds a page, refreshes it unchanged, then edits a few
+paragraphs and refreshes again, reporting embedded texts for each step.
+"""
+import argparse
+import asyncio
+import json
+
+import httpx
+
+from benchmarks.common import load_app, wait_until_processed
+from benchmarks.fakes import FakePage, serve_page
+
+
+async def main(args):
+    api = load_app()
+    page = FakePage(args.paragraphs)
+    server = serve_page(page)
+    url = f"http://127.0.0.1:{server.server_port}/page.html"
+    fake = api.embeddings.embeddings
+
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        async def step(name, request):
+            embedded_before = fake.texts_embedded
+            response = await request()
+            response.raise_for_status()
+            url_id = response.json()["id"]
+            status = await wait_until_processed(client, url_id)
+            metadata = api.document_catalog.get(url_id)
+            print(json.dumps({
+                "step": name,
+                "chunks": metadata.get("chunks"),
+                "texts_embedded": fake.texts_embedded - embedded_before,
+                "last_refresh": metadata.get("last_refresh"),
+                "duration": status.get("total_duration"),
+            }))
+            return url_id
+
+        url_id = await step("add", lambda: client.post("/add_url", json={"url": url}))
+        await step("refresh_unchanged", lambda: client.post(f"/refresh_url/{url_id}"))
+
+        for i in range(args.changed):
+            index = i * len(page.paragraphs) // max(1, args.changed)
+            page.paragraphs[index] = f"Section {index} was rewritten. " * 20
+        await step("refresh_changed", lambda: client.post(f"/refresh_url/{url_id}"))
+
+        print(json.dumps({"server_requests": page.requests, "not_modified": page.not_modified}))
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--paragraphs", type=int, default=200)
+    parser.add_argument("--changed", type=int, default=5)
+    asyncio.run(main(parser.parse_args()))
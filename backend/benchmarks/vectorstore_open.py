@@ -0,0 +1,78 @@
+"""Compare cold-open latency and memory of pickled and memory-mapped vector stores.
+
+Run from the backend directory:
+
+    python -m benchmarks.vectorstore_open --chunks 1000 10000 100000
+
+Each open runs in a fresh process, so the numbers include everything a cold
+/create_session pays for: reading the index, the docstore and the first search.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.common import BACKEND_DIR
+
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+
+def _build(directory: str, chunks: int, dimension: int):
+    from langchain_community.vectorstores import FAISS
+    from benchmarks.fakes import FakeEmbeddings
+    from utils.vectorstore_storage import save_vectorstore
+
+    embeddings = FakeEmbeddings(size=dimension)
+    texts = [f"Chunk {i}: " + "lorem ipsum dolor sit amet " * 35 for i in range(chunks)]
+    vectorstore = FAISS.from_embeddings(
+        list(zip(texts, embeddings.embed_documents(texts))), embeddings, metadatas=[{"page": i} for i in range(chunks)]
+    )
+    vectorstore.save_local(os.path.join(directory, "pickle"))
+    save_vectorstore(vectorstore, os.path.join(directory, "mmap"))
+
+
+def _open(path: str, dimension: int) -> dict:
+    import psutil
+    from benchmarks.fakes import FakeEmbeddings
+    from utils.vectorstore_storage import load_vectorstore
+
+    def heap_bytes():
+        # Resident memory minus file-backed pages, which live in the shared page cache
+        info = psutil.Process().memory_info()
+        return info.rss - info.shared
+
+    embeddings = FakeEmbeddings(size=dimension)
+    before = heap_bytes()
+    started = time.perf_counter()
+    vectorstore = load_vectorstore(path, embeddings)
+    opened = time.perf_counter() - started
+    vectorstore.similarity_search("Chunk 7", k=4)
+    first_search = time.perf_counter() - started - opened
+    return {
+        "open_ms": round(opened * 1000, 1),
+        "first_search_ms": round(first_search * 1000, 1),
+        "heap_mb": round((heap_bytes() - before) / (1024 * 1024), 1),
+    }
+
+
+def main(args):
+    context = multiprocessing.get_context("spawn")
+    for chunks in args.chunks:
+        with tempfile.TemporaryDirectory(prefix="senseai-bench-") as directory:
+            with context.Pool(1) as pool:
+                pool.apply(_build, (directory, chunks, args.dimension))
+            for storage in ("pickle", "mmap"):
+                with context.Pool(1) as pool:
+                    result = pool.apply(_open, (os.path.join(directory, storage), args.dimension))
+                print(json.dumps({"chunks": chunks, "storage": storage, **result}))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chunks", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--dimension", type=int, default=1536)
+    main(parser.parse_args())
@@ -10,3 +10,104 @@ URL_DIR = "urls"
 SESSION_DATA_DIR = "session_data"
 SESSION_METADATA_FILE = os.path.join(SESSION_DATA_DIR, "session_metadata.json")
 CHAT_SESSIONS_FILE = os.path.join(SESSION_DATA_DIR, "chat_sessions.json")
+
+# Upper bounds on the approximate size and number of FAISS indexes kept loaded (each holds open files)
+VECTORSTORE_CACHE_MAX_BYTES = int(os.getenv("VECTORSTORE_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+VECTORSTORE_CACHE_MAX_ENTRIES = int(os.getenv("VECTORSTORE_CACHE_MAX_ENTRIES", 256))
+
+# Threads used to run blocking work (index loads) off the event loop
+CHAT_EXECUTOR_WORKERS = int(os.getenv("CHAT_EXECUTOR_WORKERS", 8))
+
+# Content-addressed cache of chunk embeddings, shared across documents and URLs
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+EMBEDDING_CACHE_DIR = "embedding_cache"
+EMBEDDING_CACHE_FILE = os.path.join(EMBEDDING_CACHE_DIR, "embeddings.sqlite3")
+EMBEDDING_CACHE_MEMORY_ITEMS = int(os.getenv("EMBEDDING_CACHE_MEMORY_ITEMS", 20000))
+
+# FAISS index type: "auto" picks flat, HNSW or a quantized index ("sq8" or "ivfpq") from the chunk count
+INDEX_TYPE = os.getenv("INDEX_TYPE", "auto")
+INDEX_HNSW_MIN_CHUNKS = int(os.getenv("INDEX_HNSW_MIN_CHUNKS", 20000))
+INDEX_QUANTIZED_MIN_CHUNKS = int(os.getenv("INDEX_QUANTIZED_MIN_CHUNKS", 200000))
+INDEX_QUANTIZED_TYPE = os.getenv("INDEX_QUANTIZED_TYPE", "sq8")
+
+# Retrieval: "hybrid" fuses BM25 and vector search (stores without a BM25 index use "vector")
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+# Answer queries made mostly of rare tokens (IDs, clause numbers, names) from BM25 alone, in stores of at
+# least LEXICAL_FAST_PATH_MIN_CHUNKS chunks
+LEXICAL_FAST_PATH = os.getenv("LEXICAL_FAST_PATH", "true").lower() == "true"
+LEXICAL_RARE_TOKEN_FRACTION = float(os.getenv("LEXICAL_RARE_TOKEN_FRACTION", 0.01))
+LEXICAL_FAST_PATH_MIN_CHUNKS = int(os.getenv("LEXICAL_FAST_PATH_MIN_CHUNKS", 200))
+
+# Print a structured (JSON) timing record for every answered chat message
+METRICS_LOG_TIMINGS = os.getenv("METRICS_LOG_TIMINGS", "false").lower() == "true"
+
+# Chat admission control (per server worker): answers run at once (0 = no limit), requests waiting for a
+# slot in total and per device, and how long (seconds) a request may wait before it is dropped
+CHAT_MAX_CONCURRENT = int(os.getenv("CHAT_MAX_CONCURRENT", 32))
+CHAT_MAX_QUEUE = int(os.getenv("CHAT_MAX_QUEUE", 128))
+CHAT_MAX_QUEUE_PER_DEVICE = int(os.getenv("CHAT_MAX_QUEUE_PER_DEVICE", 8))
+CHAT_QUEUE_TIMEOUT = float(os.getenv("CHAT_QUEUE_TIMEOUT", 30))
+
+# Conversation memory: "buffer" keeps the whole history, "window" the most recent messages within
+# CHAT_MEMORY_MAX_TOKENS, "summary" also folds older messages into a rolling summary (an extra LLM call
+# whenever the history outgrows the budget)
+CHAT_MEMORY_MODE = os.getenv("CHAT_MEMORY_MODE", "buffer")
+CHAT_MEMORY_MAX_TOKENS = int(os.getenv("CHAT_MEMORY_MAX_TOKENS", 1000))
+
+# Chat query embeddings: in-memory LRU size, and how long (seconds) concurrent queries wait to share one batch
+QUERY_EMBEDDING_CACHE_ITEMS = int(os.getenv("QUERY_EMBEDDING_CACHE_ITEMS", 10000))
+QUERY_EMBEDDING_BATCH_WINDOW = float(os.getenv("QUERY_EMBEDDING_BATCH_WINDOW", 0.005))
+QUERY_EMBEDDING_MAX_BATCH = int(os.getenv("QUERY_EMBEDDING_MAX_BATCH", 64))
+
+# Reference-counted mapping of uploaded content hashes to shared vector stores
+VECTORSTORE_REGISTRY_FILE = os.path.join(SESSION_DATA_DIR, "vectorstore_registry.sqlite3")
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", 1024 * 1024))
+# Largest accepted file (also per archive member), and largest /upload_bulk request body, in bytes
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", 100 * 1024 * 1024))
+MAX_BULK_UPLOAD_BYTES = int(os.getenv("MAX_BULK_UPLOAD_BYTES", 1024 * 1024 * 1024))
+# Most files (including archive members) accepted by one /upload_bulk request
+BULK_UPLOAD_MAX_FILES = int(os.getenv("BULK_UPLOAD_MAX_FILES", 200))
+
+# Ingestion worker pool: parallel parsing processes and maximum queued/running jobs (per server worker)
+INGESTION_WORKERS = int(os.getenv("INGESTION_WORKERS", 2))
+INGESTION_MAX_QUEUE = int(os.getenv("INGESTION_MAX_QUEUE", 100))
+# Ingestion job status shared by all server workers, so any of them can answer status requests
+JOB_STATUS_FILE = os.path.join(SESSION_DATA_DIR, "ingestion_jobs.sqlite3")
+
+# Files at least this large are parsed lazily and embedded/indexed in fixed-size batches
+INGESTION_STREAMING_MIN_BYTES = int(os.getenv("INGESTION_STREAMING_MIN_BYTES", 20 * 1024 * 1024))
+INGESTION_EMBED_BATCH_SIZE = int(os.getenv("INGESTION_EMBED_BATCH_SIZE", 256))
+
+# SQLite store of session metadata and chat history (replaces the two JSON files above)
+SESSION_STORE_FILE = os.path.join(SESSION_DATA_DIR, "sessions.sqlite3")
+
+# Index of document/URL metadata used to answer /documents
+DOCUMENT_CATALOG_FILE = os.path.join(SESSION_DATA_DIR, "document_catalog.sqlite3")
+
+# Answer cache for history-free first questions; a similarity threshold of 0 means exact matches only
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", 5000))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", 24 * 3600))
+ANSWER_CACHE_SIMILARITY_THRESHOLD = float(os.getenv("ANSWER_CACHE_SIMILARITY_THRESHOLD", 0))
+
+# Web page fetching; URLs are re-fetched every URL_REFRESH_INTERVAL seconds (0 disables scheduled refreshes)
+URL_FETCH_TIMEOUT = float(os.getenv("URL_FETCH_TIMEOUT", 30))
+URL_FETCH_USER_AGENT = os.getenv("URL_FETCH_USER_AGENT", "SenseAI/1.0 (+document chat)")
+URL_REFRESH_INTERVAL = int(os.getenv("URL_REFRESH_INTERVAL", 0))
+
+# Site crawls: concurrent requests overall and per host, and upper bounds for what a request may ask for
+CRAWL_CONCURRENCY = int(os.getenv("CRAWL_CONCURRENCY", 16))
+CRAWL_PER_HOST_CONCURRENCY = int(os.getenv("CRAWL_PER_HOST_CONCURRENCY", 8))
+CRAWL_MAX_PAGES = int(os.getenv("CRAWL_MAX_PAGES", 1000))
+CRAWL_MAX_DEPTH = int(os.getenv("CRAWL_MAX_DEPTH", 5))
+
+# Background reaper, run every REAPER_INTERVAL seconds (0 disables it)
+REAPER_INTERVAL = int(os.getenv("REAPER_INTERVAL", 300))
+# Conversation memory unused for this long is dropped from the worker; history stays in the session store
+SESSION_IDLE_TIMEOUT = int(os.getenv("SESSION_IDLE_TIMEOUT", 900))
+# Chat history of ended sessions is deleted this many seconds after they ended (negative keeps it)
+SESSION_HISTORY_RETENTION = int(os.getenv("SESSION_HISTORY_RETENTION", 24 * 3600))
+# Documents and URLs whose processing failed are deleted this many seconds later (negative keeps them)
+FAILED_DOCUMENT_RETENTION = int(os.getenv("FAILED_DOCUMENT_RETENTION", 7 * 24 * 3600))
+# Unreferenced or half-written directories and files are only removed once untouched for this long
+ORPHAN_GRACE_PERIOD = int(os.getenv("ORPHAN_GRACE_PERIOD", 3600))
@@ -7,6 +7,8 @@ class ChatRequest(BaseModel):
     session_ids: str
     history: List[dict] = []
     device_id: Optional[str] = None
+    # Additional documents/URLs to search together with the session's own document
+    document_ids: List[str] = []
 
 
 class UrlRequest(BaseModel):
@@ -14,6 +16,17 @@ class UrlRequest(BaseModel):
     device_id: Optional[str] = None
 
 
+class SiteRequest(BaseModel):
+    # Crawl from a root URL, a sitemap, or both
+    url: Optional[str] = None
+    sitemap_url: Optional[str] = None
+    max_depth: int = 2
+    max_pages: int = 100
+    # Hosts (and their subdomains) the crawl may visit; defaults to the hosts of url/sitemap_url
+    allowed_domains: List[str] = []
+    device_id: Optional[str] = None
+
+
 class SessionRequest(BaseModel):
     device_id: Optional[str] = None
 
@@ -27,3 +40,11 @@ class DocInfo(BaseModel):
     source: str
     sourceUrl: Optional[str] = None
     device_id: Optional[str] = None
+    chunks: Optional[int] = None
+    cached_chunks: Optional[int] = None
+    index_type: Optional[str] = None
+    pages: Optional[int] = None
+    refreshed_at: Optional[str] = None
+    last_refresh: Optional[dict] = None
+    status: Optional[str] = None
+    error: Optional[str] = None
@@ -1,22 +1,75 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, BackgroundTasks, Form, Query
+from fastapi import FastAPI, UploadFile, File, HTTPException, Form, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import PlainTextResponse, StreamingResponse
 import os
 import uuid
 import shutil
 import datetime
+import asyncio
+import time
+import tarfile
+import zipfile
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass, field
 from langchain_openai import OpenAIEmbeddings, ChatOpenAI
-from langchain.vectorstores import FAISS
 from langchain.chains import ConversationalRetrievalChain
-from langchain.memory import ConversationBufferMemory
+from langchain.memory.chat_memory import BaseChatMemory
 import json
 from urllib.parse import urlparse
-from models.models import ChatRequest, UrlRequest, SessionRequest
-from config.settings import OPENAI_API_KEY, UPLOAD_DIR, VECTORSTORE_DIR, URL_DIR, SESSION_DATA_DIR
-from utils.document_processing import process_document, process_url, save_session_data, load_session_data
-from typing import Optional
+from models.models import ChatRequest, UrlRequest, SessionRequest, SiteRequest
+from config.settings import (
+    OPENAI_API_KEY, UPLOAD_DIR, VECTORSTORE_DIR, URL_DIR, SESSION_DATA_DIR, VECTORSTORE_CACHE_MAX_BYTES,
+    VECTORSTORE_CACHE_MAX_ENTRIES,
+    CHAT_EXECUTOR_WORKERS, EMBEDDING_MODEL, EMBEDDING_CACHE_FILE, EMBEDDING_CACHE_MEMORY_ITEMS,
+    QUERY_EMBEDDING_CACHE_ITEMS, QUERY_EMBEDDING_BATCH_WINDOW, QUERY_EMBEDDING_MAX_BATCH,
+    VECTORSTORE_REGISTRY_FILE, UPLOAD_CHUNK_SIZE, INGESTION_WORKERS, INGESTION_MAX_QUEUE, JOB_STATUS_FILE,
+    SESSION_STORE_FILE, SESSION_METADATA_FILE, CHAT_SESSIONS_FILE, DOCUMENT_CATALOG_FILE,
+    RETRIEVAL_MODE, LEXICAL_FAST_PATH, LEXICAL_RARE_TOKEN_FRACTION, LEXICAL_FAST_PATH_MIN_CHUNKS,
+    URL_REFRESH_INTERVAL, CRAWL_MAX_PAGES, CRAWL_MAX_DEPTH, BULK_UPLOAD_MAX_FILES,
+    MAX_UPLOAD_BYTES, MAX_BULK_UPLOAD_BYTES, CHAT_MEMORY_MODE, CHAT_MEMORY_MAX_TOKENS, METRICS_LOG_TIMINGS,
+    ANSWER_CACHE_ENABLED, ANSWER_CACHE_MAX_ENTRIES, ANSWER_CACHE_TTL, ANSWER_CACHE_SIMILARITY_THRESHOLD,
+    CHAT_MAX_CONCURRENT, CHAT_MAX_QUEUE, CHAT_MAX_QUEUE_PER_DEVICE, CHAT_QUEUE_TIMEOUT,
+    REAPER_INTERVAL, SESSION_IDLE_TIMEOUT, SESSION_HISTORY_RETENTION, FAILED_DOCUMENT_RETENTION, ORPHAN_GRACE_PERIOD
+)
+from utils.document_processing import (
+    SUPPORTED_EXTENSIONS, process_document, process_documents, process_url, process_site, refresh_url
+)
+from utils.vectorstore_cache import VectorStoreCache
+from utils.vectorstore_storage import load_vectorstore, vectorstore_version
+from utils.embedding_cache import CachedEmbeddings
+from utils.vectorstore_registry import VectorstoreRegistry
+from utils.ingestion import IngestionManager, IngestionQueueFull
+from utils.job_store import JobStore
+from utils.session_store import SessionStore
+from utils.document_catalog import DocumentCatalog
+from utils.retrieval import HybridRetriever, MultiIndexRetriever, retrieval_counts
+from utils.answer_cache import AnswerCache
+from utils.chat_memory import (
+    TokenUsage, build_memory, counting_tokens, has_history, restore_memory, token_usage
+)
+from utils.uploads import RequestSizeLimit, UploadTooLarge, save_upload
+from utils.admission import AdmissionController, AdmissionRejected
+from utils.reaper import (
+    find_incomplete_sources, find_orphan_vectorstores, find_temp_files, idle_for, remove_paths, tree_bytes
+)
+from utils.metrics import RequestMetrics, StageTimer, chat_stage_seconds, registry as metrics_registry
+from typing import List, Optional, Tuple
 
 app = FastAPI()
 
+# Multipart framing and form fields around the file itself
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+# Refuse oversized uploads from their Content-Length, before the body is read.
+# Added before CORS so CORS stays the outermost layer and 413s still carry its headers.
+app.add_middleware(RequestSizeLimit, limits={
+    "/upload": MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES,
+    "/upload_bulk": MAX_BULK_UPLOAD_BYTES,
+})
+
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
@@ -24,21 +77,368 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
+# Outermost, so request latency includes all other middleware
+app.add_middleware(RequestMetrics)
+
 # Create directories
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 os.makedirs(VECTORSTORE_DIR, exist_ok=True)
 os.makedirs(URL_DIR, exist_ok=True)
 os.makedirs(SESSION_DATA_DIR, exist_ok=True)
 
-# Store chat sessions and their metadata
-session_metadata, persisted_sessions = load_session_data()
+# Session metadata and chat history are persisted in session_store, which all server
+# workers share; chat_sessions only holds this worker's in-memory conversation memory of
+# active sessions, and the loaded indexes live in vectorstore_cache
+session_store = SessionStore(SESSION_STORE_FILE)
+session_store.import_json_files(SESSION_METADATA_FILE, CHAT_SESSIONS_FILE)
 chat_sessions = {}
+# Id of the last stored message each entry of chat_sessions contains, and when it was last used
+chat_session_positions = {}
+chat_session_last_used = {}
+
+# Loaded FAISS indexes shared by all sessions on the same document; rebuilt ones (e.g. by another
+# worker) are reloaded and the answers given from the old index dropped
+vectorstore_cache = VectorStoreCache(VECTORSTORE_CACHE_MAX_BYTES, version=vectorstore_version,
+                                     max_entries=VECTORSTORE_CACHE_MAX_ENTRIES,
+                                     on_stale=lambda path: answer_cache.invalidate(path))
+
+# Indexed document listing; /documents never has to open the per-document directories
+document_catalog = DocumentCatalog(DOCUMENT_CATALOG_FILE)
+
+# Answers to first-turn questions, reused for repeated questions on the same documents
+answer_cache = AnswerCache(ANSWER_CACHE_MAX_ENTRIES, ANSWER_CACHE_TTL, ANSWER_CACHE_SIMILARITY_THRESHOLD)
+
+# Uploads with identical content share one processed vector store
+vectorstore_registry = VectorstoreRegistry(VECTORSTORE_REGISTRY_FILE)
+
+# Parsing/embedding/indexing jobs for uploads and URLs, kept off the request path
+ingestion = IngestionManager(INGESTION_WORKERS, INGESTION_MAX_QUEUE, store=JobStore(JOB_STATUS_FILE))
+
+# Bounded pool for blocking calls made from async handlers, so they never stall the event loop
+blocking_executor = ThreadPoolExecutor(max_workers=CHAT_EXECUTOR_WORKERS, thread_name_prefix="chat-blocking")
+
+# Initialize OpenAI embeddings (behind the shared embedding cache) and model
+embeddings = CachedEmbeddings(
+    OpenAIEmbeddings(model=EMBEDDING_MODEL),
+    EMBEDDING_MODEL,
+    EMBEDDING_CACHE_FILE,
+    max_memory_items=EMBEDDING_CACHE_MEMORY_ITEMS,
+    max_query_items=QUERY_EMBEDDING_CACHE_ITEMS,
+    query_batch_window=QUERY_EMBEDDING_BATCH_WINDOW,
+    query_max_batch=QUERY_EMBEDDING_MAX_BATCH
+)
+# stream_usage: streamed answers report their token counts too, so TokenUsage doesn't have to tokenize them
+llm = ChatOpenAI(temperature=0, model="gpt-3.5-turbo", api_key=OPENAI_API_KEY, stream_usage=True)
+
+# Tag attached to the LLM call that generates the final answer
+ANSWER_TAG = "answer"
+
+# Retrieval chains currently answering a message (chains are built per request)
+chains_in_use = 0
+
+# Caps concurrent chain runs (LLM round trips) and queues the rest fairly per device
+admission = AdmissionController(CHAT_MAX_CONCURRENT, CHAT_MAX_QUEUE, CHAT_MAX_QUEUE_PER_DEVICE)
+
+# Gauges and counters are read from the objects above when /metrics is scraped
+metrics_registry.gauge("senseai_sessions_loaded", "Sessions whose conversation memory is held in memory.",
+                       lambda: len(chat_sessions))
+metrics_registry.gauge("senseai_sessions", "Sessions in the session store.", lambda: session_store.count_sessions())
+metrics_registry.gauge("senseai_chat_chains_active", "Retrieval chains currently answering a message.",
+                       lambda: chains_in_use)
+metrics_registry.gauge("senseai_vectorstores_loaded", "Vector stores held in the shared cache.",
+                       lambda: vectorstore_cache.stats()["entries"])
+metrics_registry.gauge("senseai_vectorstore_cache_bytes", "Estimated size of the loaded vector stores.",
+                       lambda: vectorstore_cache.stats()["bytes"])
+metrics_registry.gauge("senseai_ingestion_jobs_pending", "Queued or running ingestion jobs.",
+                       lambda: ingestion.pending())
+metrics_registry.counter("senseai_cache_hits_total", "Cache hits by cache.", lambda: _cache_counts("hits"),
+                         label="cache")
+metrics_registry.counter("senseai_cache_misses_total", "Cache misses by cache.", lambda: _cache_counts("misses"),
+                         label="cache")
+metrics_registry.counter("senseai_llm_tokens_total", "LLM tokens used to answer chat messages.",
+                         lambda: {"prompt": token_usage["prompt_tokens"], "completion": token_usage["completion_tokens"]},
+                         label="kind")
+metrics_registry.counter("senseai_retrieval_queries_total", "Hybrid retriever queries by path taken.",
+                         lambda: dict(retrieval_counts), label="path")
+metrics_registry.gauge("senseai_chat_admission_active", "Chat answers holding an admission slot.",
+                       lambda: admission.active)
+metrics_registry.gauge("senseai_chat_admission_queued", "Chat requests waiting for an admission slot.",
+                       lambda: admission.queued)
+metrics_registry.counter("senseai_chat_admission_total", "Chat admission decisions by outcome.",
+                         lambda: dict(admission.counts), label="outcome")
+metrics_registry.counter("senseai_reaper_reclaimed_total", "What the reaper freed: sessions, messages, files, bytes.",
+                         lambda: dict(reaper_totals), label="kind")
+
+
+def _cache_counts(kind: str) -> dict:
+    vectorstores, embedded, answers = vectorstore_cache.stats(), embeddings.stats(), answer_cache.stats()
+    if kind == "hits":
+        return {
+            "vectorstore": vectorstores["hits"],
+            "embedding": embedded["memory_hits"] + embedded["disk_hits"],
+            "query_embedding": embedded["query_hits"],
+            "answer": answers["exact_hits"] + answers["similar_hits"],
+        }
+    return {
+        "vectorstore": vectorstores["misses"],
+        "embedding": embedded["misses"],
+        "query_embedding": embedded["query_misses"],
+        "answer": answers["misses"],
+    }
+
+
+@contextmanager
+def _chain_in_use():
+    global chains_in_use
+    chains_in_use += 1
+    try:
+        yield
+    finally:
+        chains_in_use -= 1
+
+
+def _get_vectorstore_path(session_id: str) -> str:
+    """Return the processed vector store path for a document or URL, or raise a 404."""
+    doc_dir = os.path.join(UPLOAD_DIR, session_id)
+    url_dir = os.path.join(URL_DIR, session_id)
+    is_document = os.path.exists(doc_dir)
+    is_url = os.path.exists(url_dir)
+
+    if not (is_document or is_url):
+        raise HTTPException(status_code=404, detail="Document or URL not found")
+
+    vectorstore_path = _vectorstore_path_for(session_id, is_document)
+
+    if not os.path.exists(vectorstore_path):
+        _raise_not_processed(session_id, is_document)
+
+    return vectorstore_path
+
+
+def _raise_not_processed(doc_id: str, is_document: bool):
+    status = _get_processing_status(doc_id, is_document)
+    if status["status"] == "failed":
+        raise HTTPException(status_code=422, detail=f"Processing failed: {status.get('error')}")
+    raise HTTPException(status_code=404, detail="Content not processed yet")
+
+
+def _get_processing_status(doc_id: str, is_document: bool) -> dict:
+    """Report where a document or URL is in the ingestion pipeline."""
+    # Deduplicated uploads report the status of the job that builds their shared index
+    job_id = vectorstore_registry.vectorstore_id(doc_id) if is_document else doc_id
+    status = ingestion.status(job_id)
+    if status:
+        status["id"] = doc_id
+        return status
+
+    # The job is gone (e.g. after a restart), fall back to what was persisted
+    metadata_path = os.path.join(UPLOAD_DIR if is_document else URL_DIR, doc_id, "metadata.json")
+    metadata = {}
+    if os.path.exists(metadata_path):
+        with open(metadata_path, "r") as f:
+            metadata = json.load(f)
+    if os.path.exists(_vectorstore_path_for(doc_id, is_document)):
+        status = "done"
+    elif metadata.get("status") == "failed":
+        status = "failed"
+    else:
+        status = "unknown"
+    return {
+        "id": doc_id,
+        "status": status,
+        "error": metadata.get("error"),
+        "progress": 1.0 if status == "done" else 0.0,
+        "stages": {}
+    }
+
+
+def _ingestion_unavailable(e: IngestionQueueFull) -> HTTPException:
+    return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+
+
+def _upload_too_large(e: UploadTooLarge) -> HTTPException:
+    return HTTPException(status_code=413, detail=str(e))
+
+
+def _vectorstore_path_for(doc_id: str, is_document: bool) -> str:
+    # Deduplicated uploads read from the vector store of the first upload with the same content
+    if is_document:
+        return os.path.join(VECTORSTORE_DIR, vectorstore_registry.vectorstore_id(doc_id))
+    return os.path.join(VECTORSTORE_DIR, f"url_{doc_id}")
+
+
+def _load_vectorstore(vectorstore_path: str):
+    """Get a loaded vector store from the shared cache, loading it from disk on a miss."""
+    return vectorstore_cache.get(vectorstore_path, _read_vectorstore)
+
+
+def _read_vectorstore(vectorstore_path: str):
+    return load_vectorstore(vectorstore_path, embeddings)
+
+
+async def _aload_vectorstore(vectorstore_path: str):
+    """Like _load_vectorstore, but runs a cold load on the blocking executor."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(blocking_executor, _load_vectorstore, vectorstore_path)
+
+
+async def _aget_memory(session_id: str) -> BaseChatMemory:
+    """Get the conversation memory for a session, restoring persisted history on first use.
+
+    A memory already held here catches up on exchanges other workers answered since.
+    """
+    chat_session_last_used[session_id] = time.monotonic()
+    memory = chat_sessions.get(session_id)
+    if memory is None:
+        history = session_store.get_history(session_id)
+        memory = build_memory(CHAT_MEMORY_MODE, llm, CHAT_MEMORY_MAX_TOKENS)
+        # Restore chat history from the session store in one go, already within the token budget
+        await restore_memory(memory, history)
+        # Another request may have restored it while this one was summarising
+        if chat_sessions.setdefault(session_id, memory) is memory:
+            chat_session_positions[session_id] = history[-1]["id"] if history else 0
+        return chat_sessions[session_id]
+
+    newer = session_store.get_history(session_id, after_id=chat_session_positions.get(session_id, 0))
+    if newer:
+        # Moved on before restoring, so a concurrent request doesn't add the same messages again
+        chat_session_positions[session_id] = newer[-1]["id"]
+        await restore_memory(memory, newer)
+    return memory
+
+
+def _build_retriever(vectorstore):
+    """Hybrid BM25 + vector retriever for stores that have a BM25 index, vector search otherwise."""
+    if RETRIEVAL_MODE == "hybrid" and getattr(vectorstore.docstore, "has_lexical_index", False):
+        return HybridRetriever(
+            vectorstore=vectorstore,
+            lexical_fast_path=LEXICAL_FAST_PATH,
+            rare_token_fraction=LEXICAL_RARE_TOKEN_FRACTION,
+            min_chunks=LEXICAL_FAST_PATH_MIN_CHUNKS
+        )
+    return vectorstore.as_retriever()
+
+
+def _build_retrieval_chain(retriever, memory) -> ConversationalRetrievalChain:
+    # Chains are cheap to build; the expensive parts (index, memory) are reused.
+    # The answer LLM is tagged so streaming can tell its tokens from the condense-question call.
+    return ConversationalRetrievalChain.from_llm(
+        llm=llm.with_config(tags=[ANSWER_TAG]),
+        condense_question_llm=llm,
+        retriever=retriever,
+        memory=memory
+    )
+
+
+def _drop_document_state(doc_id: str, vectorstore_path: Optional[str]):
+    """Delete what is stored on disk and in the shared databases for a deleted document or URL.
+
+    vectorstore_path is None when the index is still shared with other documents. Only
+    touches files and SQLite, so it may run off the event loop; this worker's in-memory
+    state is dropped separately by _forget_documents.
+    """
+    if vectorstore_path and os.path.exists(vectorstore_path):
+        shutil.rmtree(vectorstore_path, ignore_errors=True)
+    session_store.delete_session(doc_id)
+    document_catalog.delete(doc_id)
+
+
+def _forget_documents(session_ids: List[str], vectorstore_paths: List[str]):
+    """Drop this worker's cached indexes, answers and conversation memory of deleted documents.
+
+    Runs on the event loop, which owns these per-worker structures.
+    """
+    for vectorstore_path in vectorstore_paths:
+        vectorstore_cache.invalidate(vectorstore_path)
+        answer_cache.invalidate(vectorstore_path)
+    for session_id in session_ids:
+        _forget_memory(session_id)
+
+
+def _forget_memory(session_id: str):
+    """Drop a session's conversation memory from this worker; returns it, or None if it wasn't loaded."""
+    chat_session_positions.pop(session_id, None)
+    chat_session_last_used.pop(session_id, None)
+    return chat_sessions.pop(session_id, None)
+
+
+def _delete_document_files(doc_id: str) -> Optional[str]:
+    """Delete an uploaded document's files and stored state; returns the removed vector store's path, if any."""
+    shutil.rmtree(os.path.join(UPLOAD_DIR, doc_id), ignore_errors=True)
+    # Shared vector stores are only removed with their last reference
+    orphaned_vectorstore_id = vectorstore_registry.release(doc_id)
+    vectorstore_path = os.path.join(VECTORSTORE_DIR, orphaned_vectorstore_id) if orphaned_vectorstore_id else None
+    _drop_document_state(doc_id, vectorstore_path)
+    return vectorstore_path
+
+
+def _delete_url_files(url_id: str) -> str:
+    """Delete a URL's files and stored state; returns the removed vector store's path."""
+    shutil.rmtree(os.path.join(URL_DIR, url_id), ignore_errors=True)
+    vectorstore_path = os.path.join(VECTORSTORE_DIR, f"url_{url_id}")
+    _drop_document_state(url_id, vectorstore_path)
+    return vectorstore_path
+
+
+def _remove_document(doc_id: str):
+    """Delete an uploaded document's files and everything kept for it."""
+    vectorstore_path = _delete_document_files(doc_id)
+    _forget_documents([doc_id], [vectorstore_path] if vectorstore_path else [])
+
 
-# Initialize OpenAI embeddings and model
-embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
-llm = ChatOpenAI(temperature=0, model="gpt-3.5-turbo", api_key=OPENAI_API_KEY)
+def _remove_url(url_id: str):
+    """Delete a URL's files and everything kept for it."""
+    _forget_documents([url_id], [_delete_url_files(url_id)])
+
+
+@app.on_event("startup")
+def start_ingestion():
+    ingestion.warm_up()
+
+
+@app.on_event("startup")
+def backfill_document_catalog():
+    # Documents added before the catalog existed are indexed once from their metadata.json
+    if document_catalog.count() == 0:
+        docs = _scan_document_dirs()
+        if docs:
+            document_catalog.upsert_many(docs)
+            print(f"Indexed {len(docs)} existing documents into the catalog")
+
+
+url_refresher = None
+
+
+@app.on_event("startup")
+async def start_url_refresher():
+    global url_refresher
+    if URL_REFRESH_INTERVAL > 0:
+        url_refresher = asyncio.create_task(_refresh_urls_periodically())
+
+
+reaper = None
+# What the reaper freed in this worker since it started, and the report of its latest run
+reaper_totals = Counter()
+reaper_last_run = {}
+
+
+@app.on_event("startup")
+async def start_reaper():
+    global reaper
+    if REAPER_INTERVAL > 0:
+        reaper = asyncio.create_task(_reap_periodically())
+
+
+@app.on_event("shutdown")
+def shutdown_ingestion():
+    if url_refresher is not None:
+        url_refresher.cancel()
+    if reaper is not None:
+        reaper.cancel()
+    ingestion.shutdown()
 
 
 @app.get("/")
@@ -46,57 +446,442 @@ def read_root():
     return {"message": "Document Chat API is running"}
 
 
-@app.post("/upload")
-async def upload_file(
-        file: UploadFile = File(...),
-        device_id: Optional[str] = Form(None),
-        background_tasks: BackgroundTasks = None
-):
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Prometheus text-format metrics: stage latency histograms, session, cache and token counts."""
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.get("/cache/stats")
+def cache_stats():
+    return {
+        "vectorstores": vectorstore_cache.stats(),
+        "embeddings": embeddings.stats(),
+        "retrieval": dict(retrieval_counts),
+        "answers": answer_cache.stats(),
+        "tokens": dict(token_usage),
+        "ingestion_jobs_pending": ingestion.pending(),
+        "chat_admission": admission.stats(),
+        "sessions_in_memory": len(chat_sessions),
+        "sessions_total": session_store.count_sessions(),
+        "reaper": {"last_run": reaper_last_run, "totals": dict(reaper_totals)}
+    }
+
+
+async def _process_upload(doc_id: str, file_path: str, file_extension: str, job=None):
+    ok = await process_document(
+        doc_id, file_path, file_extension, embeddings, job=job, executor=ingestion.process_pool
+    )
+    if not ok:
+        # Don't let later uploads of the same bytes point at an index that was never built
+        vectorstore_registry.discard_hash(doc_id)
+    # A rebuilt index must not be answered from the old one's cache entries
+    vectorstore_path = os.path.join(VECTORSTORE_DIR, doc_id)
+    vectorstore_cache.invalidate(vectorstore_path)
+    answer_cache.invalidate(vectorstore_path)
+    _sync_catalog(os.path.join(UPLOAD_DIR, doc_id))
+    return ok
+
+
+async def _process_url(url_id: str, url: str, job=None, refresh: bool = False, crawl: dict = None):
+    if crawl is not None:
+        # Site re-crawls go through the embedding cache, so unchanged pages cost no embedding calls
+        ok = await process_site(url_id, crawl, embeddings, job=job)
+    elif refresh:
+        ok = await refresh_url(url_id, url, embeddings, job=job)
+    else:
+        ok = await process_url(url_id, url, embeddings, job=job)
+    vectorstore_path = os.path.join(VECTORSTORE_DIR, f"url_{url_id}")
+    vectorstore_cache.invalidate(vectorstore_path)
+    answer_cache.invalidate(vectorstore_path)
+    _sync_catalog(os.path.join(URL_DIR, url_id))
+    return ok
+
+
+def _submit_url_refresh(url_id: str) -> bool:
+    """Queue a refresh of a URL unless one is already running on any worker. Returns whether it was queued."""
+    with open(os.path.join(URL_DIR, url_id, "url.txt"), "r") as f:
+        url = f.read().strip()
+    with open(os.path.join(URL_DIR, url_id, "metadata.json"), "r") as f:
+        crawl = json.load(f).get("crawl")
+    # Fail before claiming, so a full queue doesn't leave a claim behind
+    ingestion.check_capacity()
+    if not ingestion.claim(url_id):
+        return False
+    ingestion.submit(url_id, _process_url, url_id, url, refresh=True, crawl=crawl)
+    return True
+
+
+async def _refresh_urls_periodically():
+    """Refresh every URL whose last fetch is older than URL_REFRESH_INTERVAL."""
+    while True:
+        await asyncio.sleep(URL_REFRESH_INTERVAL)
+        due_before = (datetime.datetime.now() - datetime.timedelta(seconds=URL_REFRESH_INTERVAL)).isoformat()
+        docs, _ = document_catalog.list()
+        for doc in docs:
+            if doc.get("source") != "url" or doc.get("status") != "ready":
+                continue
+            if (doc.get("refreshed_at") or doc["uploadedAt"]) > due_before:
+                continue
+            try:
+                _submit_url_refresh(doc["id"])
+            except IngestionQueueFull:
+                # Whatever didn't fit is picked up on the next round
+                break
+            except Exception as e:
+                print(f"Error scheduling refresh of {doc['id']}: {e}")
+
+
+async def _reap_periodically():
+    while True:
+        await asyncio.sleep(REAPER_INTERVAL)
+        try:
+            await _reap()
+        except Exception as e:
+            print(f"Error in reaper: {e}")
+
+
+async def _reap() -> dict:
+    """Free what ended sessions and orphaned artifacts hold in memory and on disk.
+
+    Every worker evicts its own memory; the disk sweep is idempotent, so workers running
+    it at the same time only repeat each other's work. Returns the run's report.
+    """
+    started = time.perf_counter()
+    stats = _evict_session_memory()
+    loop = asyncio.get_running_loop()
+    disk_stats, session_ids, vectorstore_paths = await loop.run_in_executor(blocking_executor, _reclaim_disk)
+    _forget_documents(session_ids, vectorstore_paths)
+    stats.update(disk_stats)
+    stats = +stats  # Drop zero counts
+
+    reaper_totals.update(stats)
+    reaper_last_run.clear()
+    reaper_last_run.update(at=datetime.datetime.now().isoformat(), duration=round(time.perf_counter() - started, 4),
+                           **stats)
+    if stats:
+        print(f"Reaper: {dict(stats)}")
+    return reaper_last_run
+
+
+def _evict_session_memory() -> Counter:
+    """Drop this worker's conversation memory of ended, deleted and idle sessions."""
+    stats = Counter()
+    idle_before = time.monotonic() - SESSION_IDLE_TIMEOUT
+    ended_before = datetime.datetime.now() - datetime.timedelta(seconds=3600)
+    for session_id in list(chat_sessions):
+        if chat_session_last_used.get(session_id, 0) > idle_before:
+            session = session_store.get_session(session_id)
+            if session and session["created_at"] > ended_before and session["message_count"] < 20:
+                continue
+        memory = _forget_memory(session_id)
+        if memory is None:
+            continue
+        messages = memory.chat_memory.messages
+        stats["sessions_evicted"] += 1
+        stats["messages_evicted"] += len(messages)
+        # Approximate: the message texts and the running summary are what a memory holds
+        stats["memory_bytes_freed"] += sum(len(str(message.content)) for message in messages) + \
+            len(getattr(memory, "moving_summary_buffer", ""))
+    return stats
+
+
+def _ingestion_busy(doc_id: str) -> bool:
+    status = ingestion.status(doc_id)
+    return status is not None and status["status"] not in ("done", "failed")
+
+
+def _reclaim_disk() -> Tuple[Counter, List[str], List[str]]:
+    """Delete expired chat history and orphaned files and directories. Runs on the blocking executor.
+
+    Returns the report and the session ids and vector store paths removed, whose
+    in-memory state the caller drops on the event loop.
+    """
+    stats = Counter()
+    session_ids, vectorstore_paths = [], []
+    now = datetime.datetime.now()
+
+    # Sessions end an hour after they start; their history is only kept for the retention period
+    if SESSION_HISTORY_RETENTION >= 0:
+        stats["history_messages_deleted"] = session_store.delete_history(
+            now - datetime.timedelta(seconds=3600 + SESSION_HISTORY_RETENTION)
+        )
+
+    # Sessions whose document or URL no longer exists
+    for session_id in session_store.session_ids(now - datetime.timedelta(seconds=ORPHAN_GRACE_PERIOD)):
+        if not (os.path.exists(os.path.join(UPLOAD_DIR, session_id)) or
+                os.path.exists(os.path.join(URL_DIR, session_id))):
+            session_store.delete_session(session_id)
+            document_catalog.delete(session_id)
+            session_ids.append(session_id)
+            stats["sessions_deleted"] += 1
+
+    # Uploads and URLs whose creation never finished, and ones that failed processing long enough ago
+    remove = [(path, _delete_document_files) for path in find_incomplete_sources(UPLOAD_DIR, ORPHAN_GRACE_PERIOD)]
+    remove += [(path, _delete_url_files) for path in find_incomplete_sources(URL_DIR, ORPHAN_GRACE_PERIOD)]
+    stats["incomplete_sources_removed"] = len(remove)
+    if FAILED_DOCUMENT_RETENTION >= 0:
+        docs, _ = document_catalog.list()
+        for doc in docs:
+            if doc.get("status") != "failed" or _ingestion_busy(doc["id"]):
+                continue
+            is_document = os.path.exists(os.path.join(UPLOAD_DIR, doc["id"]))
+            source_dir = os.path.join(UPLOAD_DIR if is_document else URL_DIR, doc["id"])
+            # A failed refresh leaves the earlier index in place; those stay
+            if os.path.exists(os.path.join(source_dir, "metadata.json")) and \
+                    vectorstore_version(_vectorstore_path_for(doc["id"], is_document)) is None and \
+                    idle_for(source_dir, FAILED_DOCUMENT_RETENTION):
+                remove.append((source_dir, _delete_document_files if is_document else _delete_url_files))
+                stats["failed_sources_removed"] += 1
+    for path, delete_source in remove:
+        stats["disk_bytes_freed"] += tree_bytes(path)
+        source_id = os.path.basename(path)
+        vectorstore_path = delete_source(source_id)
+        session_ids.append(source_id)
+        if vectorstore_path:
+            vectorstore_paths.append(vectorstore_path)
+
+    # Vector stores nothing reads from anymore, or whose build never completed
+    orphans = find_orphan_vectorstores(VECTORSTORE_DIR, UPLOAD_DIR, URL_DIR, vectorstore_registry.refs,
+                                       _ingestion_busy, ORPHAN_GRACE_PERIOD)
+    vectorstore_paths.extend(orphans)
+    stats["vectorstores_removed"] = len(orphans)
+    stats["disk_bytes_freed"] += remove_paths(orphans)
+
+    temp_files = find_temp_files(VECTORSTORE_DIR, ORPHAN_GRACE_PERIOD)
+    stats["temp_files_removed"] = len(temp_files)
+    stats["disk_bytes_freed"] += remove_paths(temp_files)
+
+    stats["session_store_bytes_freed"] = session_store.compact()
+    return stats, session_ids, vectorstore_paths
+
+
+async def _process_upload_batch(files: list, jobs=None):
+    results = await process_documents(files, embeddings, jobs=jobs, executor=ingestion.process_pool)
+    for doc_id, _, _ in files:
+        if not results.get(doc_id):
+            vectorstore_registry.discard_hash(doc_id)
+        vectorstore_path = os.path.join(VECTORSTORE_DIR, doc_id)
+        vectorstore_cache.invalidate(vectorstore_path)
+        answer_cache.invalidate(vectorstore_path)
+    _sync_catalog(*(os.path.join(UPLOAD_DIR, doc_id) for doc_id, _, _ in files))
+    return results
+
+
+def _sync_catalog(*doc_dirs: str):
+    """Copy documents' metadata.json into the catalog after processing updated them, in one write."""
+    docs = []
+    for doc_dir in doc_dirs:
+        metadata_path = os.path.join(doc_dir, "metadata.json")
+        if os.path.exists(metadata_path):
+            with open(metadata_path, "r") as f:
+                docs.append(json.load(f))
+    if docs:
+        document_catalog.upsert_many(docs)
+
+
+async def _store_upload(source, filename: str, created_at: datetime.datetime, device_id: Optional[str]):
+    """Write one uploaded file and its metadata.json and register its content hash.
+
+    Returns (metadata, file_path, is_duplicate); session and catalog rows are left to the caller.
+    Raises UploadTooLarge, leaving nothing behind, when the file exceeds MAX_UPLOAD_BYTES.
+    """
     doc_id = str(uuid.uuid4())
-    filename = file.filename
     file_extension = os.path.splitext(filename)[1].lower()
     doc_dir = os.path.join(UPLOAD_DIR, doc_id)
     os.makedirs(doc_dir, exist_ok=True)
     file_path = os.path.join(doc_dir, filename)
 
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-
-    file_size = os.path.getsize(file_path)
-
-    # Initialize session metadata at upload time
-    session_metadata[doc_id] = {
-        "created_at": datetime.datetime.now(),
-        "message_count": 0,
-        "device_id": device_id  # Store device_id in session metadata
-    }
+    try:
+        file_size, content_hash = await save_upload(source, file_path, UPLOAD_CHUNK_SIZE, MAX_UPLOAD_BYTES)
+    except BaseException:
+        shutil.rmtree(doc_dir, ignore_errors=True)
+        raise
 
-    if background_tasks:
-        background_tasks.add_task(process_document, doc_id, file_path, file_extension, embeddings)
-    else:
-        await process_document(doc_id, file_path, file_extension, embeddings)
+    vectorstore_id, is_duplicate = vectorstore_registry.acquire(content_hash, doc_id)
+    if is_duplicate:
+        # The shared vector store already holds this content, so the copy isn't needed
+        os.remove(file_path)
 
     metadata = {
         "id": doc_id,
         "name": filename,
         "type": file_extension[1:],
-        "uploadedAt": session_metadata[doc_id]["created_at"].isoformat(),
+        "uploadedAt": created_at.isoformat(),
         "size": file_size,
         "source": "file",
-        "device_id": device_id  # Include device_id in metadata
+        "device_id": device_id,  # Include device_id in metadata
+        "content_hash": content_hash
     }
+    if is_duplicate:
+        metadata["duplicate_of"] = vectorstore_id
 
     with open(os.path.join(doc_dir, "metadata.json"), "w") as f:
         json.dump(metadata, f)
+    return metadata, file_path, is_duplicate
+
+
+def _discard_stored_upload(doc_id: str):
+    """Undo _store_upload for an upload that could not be queued for processing."""
+    # The store this upload owned will never be built, so later uploads must not match it, even if
+    # another worker joined it as a duplicate meanwhile and keeps it referenced after this release
+    if vectorstore_registry.vectorstore_id(doc_id) == doc_id:
+        vectorstore_registry.discard_hash(doc_id)
+    vectorstore_registry.release(doc_id)
+    shutil.rmtree(os.path.join(UPLOAD_DIR, doc_id), ignore_errors=True)
+
+
+ARCHIVE_SUFFIXES = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
+
+
+def _iter_archive(upload: UploadFile):
+    """Yield (filename, stream) for each regular file in a zip or tar upload, without extracting to disk first."""
+    if upload.filename.lower().endswith(".zip"):
+        with zipfile.ZipFile(upload.file) as archive:
+            for member in archive.infolist():
+                if not member.is_dir():
+                    with archive.open(member) as stream:
+                        yield member.filename, stream
+    else:
+        with tarfile.open(fileobj=upload.file, mode="r:*") as archive:
+            for member in archive:
+                if member.isfile():
+                    yield member.name, archive.extractfile(member)
 
-    # Save session metadata
-    save_session_data(session_metadata, chat_sessions)
 
+async def _aiter_archive(upload: UploadFile):
+    """_iter_archive with every step in a worker thread.
+
+    Opening an archive and moving to the next member read and decompress data (all of a
+    skipped member, in compressed tars), so none of it runs on the event loop.
+    """
+    members = _iter_archive(upload)
+    try:
+        while (member := await asyncio.to_thread(next, members, None)) is not None:
+            yield member
+    finally:
+        await asyncio.to_thread(members.close)
+
+
+@app.post("/upload")
+async def upload_file(
+        file: UploadFile = File(...),
+        device_id: Optional[str] = Form(None)
+):
+    # Refuse early, before the upload is written, when the ingestion queue is full
+    try:
+        ingestion.check_capacity()
+    except IngestionQueueFull as e:
+        raise _ingestion_unavailable(e)
+
+    # The multipart parser already knows the size when the body had no Content-Length
+    if file.size is not None and file.size > MAX_UPLOAD_BYTES:
+        raise _upload_too_large(UploadTooLarge(MAX_UPLOAD_BYTES))
+
+    # Initialize session metadata at upload time
+    created_at = datetime.datetime.now()
+    try:
+        metadata, file_path, is_duplicate = await _store_upload(file.file, file.filename, created_at, device_id)
+    except UploadTooLarge as e:
+        raise _upload_too_large(e)
+    doc_id = metadata["id"]
+    file_extension = os.path.splitext(file.filename)[1].lower()
+
+    # Duplicates skip parsing, chunking and embedding entirely
+    if is_duplicate:
+        print(f"Upload {doc_id} duplicates the content of {metadata['duplicate_of']}")
+    else:
+        # Queued before the session and catalog rows exist, so a full queue leaves nothing behind
+        try:
+            ingestion.submit(doc_id, _process_upload, doc_id, file_path, file_extension)
+        except IngestionQueueFull as e:
+            _discard_stored_upload(doc_id)
+            raise _ingestion_unavailable(e)
+
+    session_store.create_session(doc_id, created_at, device_id)
+    document_catalog.upsert(metadata)
     return metadata
 
 
+@app.post("/upload_bulk")
+async def upload_bulk(
+        files: List[UploadFile] = File(...),
+        device_id: Optional[str] = Form(None)
+):
+    """Upload many files and/or zip/tar archives in one request.
+
+    All new files are processed as one ingestion batch, with their chunks embedded
+    together, and their sessions and catalog entries are written once for the batch.
+    Returns a per-file id and status: "queued", "duplicate" or "rejected".
+    """
+    plain_files = [file for file in files if not file.filename.lower().endswith(ARCHIVE_SUFFIXES)]
+    try:
+        ingestion.check_capacity(len(plain_files) or 1)
+    except IngestionQueueFull as e:
+        raise _ingestion_unavailable(e)
+
+    created_at = datetime.datetime.now()
+    results, stored, to_process = [], [], []
+
+    async def add(source, filename: str):
+        # Only the base name is kept, so archive paths can't escape the document directory
+        filename = os.path.basename(filename)
+        if not filename or filename.startswith("."):
+            return
+        if os.path.splitext(filename)[1].lower() not in SUPPORTED_EXTENSIONS:
+            results.append({"name": filename, "status": "rejected", "error": "Unsupported file type"})
+            return
+        if len(stored) >= BULK_UPLOAD_MAX_FILES:
+            results.append({"name": filename, "status": "rejected",
+                            "error": f"More than {BULK_UPLOAD_MAX_FILES} files in one request"})
+            return
+        try:
+            metadata, file_path, is_duplicate = await _store_upload(source, filename, created_at, device_id)
+        except UploadTooLarge as e:
+            results.append({"name": filename, "status": "rejected", "error": str(e)})
+            return
+        stored.append(metadata)
+        entry = {"id": metadata["id"], "name": filename, "status": "duplicate" if is_duplicate else "queued"}
+        if is_duplicate:
+            entry["duplicate_of"] = metadata["duplicate_of"]
+        else:
+            to_process.append((metadata["id"], file_path, os.path.splitext(filename)[1].lower()))
+        results.append(entry)
+
+    for file in files:
+        if file.filename.lower().endswith(ARCHIVE_SUFFIXES):
+            try:
+                async for member_name, stream in _aiter_archive(file):
+                    # The member's content is read in worker threads by save_upload
+                    await add(stream, member_name)
+            except (zipfile.BadZipFile, tarfile.TarError) as e:
+                results.append({"name": file.filename, "status": "rejected", "error": f"Invalid archive: {e}"})
+        else:
+            await add(file.file, file.filename)
+
+    if to_process:
+        try:
+            ingestion.submit_batch([doc_id for doc_id, _, _ in to_process], _process_upload_batch, to_process)
+        except IngestionQueueFull as e:
+            for metadata in stored:
+                _discard_stored_upload(metadata["id"])
+            raise _ingestion_unavailable(e)
+
+    # One session-store and one catalog write for the whole batch
+    if stored:
+        session_store.create_sessions([metadata["id"] for metadata in stored], created_at, device_id)
+        document_catalog.upsert_many(stored)
+
+    return {"files": results}
+
+
 @app.post("/add_url")
-async def add_url(url_data: UrlRequest, background_tasks: BackgroundTasks = None):
+async def add_url(url_data: UrlRequest):
+    try:
+        ingestion.check_capacity()
+    except IngestionQueueFull as e:
+        raise _ingestion_unavailable(e)
+
     url_id = str(uuid.uuid4())
     url = url_data.url
     device_id = url_data.device_id  # Extract device_id from request
@@ -117,17 +902,14 @@ async def add_url(url_data: UrlRequest, background_tasks: BackgroundTasks = None
         name = url[:50]
 
     # Initialize session metadata at URL addition time
-    session_metadata[url_id] = {
-        "created_at": datetime.datetime.now(),
-        "message_count": 0,
-        "device_id": device_id  # Store device_id in session metadata
-    }
+    created_at = datetime.datetime.now()
+    session_store.create_session(url_id, created_at, device_id)
 
     metadata = {
         "id": url_id,
         "name": name,
         "type": "url/html",
-        "uploadedAt": session_metadata[url_id]["created_at"].isoformat(),
+        "uploadedAt": created_at.isoformat(),
         "size": len(url),
         "source": "url",
         "sourceUrl": url,
@@ -136,20 +918,96 @@ async def add_url(url_data: UrlRequest, background_tasks: BackgroundTasks = None
 
     with open(os.path.join(url_dir, "metadata.json"), "w") as f:
         json.dump(metadata, f)
+    document_catalog.upsert(metadata)
 
-    if background_tasks:
-        background_tasks.add_task(process_url, url_id, url, embeddings)
-    else:
-        await process_url(url_id, url, embeddings)
+    try:
+        ingestion.submit(url_id, _process_url, url_id, url)
+    except IngestionQueueFull as e:
+        raise _ingestion_unavailable(e)
+
+    return metadata
+
+
+@app.post("/add_site")
+async def add_site(site: SiteRequest):
+    """Crawl a site from a root URL and/or sitemap into one combined, chattable source."""
+    if not (site.url or site.sitemap_url):
+        raise HTTPException(status_code=400, detail="Provide a url or a sitemap_url")
+    if not 0 <= site.max_depth <= CRAWL_MAX_DEPTH:
+        raise HTTPException(status_code=400, detail=f"max_depth must be between 0 and {CRAWL_MAX_DEPTH}")
+    if not 1 <= site.max_pages <= CRAWL_MAX_PAGES:
+        raise HTTPException(status_code=400, detail=f"max_pages must be between 1 and {CRAWL_MAX_PAGES}")
+    try:
+        ingestion.check_capacity()
+    except IngestionQueueFull as e:
+        raise _ingestion_unavailable(e)
+
+    site_id = str(uuid.uuid4())
+    url = site.url or site.sitemap_url
+    site_dir = os.path.join(URL_DIR, site_id)
+    os.makedirs(site_dir, exist_ok=True)
+    with open(os.path.join(site_dir, "url.txt"), "w") as f:
+        f.write(url)
+
+    crawl = {
+        "root_url": site.url,
+        "sitemap_url": site.sitemap_url,
+        "max_depth": site.max_depth,
+        "max_pages": site.max_pages,
+        "allowed_domains": site.allowed_domains
+    }
+
+    created_at = datetime.datetime.now()
+    session_store.create_session(site_id, created_at, site.device_id)
 
-    # Save session metadata
-    save_session_data(session_metadata, chat_sessions)
+    metadata = {
+        "id": site_id,
+        "name": urlparse(url).netloc or url[:50],
+        "type": "url/site",
+        "uploadedAt": created_at.isoformat(),
+        "size": 0,
+        "source": "url",
+        "sourceUrl": url,
+        "device_id": site.device_id,
+        "crawl": crawl
+    }
+
+    with open(os.path.join(site_dir, "metadata.json"), "w") as f:
+        json.dump(metadata, f)
+    document_catalog.upsert(metadata)
+
+    try:
+        ingestion.submit(site_id, _process_url, site_id, url, crawl=crawl)
+    except IngestionQueueFull as e:
+        raise _ingestion_unavailable(e)
 
     return metadata
 
 
-@app.get("/documents")
-async def get_documents(device_id: Optional[str] = Query(None)):
+@app.post("/refresh_url/{url_id}")
+async def refresh_url_source(url_id: str, request: SessionRequest = None):
+    """Re-fetch a URL and re-index only what changed. Poll /documents/{id}/status for the result."""
+    url_dir = os.path.join(URL_DIR, url_id)
+    if not os.path.exists(url_dir):
+        raise HTTPException(status_code=404, detail="URL not found")
+
+    session = session_store.get_session(url_id)
+    device_id = request.device_id if request else None
+    if device_id and session and session.get("device_id") and session["device_id"] != device_id:
+        raise HTTPException(status_code=403, detail="You don't have permission to refresh this URL")
+
+    try:
+        queued = _submit_url_refresh(url_id)
+    except IngestionQueueFull as e:
+        raise _ingestion_unavailable(e)
+    if not queued:
+        raise HTTPException(status_code=409, detail="URL is already being processed")
+
+    return {"id": url_id, "status": "queued"}
+
+
+def _scan_document_dirs() -> list:
+    """Read the metadata of every document and URL from disk, for rebuilding the catalog."""
     docs = []
 
     if os.path.exists(UPLOAD_DIR):
@@ -159,11 +1017,7 @@ async def get_documents(device_id: Optional[str] = Query(None)):
                 metadata_path = os.path.join(doc_dir, "metadata.json")
                 if os.path.exists(metadata_path):
                     with open(metadata_path, "r") as f:
-                        metadata = json.load(f)
-
-                        # Filter by device_id if provided
-                        if device_id is None or metadata.get("device_id") == device_id:
-                            docs.append(metadata)
+                        docs.append(json.load(f))
                 else:
                     files = os.listdir(doc_dir)
                     if files:
@@ -171,17 +1025,15 @@ async def get_documents(device_id: Optional[str] = Query(None)):
                         if filename:
                             file_path = os.path.join(doc_dir, filename)
                             file_extension = os.path.splitext(filename)[1].lower()[1:]
-                            # Only include documents without device_id when no filter is applied
-                            if device_id is None:
-                                docs.append({
-                                    "id": doc_id,
-                                    "name": filename,
-                                    "type": file_extension,
-                                    "size": os.path.getsize(file_path),
-                                    "uploadedAt": datetime.datetime.fromtimestamp(
-                                        os.path.getctime(file_path)).isoformat(),
-                                    "source": "file"
-                                })
+                            docs.append({
+                                "id": doc_id,
+                                "name": filename,
+                                "type": file_extension,
+                                "size": os.path.getsize(file_path),
+                                "uploadedAt": datetime.datetime.fromtimestamp(
+                                    os.path.getctime(file_path)).isoformat(),
+                                "source": "file"
+                            })
 
     if os.path.exists(URL_DIR):
         for url_id in os.listdir(URL_DIR):
@@ -190,100 +1042,112 @@ async def get_documents(device_id: Optional[str] = Query(None)):
                 metadata_path = os.path.join(url_dir, "metadata.json")
                 if os.path.exists(metadata_path):
                     with open(metadata_path, "r") as f:
-                        metadata = json.load(f)
+                        docs.append(json.load(f))
+
+    return docs
+
 
-                        # Filter by device_id if provided
-                        if device_id is None or metadata.get("device_id") == device_id:
-                            docs.append(metadata)
+@app.get("/documents")
+async def get_documents(
+        response: Response,
+        device_id: Optional[str] = Query(None),
+        limit: Optional[int] = Query(None, ge=1, le=1000),
+        cursor: Optional[str] = Query(None),
+        order: str = Query("desc", pattern="^(asc|desc)$")
+):
+    """List documents and URLs from the catalog, newest first by default.
+
+    With limit set, the cursor for the next page is returned in the X-Next-Cursor header.
+    """
+    try:
+        docs, next_cursor = document_catalog.list(device_id=device_id, limit=limit, cursor=cursor, order=order)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return docs
 
 
-@app.post("/chat")
-async def chat(request: ChatRequest):
+@dataclass
+class ChatContext:
+    """Everything a chat endpoint needs to answer one validated request."""
+    session_id: str
+    time_elapsed: float
+    memory: Optional[BaseChatMemory] = None
+    retrieval_chain: Optional[ConversationalRetrievalChain] = None
+    formatted_history: list = field(default_factory=list)
+    # Answer cache scope: the vector stores the answer is retrieved from
+    cache_scope: frozenset = frozenset()
+    # Reply to send instead of answering when the session hit one of its limits
+    ended_response: Optional[dict] = None
+    # Stage durations of this request, for /metrics and the optional timing record
+    timings: StageTimer = field(default_factory=StageTimer)
+    # Session message count including this message, once reserved; whether the exchange was stored
+    message_count: Optional[int] = None
+    recorded: bool = False
+
+
+async def _prepare_chat(request: ChatRequest) -> ChatContext:
+    """Validate a chat request and build the retrieval chain that will answer it."""
     if not request.messages:
         raise HTTPException(status_code=400, detail="No message provided")
 
-    message = request.messages
+    timings = StageTimer()
     session_id = request.session_ids
     device_id = request.device_id  # Extract device_id from request
 
     # Check if session metadata exists
-    if session_id not in session_metadata:
+    session = session_store.get_session(session_id)
+    if session is None:
         raise HTTPException(status_code=404, detail="Session metadata not found")
 
     # Verify device_id if provided
-    if device_id and session_metadata[session_id].get("device_id") and session_metadata[session_id][
-        "device_id"] != device_id:
+    if device_id and session.get("device_id") and session["device_id"] != device_id:
         raise HTTPException(status_code=403, detail="You don't have permission to access this session")
 
-    # Load or get retrieval chain if not already loaded
-    if session_id not in chat_sessions:
-        doc_dir = os.path.join(UPLOAD_DIR, session_id)
-        url_dir = os.path.join(URL_DIR, session_id)
-        is_document = os.path.exists(doc_dir)
-        is_url = os.path.exists(url_dir)
-
-        if not (is_document or is_url):
-            raise HTTPException(status_code=404, detail="Document or URL not found")
-
-        vectorstore_path = os.path.join(VECTORSTORE_DIR, session_id if is_document else f"url_{session_id}")
-
-        if not os.path.exists(vectorstore_path):
-            raise HTTPException(status_code=404, detail="Content not processed yet")
+    vectorstore_path = _get_vectorstore_path(session_id)
 
-        try:
-            vectorstore = FAISS.load_local(vectorstore_path, embeddings, allow_dangerous_deserialization=True)
-            memory = ConversationBufferMemory(
-                memory_key="chat_history",
-                return_messages=True
-            )
-
-            # Restore chat history from persisted sessions
-            if session_id in persisted_sessions:
-                for msg in persisted_sessions[session_id]["chat_history"]:
-                    if msg["role"] == "user":
-                        memory.save_context({"input": msg["content"]}, {"output": ""})
-                    elif msg["role"] == "assistant":
-                        memory.save_context({"input": ""}, {"output": msg["content"]})
-
-            retrieval_chain = ConversationalRetrievalChain.from_llm(
-                llm=llm,
-                retriever=vectorstore.as_retriever(),
-                memory=memory
-            )
-            chat_sessions[session_id] = retrieval_chain
-        except Exception as e:
-            print(f"Error loading session: {e}")
-            raise HTTPException(status_code=500, detail=str(e))
+    try:
+        with timings.stage("load_index"):
+            vectorstore = await _aload_vectorstore(vectorstore_path)
+        with timings.stage("load_memory"):
+            memory = await _aget_memory(session_id)
+    except Exception as e:
+        print(f"Error loading session: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
 
     # Check session limits
     current_time = datetime.datetime.now()
-    session_start = session_metadata[session_id]["created_at"]
+    session_start = session["created_at"]
     time_elapsed = (current_time - session_start).total_seconds()
-    message_count = session_metadata[session_id]["message_count"]
+    message_count = session["message_count"]
     print(f"Session ID: {session_id}, Time Elapsed: {time_elapsed}, Message Count: {message_count}")
 
     if time_elapsed > 3600:
-        return {
+        return ChatContext(session_id, time_elapsed, timings=timings, ended_response={
             "role": "assistant",
             "content": "Session has ended due to time limit (1 hour)",
             "source_documents": [],
             "messages_remaining": 0,
             "session_expires_in": 0
-        }
+        })
 
+    # Skips building the chain for used-up sessions; _reserve_message makes the binding check
     if message_count >= 20:
-        return {
-            "role": "assistant",
-            "content": "Session has ended due to message limit (20 messages)",
-            "source_documents": [],
-            "messages_remaining": 0,
-            "session_expires_in": 3600 - time_elapsed
-        }
+        return ChatContext(session_id, time_elapsed, timings=timings,
+                           ended_response=_message_limit_response(time_elapsed))
+
+    if request.document_ids:
+        with timings.stage("load_index"):
+            retriever, vectorstore_paths = await _build_multi_document_retriever(
+                session_id, vectorstore, request.document_ids, device_id
+            )
+    else:
+        retriever, vectorstore_paths = _build_retriever(vectorstore), [vectorstore_path]
 
     # Process the chat message
-    retrieval_chain = chat_sessions[session_id]
+    retrieval_chain = _build_retrieval_chain(retriever, memory)
     formatted_history = []
 
     for entry in request.history:
@@ -294,26 +1158,298 @@ async def chat(request: ChatRequest):
                 last_user_msg, _ = formatted_history.pop()
                 formatted_history.append((last_user_msg, entry.get("content")))
 
+    return ChatContext(
+        session_id,
+        time_elapsed,
+        memory=memory,
+        retrieval_chain=retrieval_chain,
+        formatted_history=formatted_history,
+        cache_scope=AnswerCache.scope_for(vectorstore_paths),
+        timings=timings
+    )
+
+
+async def _build_multi_document_retriever(session_id: str, vectorstore, document_ids: list,
+                                         device_id: Optional[str]):
+    """Build a retriever that fans out over the session's document plus the requested ones.
+
+    Returns the retriever and the paths of all vector stores it searches.
+    """
+    other_ids = [doc_id for doc_id in dict.fromkeys(document_ids) if doc_id != session_id]
+
+    vectorstore_paths = []
+    for doc_id in other_ids:
+        session = session_store.get_session(doc_id)
+        if session is None:
+            raise HTTPException(status_code=404, detail=f"Document or URL not found: {doc_id}")
+        if device_id and session.get("device_id") and session["device_id"] != device_id:
+            raise HTTPException(status_code=403, detail=f"You don't have permission to access {doc_id}")
+        vectorstore_paths.append(_get_vectorstore_path(doc_id))
+
+    # Indexes come from the shared cache, so the next request reuses them
     try:
-        response = retrieval_chain.invoke({
-            "question": message,
-            "chat_history": formatted_history
-        })
-
-        session_metadata[session_id]["message_count"] += 1
-        save_session_data(session_metadata, chat_sessions)
-
-        return {
-            "role": "assistant",
-            "content": response["answer"],
-            "source_documents": response.get("source_documents", []),
-            "messages_remaining": 20 - session_metadata[session_id]["message_count"],
-            "session_expires_in": 3600 - time_elapsed
-        }
+        others = await asyncio.gather(*(_aload_vectorstore(path) for path in vectorstore_paths))
     except Exception as e:
-        print(f"Error during chat: {e}")
+        print(f"Error loading documents: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+    retriever = MultiIndexRetriever(
+        vectorstores=[vectorstore, *others],
+        document_ids=[session_id, *other_ids],
+        embeddings=embeddings
+    )
+    return retriever, [_get_vectorstore_path(session_id), *vectorstore_paths]
+
+
+def _message_limit_response(time_elapsed: float) -> dict:
+    return {
+        "role": "assistant",
+        "content": "Session has ended due to message limit (20 messages)",
+        "source_documents": [],
+        "messages_remaining": 0,
+        "session_expires_in": 3600 - time_elapsed
+    }
+
+
+def _reserve_message(ctx: ChatContext) -> Optional[dict]:
+    """Count the message against the session's limit before answering it.
+
+    The reservation is one atomic update in the shared session store, so concurrent
+    requests on any worker can't answer more than 20 messages. Returns the reply to
+    send instead when the limit is used up.
+    """
+    ctx.message_count = session_store.reserve_message(ctx.session_id, 20)
+    if ctx.message_count is None:
+        return _message_limit_response(ctx.time_elapsed)
+    return None
+
+
+def _release_message(ctx: ChatContext):
+    """Give the reservation back if the message ended up not being answered."""
+    if ctx.message_count is not None and not ctx.recorded:
+        session_store.release_message(ctx.session_id)
+        ctx.message_count = None
+
+
+def _admission_key(request: ChatRequest) -> str:
+    # Anonymous clients are queued per session
+    return request.device_id or request.session_ids
+
+
+def _check_admission(request: ChatRequest):
+    """Reject right away when the request's queue is full, before any work is spent on it."""
+    try:
+        admission.check(_admission_key(request))
+    except AdmissionRejected as e:
+        raise _server_busy(e)
+
+
+def _server_busy(e: AdmissionRejected) -> HTTPException:
+    # Full queues are the client's cue to back off; a request that waited out its deadline hit an overloaded server
+    status_code = 503 if e.reason == "queue_timeout" else 429
+    return HTTPException(status_code=status_code, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+
+@asynccontextmanager
+async def _answer_slot(ctx: ChatContext, request: ChatRequest, is_disconnected):
+    """Hold an admission slot while the chain runs, waiting in the device's queue for one.
+
+    Raises AdmissionRejected when the queue is full, the request waited CHAT_QUEUE_TIMEOUT
+    or its client disconnected while waiting.
+    """
+    ticket = admission.enqueue(_admission_key(request))
+    try:
+        ctx.timings.add("queue", await ticket.wait(CHAT_QUEUE_TIMEOUT, is_disconnected))
+        yield
+    finally:
+        ticket.release()
+
+
+def _is_first_turn(ctx: ChatContext, request: ChatRequest) -> bool:
+    return not has_history(ctx.memory) and not request.history
+
+
+async def _lookup_cached_answer(ctx: ChatContext, request: ChatRequest):
+    """Return (cached response or None, query embedding) for history-free first turns."""
+    if not ANSWER_CACHE_ENABLED or not _is_first_turn(ctx, request):
+        return None, None
+
+    embedding = None
+    if answer_cache.similarity_threshold > 0:
+        embedding = await embeddings.aembed_query(request.messages)
+    entry = answer_cache.get(ctx.cache_scope, request.messages, embedding)
+    if entry:
+        # Keep the conversation coherent for follow-up questions
+        await ctx.memory.asave_context({"question": request.messages}, {"answer": entry["answer"]})
+        return {"answer": entry["answer"], "source_documents": entry["source_documents"]}, embedding
+    return None, embedding
+
+
+def _cache_answer(ctx: ChatContext, request: ChatRequest, response: dict, embedding, first_turn: bool):
+    if ANSWER_CACHE_ENABLED and first_turn:
+        answer_cache.put(
+            ctx.cache_scope, request.messages, response["answer"], response.get("source_documents", []), embedding
+        )
+
+
+def _complete_chat(ctx: ChatContext, question: str, response: dict, cached: bool = False,
+                   usage: Optional[TokenUsage] = None) -> dict:
+    """Account for one answered message and build the reply payload."""
+    # Persists just this exchange; the chain already added it to the in-memory history
+    with ctx.timings.stage("persist"):
+        chat_session_positions[ctx.session_id] = session_store.record_exchange(
+            ctx.session_id, question, response["answer"]
+        )
+    ctx.recorded = True
+
+    # Without a counter the turn made no LLM calls
+    usage = usage.to_dict() if usage else {"prompt_tokens": 0, "completion_tokens": 0, "llm_calls": 0}
+    token_usage.update(usage)
+    token_usage["turns"] += 1
+    print(f"Session ID: {ctx.session_id}, Token usage: {usage}")
+
+    stages = ctx.timings.finish(chat_stage_seconds)
+    if METRICS_LOG_TIMINGS:
+        print(json.dumps({"event": "chat", "session_id": ctx.session_id, "cached": cached,
+                          "stages": stages, **usage}))
+
+    return {
+        "role": "assistant",
+        "content": response["answer"],
+        "source_documents": response.get("source_documents", []),
+        "messages_remaining": 20 - ctx.message_count,
+        "session_expires_in": 3600 - ctx.time_elapsed,
+        "cached": cached,
+        "usage": usage
+    }
+
+
+def _sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data))}\n\n"
+
+
+@app.get("/documents/{doc_id}/status")
+async def get_document_status(doc_id: str):
+    is_document = os.path.exists(os.path.join(UPLOAD_DIR, doc_id))
+    if not (is_document or os.path.exists(os.path.join(URL_DIR, doc_id))):
+        raise HTTPException(status_code=404, detail="Document or URL not found")
+    return _get_processing_status(doc_id, is_document)
+
+
+@app.post("/chat")
+async def chat(request: ChatRequest, http_request: Request):
+    _check_admission(request)
+    # Counts the turn's LLM calls, including memory summarising history while restoring it or saving the turn
+    with counting_tokens(TokenUsage(llm)) as usage:
+        ctx = await _prepare_chat(request)
+        if ctx.ended_response:
+            return ctx.ended_response
+        ended_response = _reserve_message(ctx)
+        if ended_response:
+            return ended_response
+
+        try:
+            with _chain_in_use():
+                first_turn = _is_first_turn(ctx, request)
+                with ctx.timings.stage("answer_cache"):
+                    cached_response, query_embedding = await _lookup_cached_answer(ctx, request)
+                if cached_response:
+                    return _complete_chat(ctx, request.messages, cached_response, cached=True, usage=usage)
+
+                # Use the async chain API so retrieval and LLM calls don't block other requests
+                async with _answer_slot(ctx, request, http_request.is_disconnected):
+                    response = await ctx.retrieval_chain.ainvoke({
+                        "question": request.messages,
+                        "chat_history": ctx.formatted_history
+                    }, config={"callbacks": [usage, ctx.timings.callbacks(ANSWER_TAG)]})
+                _cache_answer(ctx, request, response, query_embedding, first_turn)
+
+                return _complete_chat(ctx, request.messages, response, usage=usage)
+        except AdmissionRejected as e:
+            print(f"Chat request for {ctx.session_id} not admitted: {e}")
+            raise _server_busy(e)
+        except Exception as e:
+            print(f"Error during chat: {e}")
+            raise HTTPException(status_code=500, detail=str(e))
+        finally:
+            _release_message(ctx)
+
+
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest, http_request: Request):
+    """Server-Sent Events variant of /chat.
+
+    Emits a "token" event per generated answer token and a final "end" event with the
+    same payload /chat returns; failures after the stream started are sent as "error"
+    (with "retry_after" when the request wasn't admitted).
+    """
+    _check_admission(request)
+    usage = TokenUsage(llm)
+    with counting_tokens(usage):
+        ctx = await _prepare_chat(request)
+
+    async def event_stream():
+        if ctx.ended_response:
+            yield _sse_event("end", ctx.ended_response)
+            return
+        # Reserved here rather than before the response starts, so it is released on disconnect
+        ended_response = _reserve_message(ctx)
+        if ended_response:
+            yield _sse_event("end", ended_response)
+            return
+
+        # The stream is iterated in the response's own context, so the turn's counter is set again here
+        with counting_tokens(usage):
+            try:
+                with _chain_in_use():
+                    first_turn = _is_first_turn(ctx, request)
+                    with ctx.timings.stage("answer_cache"):
+                        cached_response, query_embedding = await _lookup_cached_answer(ctx, request)
+                    if cached_response:
+                        yield _sse_event("token", {"content": cached_response["answer"]})
+                        yield _sse_event("end", _complete_chat(ctx, request.messages, cached_response, cached=True,
+                                                               usage=usage))
+                        return
+
+                    response = None
+                    # Queued inside the stream, so nothing is held for a response that never starts
+                    async with _answer_slot(ctx, request, http_request.is_disconnected):
+                        async for event in ctx.retrieval_chain.astream_events({
+                            "question": request.messages,
+                            "chat_history": ctx.formatted_history
+                        }, config={"callbacks": [usage, ctx.timings.callbacks(ANSWER_TAG)]}, version="v2"):
+                            # Only forward tokens of the answer, not of the condense-question call
+                            if event["event"] == "on_chat_model_stream" and ANSWER_TAG in event.get("tags", []):
+                                token = event["data"]["chunk"].content
+                                if token:
+                                    if "first_token" not in ctx.timings.stages:
+                                        ctx.timings.add("first_token", time.perf_counter() - ctx.timings.started)
+                                    yield _sse_event("token", {"content": token})
+                            elif event["event"] == "on_chain_end" and not event.get("parent_ids"):
+                                response = event["data"]["output"]
+
+                    if response is None:
+                        raise RuntimeError("Chat chain finished without an answer")
+                    _cache_answer(ctx, request, response, query_embedding, first_turn)
+
+                    # Count the message only once the whole answer was produced
+                    yield _sse_event("end", _complete_chat(ctx, request.messages, response, usage=usage))
+            except AdmissionRejected as e:
+                print(f"Chat stream for {ctx.session_id} not admitted: {e}")
+                yield _sse_event("error", {"detail": str(e), "retry_after": e.retry_after})
+            except Exception as e:
+                print(f"Error during chat stream: {e}")
+                yield _sse_event("error", {"detail": str(e)})
+            finally:
+                # Covers errors and clients that disconnect before the answer is complete
+                _release_message(ctx)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 
 @app.post("/create_session/{doc_id}")
 async def create_session(doc_id: str, request: SessionRequest = None):
@@ -330,43 +1466,27 @@ async def create_session(doc_id: str, request: SessionRequest = None):
     if not (is_document or is_url):
         raise HTTPException(status_code=404, detail="Document or URL not found")
 
-    if doc_id not in session_metadata:
+    session = session_store.get_session(doc_id)
+    if session is None:
         raise HTTPException(status_code=404,
                             detail="Session metadata not found; please upload the document or URL again")
 
     # Verify device_id if provided
-    if device_id and session_metadata[doc_id].get("device_id") and session_metadata[doc_id]["device_id"] != device_id:
+    if device_id and session.get("device_id") and session["device_id"] != device_id:
         raise HTTPException(status_code=403, detail="You don't have permission to access this document")
 
-    vectorstore_path = os.path.join(VECTORSTORE_DIR, doc_id if is_document else f"url_{doc_id}")
+    vectorstore_path = _vectorstore_path_for(doc_id, is_document)
 
     if not os.path.exists(vectorstore_path):
-        raise HTTPException(status_code=404, detail="Content not processed yet")
+        _raise_not_processed(doc_id, is_document)
 
     try:
-        vectorstore = FAISS.load_local(vectorstore_path, embeddings, allow_dangerous_deserialization=True)
-        memory = ConversationBufferMemory(
-            memory_key="chat_history",
-            return_messages=True
-        )
-
-        # Restore chat history if exists
-        if doc_id in persisted_sessions:
-            for msg in persisted_sessions[doc_id]["chat_history"]:
-                if msg["role"] == "user":
-                    memory.save_context({"input": msg["content"]}, {"output": ""})
-                elif msg["role"] == "assistant":
-                    memory.save_context({"input": ""}, {"output": msg["content"]})
+        # Warm the shared index so the first chat message doesn't pay for the load
+        await _aload_vectorstore(vectorstore_path)
+        memory = await _aget_memory(doc_id)
 
         print("Chat memory: ", memory.chat_memory.messages)
 
-        retrieval_chain = ConversationalRetrievalChain.from_llm(
-            llm=llm,
-            retriever=vectorstore.as_retriever(),
-            memory=memory
-        )
-        chat_sessions[doc_id] = retrieval_chain
-        save_session_data(session_metadata, chat_sessions)
         return {"id": doc_id, "status": "created"}
     except Exception as e:
         print(f"Error creating session: {e}")
@@ -379,44 +1499,26 @@ async def delete_document(doc_id: str, device_id: Optional[str] = Query(None)):
     doc_dir = os.path.join(UPLOAD_DIR, doc_id)
     if os.path.exists(doc_dir):
         # Verify device_id if provided
-        if device_id and doc_id in session_metadata:
-            doc_device_id = session_metadata[doc_id].get("device_id")
+        session = session_store.get_session(doc_id) if device_id else None
+        if session:
+            doc_device_id = session.get("device_id")
             if doc_device_id and doc_device_id != device_id:
                 raise HTTPException(status_code=403, detail="You don't have permission to delete this document")
 
-        shutil.rmtree(doc_dir, ignore_errors=True)
-        vectorstore_path = os.path.join(VECTORSTORE_DIR, doc_id)
-        if os.path.exists(vectorstore_path):
-            shutil.rmtree(vectorstore_path, ignore_errors=True)
-        if doc_id in chat_sessions:
-            del chat_sessions[doc_id]
-        if doc_id in session_metadata:
-            del session_metadata[doc_id]
-        if doc_id in persisted_sessions:
-            del persisted_sessions[doc_id]
-        save_session_data(session_metadata, chat_sessions)
+        _remove_document(doc_id)
         return {"status": "deleted"}
 
     # Check if URL exists and verify device_id if provided
     url_dir = os.path.join(URL_DIR, doc_id)
     if os.path.exists(url_dir):
         # Verify device_id if provided
-        if device_id and doc_id in session_metadata:
-            doc_device_id = session_metadata[doc_id].get("device_id")
+        session = session_store.get_session(doc_id) if device_id else None
+        if session:
+            doc_device_id = session.get("device_id")
             if doc_device_id and doc_device_id != device_id:
                 raise HTTPException(status_code=403, detail="You don't have permission to delete this URL")
 
-        shutil.rmtree(url_dir, ignore_errors=True)
-        vectorstore_path = os.path.join(VECTORSTORE_DIR, f"url_{doc_id}")
-        if os.path.exists(vectorstore_path):
-            shutil.rmtree(vectorstore_path, ignore_errors=True)
-        if doc_id in chat_sessions:
-            del chat_sessions[doc_id]
-        if doc_id in session_metadata:
-            del session_metadata[doc_id]
-        if doc_id in persisted_sessions:
-            del persisted_sessions[doc_id]
-        save_session_data(session_metadata, chat_sessions)
+        _remove_url(doc_id)
         return {"status": "deleted"}
 
     raise HTTPException(status_code=404, detail="Document or URL not found")
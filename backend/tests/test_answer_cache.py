@@ -0,0 +1,34 @@
+import numpy as np
+
+from utils.answer_cache import AnswerCache
+
+
+def _vectors(count: int) -> np.ndarray:
+    return np.random.default_rng(0).normal(size=(count, 64)).astype(np.float32)
+
+
+def test_similar_question_matches_within_its_scope():
+    cache = AnswerCache(max_entries=100, ttl=3600, similarity_threshold=0.9)
+    vectors = _vectors(50)
+    scope, other_scope = AnswerCache.scope_for(["a"]), AnswerCache.scope_for(["b"])
+    for i, vector in enumerate(vectors):
+        cache.put(scope, f"question {i}", f"answer {i}", [], vector.tolist())
+
+    # Scaled and slightly shifted: same direction, different question text
+    assert cache.get(scope, "reworded", (vectors[17] * 3 + 0.01).tolist())["answer"] == "answer 17"
+    assert cache.get(other_scope, "reworded", vectors[17].tolist()) is None
+    assert cache.get(scope, "unrelated", (-vectors[17]).tolist()) is None
+
+
+def test_evicted_and_invalidated_questions_stop_matching():
+    cache = AnswerCache(max_entries=3, ttl=3600, similarity_threshold=0.9)
+    vectors = _vectors(5)
+    scope = AnswerCache.scope_for(["a"])
+    for i, vector in enumerate(vectors):
+        cache.put(scope, f"question {i}", f"answer {i}", [], vector.tolist())
+
+    assert cache.get(scope, "reworded", vectors[0].tolist()) is None
+    assert cache.get(scope, "reworded", vectors[4].tolist())["answer"] == "answer 4"
+    cache.invalidate("a")
+    assert cache.get(scope, "reworded", vectors[4].tolist()) is None
+    assert cache.stats()["entries"] == 0
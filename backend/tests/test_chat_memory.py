@@ -0,0 +1,51 @@
+import asyncio
+from uuid import uuid4
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, LLMResult
+
+from benchmarks.fakes import FakeChatModel
+from utils.chat_memory import TokenUsage, TokenWindowMemory
+
+
+def _call(usage: TokenUsage, prompt: str, answer: AIMessage, llm_output: dict = None):
+    run_id = uuid4()
+
+    async def run():
+        await usage.on_chat_model_start({}, [[HumanMessage(content=prompt)]], run_id=run_id)
+        await usage.on_llm_end(LLMResult(generations=[[ChatGeneration(message=answer)]], llm_output=llm_output),
+                               run_id=run_id)
+
+    asyncio.run(run())
+
+
+def test_token_usage_prefers_provider_counts():
+    usage = TokenUsage(FakeChatModel())
+    _call(usage, "one two three", AIMessage(content="four five"),
+          llm_output={"token_usage": {"prompt_tokens": 30, "completion_tokens": 7}})
+    _call(usage, "one two three", AIMessage(content="four five", usage_metadata={
+        "input_tokens": 20, "output_tokens": 5, "total_tokens": 25}))
+    assert usage.to_dict() == {"prompt_tokens": 50, "completion_tokens": 12, "llm_calls": 2}
+
+
+def test_token_usage_estimates_without_provider_counts():
+    usage = TokenUsage(FakeChatModel())
+    _call(usage, "one two three", AIMessage(content="four five"))
+    assert usage.completion_tokens == 2
+    assert usage.prompt_tokens == FakeChatModel().get_num_tokens_from_messages([HumanMessage(content="one two three")])
+    assert not usage._prompts
+
+
+def test_window_memory_keeps_the_newest_messages_that_fit():
+    llm = FakeChatModel()
+    memory = TokenWindowMemory(llm=llm, max_token_limit=60, memory_key="chat_history", return_messages=True)
+    messages = [(HumanMessage if i % 2 == 0 else AIMessage)(content=" ".join(["word"] * (i % 7 + 1)))
+                for i in range(40)]
+    memory.chat_memory.add_messages(messages)
+
+    memory.prune()
+
+    kept = memory.chat_memory.messages
+    assert kept == messages[len(messages) - len(kept):]
+    assert llm.get_num_tokens_from_messages(kept) <= 60
+    assert llm.get_num_tokens_from_messages(messages[len(messages) - len(kept) - 1:]) > 60
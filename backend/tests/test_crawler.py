@@ -0,0 +1,162 @@
+import asyncio
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from utils.crawler import SiteCrawler
+
+FANOUT = 5
+
+
+class _Site:
+    """A local site of linked pages /page/0, /page/1, ... that records the requests it serves."""
+
+    def __init__(self):
+        self.robots = ""
+        self.sitemaps = {}  # path -> XML
+        self.latency = 0.0
+        self.requests = []  # (path, start time)
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def page_requests(self) -> list:
+        return [(path, started) for path, started in self.requests if path.startswith(("/page/", "/private/"))]
+
+    def respond(self, path: str):
+        if path == "/robots.txt":
+            return self.robots, "text/plain"
+        if path in self.sitemaps:
+            return self.sitemaps[path], "application/xml"
+        if path.startswith("/page/"):
+            page = int(path.rsplit("/", 1)[1])
+            links = "".join(f'<a href="/page/{child}">Page {child}</a>'
+                            for child in range(page * FANOUT + 1, page * FANOUT + FANOUT + 1))
+            return (f"<html><head><title>Page {page}</title></head><body><p>Page {page} text.</p>{links}"
+                    f"<a href='/private/{page}'>private</a></body></html>"), "text/html"
+        if path.startswith("/private/"):
+            return "<html><body>Private</body></html>", "text/html"
+        return None, None
+
+
+@pytest.fixture
+def site():
+    site = _Site()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            with site._lock:
+                site.requests.append((self.path, time.monotonic()))
+                site.active += 1
+                site.max_active = max(site.max_active, site.active)
+            try:
+                time.sleep(site.latency)
+                body, content_type = site.respond(self.path)
+                if body is None:
+                    self.send_error(404)
+                    return
+                payload = body.encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+            finally:
+                with site._lock:
+                    site.active -= 1
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    site.base = f"http://127.0.0.1:{server.server_port}"
+    yield site
+    server.shutdown()
+
+
+def _crawl(crawler: SiteCrawler, **kwargs) -> list:
+    async def collect():
+        return [document async for document in crawler.crawl(**kwargs)]
+
+    return asyncio.run(collect())
+
+
+def _crawler(max_connections: int = 4, per_host: int = 4) -> SiteCrawler:
+    return SiteCrawler(max_connections, per_host, timeout=10, user_agent="senseai-test")
+
+
+def _urlset(site: _Site, pages) -> str:
+    locations = "".join(f"<url><loc>{site.base}/page/{page}</loc></url>" for page in pages)
+    return f'<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{locations}</urlset>'
+
+
+def _index(site: _Site, paths) -> str:
+    locations = "".join(f"<sitemap><loc>{site.base}{path}</loc></sitemap>" for path in paths)
+    return f'<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{locations}</sitemapindex>'
+
+
+def test_disallowed_paths_are_skipped(site):
+    site.robots = "User-agent: *\nDisallow: /private/\n"
+    crawler = _crawler()
+
+    documents = _crawl(crawler, root_url=f"{site.base}/page/0", max_depth=1, max_pages=100)
+
+    assert not any(path.startswith("/private/") for path, _ in site.requests)
+    assert len(documents) == FANOUT + 1
+    # Only the root is above max_depth, so only its private link is scheduled
+    assert crawler.stats["robots_blocked"] == 1
+
+
+def test_requests_are_spaced_by_crawl_delay(site):
+    # Whole seconds: RobotFileParser ignores fractional delays
+    site.robots = "User-agent: *\nCrawl-delay: 1\n"
+
+    _crawl(_crawler(), root_url=f"{site.base}/page/0", max_depth=1, max_pages=3)
+
+    starts = [started for _, started in site.page_requests()]
+    assert len(starts) == 3
+    assert all(later - earlier >= 0.95 for earlier, later in zip(starts, starts[1:]))
+
+
+def test_fetches_exactly_max_pages(site):
+    crawler = _crawler(max_connections=8, per_host=8)
+
+    documents = _crawl(crawler, root_url=f"{site.base}/page/0", max_depth=3, max_pages=7)
+
+    assert len(documents) == 7
+    assert len(site.page_requests()) == 7
+    assert crawler.stats["fetched"] == 7
+
+
+def test_per_host_cap(site):
+    site.robots = "User-agent: *\nDisallow: /private/\n"
+    site.latency = 0.05
+
+    documents = _crawl(_crawler(max_connections=8, per_host=2), root_url=f"{site.base}/page/0", max_depth=2,
+                       max_pages=20)
+
+    assert len(documents) == 20
+    assert site.max_active == 2
+
+
+def test_sitemap_index_is_followed_to_max_depth(site):
+    site.sitemaps = {
+        "/sitemap.xml": _index(site, ["/nested.xml", "/deep-1.xml", "/pages-a.xml"]),
+        "/pages-a.xml": _urlset(site, [1, 2]),
+        "/nested.xml": _index(site, ["/pages-b.xml"]),
+        "/pages-b.xml": _urlset(site, [3]),
+        # deep-3 is nested past MAX_SITEMAP_DEPTH: fetched, but its sitemaps are not
+        "/deep-1.xml": _index(site, ["/deep-2.xml"]),
+        "/deep-2.xml": _index(site, ["/deep-3.xml"]),
+        "/deep-3.xml": _index(site, ["/too-deep.xml"]),
+        "/too-deep.xml": _urlset(site, [4]),
+    }
+
+    documents = _crawl(_crawler(), sitemap_url=f"{site.base}/sitemap.xml", max_pages=100)
+
+    assert sorted(document.metadata["title"] for document in documents) == ["Page 1", "Page 2", "Page 3"]
+    assert "/too-deep.xml" not in [path for path, _ in site.requests]
@@ -0,0 +1,54 @@
+from langchain_community.vectorstores import FAISS
+
+from benchmarks.fakes import FakeEmbeddings
+from utils.retrieval import HybridRetriever, retrieval_counts
+from utils.vectorstore_storage import load_vectorstore, save_vectorstore
+
+POLICY = [
+    "The refund policy allows returns within 30 days of delivery.",
+    "Shipping takes 2 to 5 business days within the country.",
+    "Support is available by email and phone on weekdays.",
+    "Warranty claims need the original receipt and serial number.",
+    "Gift cards can not be exchanged for cash.",
+]
+
+
+def _store(tmp_path, texts):
+    embeddings = FakeEmbeddings()
+    save_vectorstore(FAISS.from_texts(texts, embeddings), str(tmp_path))
+    return load_vectorstore(str(tmp_path), embeddings)
+
+
+def test_small_store_returns_k_results(tmp_path):
+    retriever = HybridRetriever(vectorstore=_store(tmp_path, POLICY), k=4)
+    before = retrieval_counts["hybrid"]
+    for question in ("what is the refund policy", "how long does shipping take"):
+        assert len(retriever.invoke(question)) == 4
+    # Below min_chunks every query uses both searches
+    assert retrieval_counts["hybrid"] == before + 2
+
+
+def test_fast_path_falls_back_when_lexical_hits_are_few(tmp_path):
+    texts = [f"Filler paragraph {i} about general terms." for i in range(300)] + ["Clause SKU12345 covers refunds."]
+    retriever = HybridRetriever(vectorstore=_store(tmp_path, texts), k=4)
+    before = dict(retrieval_counts)
+
+    # One matching chunk is too few for the answer context
+    results = retriever.invoke("SKU12345")
+    assert len(results) == 4
+    assert "Clause SKU12345 covers refunds." in [doc.page_content for doc in results]
+    assert retrieval_counts["hybrid"] == before.get("hybrid", 0) + 1
+    assert retrieval_counts["lexical"] == before.get("lexical", 0)
+
+
+def test_fast_path_answers_rare_token_queries_in_large_stores(tmp_path):
+    texts = [f"Filler paragraph {i} about general terms." for i in range(300)]
+    texts += [f"Clause SKU12345 variant {i}." for i in range(4)]
+    # Rare: in at most 2% (6) of the chunks
+    retriever = HybridRetriever(vectorstore=_store(tmp_path, texts), k=4, rare_token_fraction=0.02)
+    before = retrieval_counts["lexical"]
+
+    results = retriever.invoke("SKU12345")
+    assert all("SKU12345" in doc.page_content for doc in results)
+    assert len(results) == 4
+    assert retrieval_counts["lexical"] == before + 1
@@ -0,0 +1,117 @@
+import asyncio
+import datetime
+import os
+import threading
+
+import httpx
+import pytest
+
+from benchmarks.common import load_app, wait_until_processed
+from utils.session_store import SessionStore
+
+LIMIT = 20
+
+
+def test_concurrent_reservations_never_exceed_the_limit(tmp_path):
+    db_path = str(tmp_path / "sessions.sqlite3")
+    SessionStore(db_path).create_session("s", datetime.datetime.now())
+    answered, released = [], []
+
+    def worker(number: int):
+        # One store per thread: its own connection, like a separate server worker
+        store = SessionStore(db_path)
+        attempt = 0
+        while store.reserve_message("s", LIMIT) is not None:
+            attempt += 1
+            # Every third reservation fails before answering and is given back
+            if attempt % 3 == 0:
+                store.release_message("s")
+                released.append(number)
+                continue
+            store.record_exchange("s", f"question {number}-{attempt}", f"answer {number}-{attempt}")
+            answered.append(number)
+
+    threads = [threading.Thread(target=worker, args=(number,)) for number in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    store = SessionStore(db_path)
+    assert len(answered) == LIMIT
+    assert released
+    assert store.get_session("s")["message_count"] == LIMIT
+    assert len(store.get_history("s")) == 2 * LIMIT
+
+
+@pytest.fixture(scope="module")
+def api(tmp_path_factory):
+    cwd = os.getcwd()
+    api = load_app(workdir=str(tmp_path_factory.mktemp("app")))
+    # Every question must reach the chain and the session store
+    api.ANSWER_CACHE_ENABLED = False
+    yield api
+    api.ingestion.shutdown()
+    os.chdir(cwd)
+
+
+async def _new_session(client) -> str:
+    response = await client.post("/upload", files={"file": ("doc.txt", b"Item 1 ships within 2 days.", "text/plain")})
+    response.raise_for_status()
+    session_id = response.json()["id"]
+    await wait_until_processed(client, session_id)
+    return session_id
+
+
+def _contents(messages) -> list:
+    return [message.content if hasattr(message, "content") else message["content"] for message in messages]
+
+
+def test_concurrent_chats_keep_the_limit_and_the_history(api):
+    async def run():
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=None) as client:
+            session_id = await _new_session(client)
+            responses = await asyncio.gather(*(
+                client.post("/chat", json={"messages": f"question {i}", "session_ids": session_id})
+                for i in range(LIMIT + 10)
+            ))
+            return session_id, [response.json() for response in responses]
+
+    session_id, replies = asyncio.run(run())
+
+    ended = [reply for reply in replies if reply["content"].startswith("Session has ended")]
+    assert len(ended) == 10
+    assert api.session_store.get_session(session_id)["message_count"] == LIMIT
+    history = api.session_store.get_history(session_id)
+    assert len(history) == 2 * LIMIT
+    # Each answered question is persisted once, with its answer right after it
+    questions = _contents(history[0::2])
+    assert len(set(questions)) == LIMIT and all(question.startswith("question ") for question in questions)
+    assert all(message["role"] == "assistant" for message in history[1::2])
+    # This worker's memory holds exactly what was persisted
+    assert _contents(api.chat_sessions[session_id].chat_memory.messages) == _contents(history)
+
+
+def test_memory_catches_up_on_other_workers_exchanges(api):
+    other_worker = SessionStore(api.session_store.db_path)
+
+    async def run():
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=None) as client:
+            session_id = await _new_session(client)
+            (await client.post("/chat", json={"messages": "first", "session_ids": session_id})).raise_for_status()
+            for i in range(2):
+                assert other_worker.reserve_message(session_id, LIMIT) is not None
+                other_worker.record_exchange(session_id, f"elsewhere {i}", f"answer elsewhere {i}")
+            # Concurrent requests must add the other worker's exchanges once
+            memories = await asyncio.gather(*(api._aget_memory(session_id) for _ in range(5)))
+            (await client.post("/chat", json={"messages": "last", "session_ids": session_id})).raise_for_status()
+            return session_id, memories
+
+    session_id, memories = asyncio.run(run())
+
+    assert all(memory is memories[0] for memory in memories)
+    history = api.session_store.get_history(session_id)
+    assert _contents(history)[0::2] == ["first", "elsewhere 0", "elsewhere 1", "last"]
+    assert _contents(memories[0].chat_memory.messages) == _contents(history)
@@ -0,0 +1,94 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+from benchmarks.fakes import FakeEmbeddings, FakePage, serve_page
+from utils.document_processing import process_url, refresh_url
+from utils.vectorstore_storage import load_vectorstore, stored_chunks
+
+URL_ID = "page"
+
+
+@pytest.fixture
+def page(tmp_path, monkeypatch):
+    # Data directories in config.settings are relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    os.makedirs(os.path.join("urls", URL_ID))
+    with open(os.path.join("urls", URL_ID, "metadata.json"), "w") as f:
+        json.dump({"id": URL_ID}, f)
+    page = FakePage(40)
+    server = serve_page(page)
+    page.url = f"http://127.0.0.1:{server.server_port}/page.html"
+    yield page
+    server.shutdown()
+
+
+def _metadata() -> dict:
+    with open(os.path.join("urls", URL_ID, "metadata.json")) as f:
+        return json.load(f)
+
+
+def _index_files() -> dict:
+    path = os.path.join("vectorstores", f"url_{URL_ID}")
+    return {name: os.stat(os.path.join(path, name)).st_mtime_ns for name in os.listdir(path)}
+
+
+def _texts(embeddings) -> list:
+    vectorstore = load_vectorstore(os.path.join("vectorstores", f"url_{URL_ID}"), embeddings)
+    return [doc.page_content for _, doc in stored_chunks(vectorstore)]
+
+
+def _add_and_refresh(page, embeddings) -> int:
+    """Index the page, refresh it and return how many texts the refresh embedded."""
+    assert asyncio.run(process_url(URL_ID, page.url, embeddings))
+    embedded = embeddings.texts_embedded
+    assert asyncio.run(refresh_url(URL_ID, page.url, embeddings))
+    return embeddings.texts_embedded - embedded
+
+
+def test_not_modified_leaves_the_index_untouched(page):
+    embeddings = FakeEmbeddings()
+    assert asyncio.run(process_url(URL_ID, page.url, embeddings))
+    files, embedded = _index_files(), embeddings.texts_embedded
+
+    assert asyncio.run(refresh_url(URL_ID, page.url, embeddings))
+
+    assert page.not_modified == 1
+    assert embeddings.texts_embedded == embedded
+    assert _index_files() == files
+    assert _metadata()["last_refresh"] == {"changed": False}
+
+
+def test_unchanged_body_embeds_nothing(page):
+    page.send_etag = False
+    embeddings = FakeEmbeddings()
+
+    assert _add_and_refresh(page, embeddings) == 0
+    assert page.not_modified == 0
+    assert _metadata()["last_refresh"]["changed"] is False
+
+
+def test_edited_paragraphs_reembed_only_their_chunks(page):
+    page.send_etag = False
+    embeddings = FakeEmbeddings()
+    assert asyncio.run(process_url(URL_ID, page.url, embeddings))
+    before = _texts(embeddings)
+
+    edited = [5, 20, 33]
+    for index in edited:
+        page.paragraphs[index] = f"Section {index} was rewritten. " * 20
+    embedded = embeddings.texts_embedded
+    assert asyncio.run(refresh_url(URL_ID, page.url, embeddings))
+
+    after = _texts(embeddings)
+    new = [text for text in after if text not in before]
+    assert new and all("rewritten" in text for text in new)
+    assert embeddings.texts_embedded - embedded == len(new)
+    # Chunks holding the old paragraphs are gone from the rebuilt index
+    for index in edited:
+        assert not any(f"Paragraph {index} sentence" in text for text in after)
+    summary = _metadata()["last_refresh"]
+    assert summary["added"] == len(new)
+    assert summary["removed"] == len([text for text in before if text not in after]) > 0
@@ -0,0 +1,93 @@
+import os
+
+from langchain_community.vectorstores import FAISS
+
+from benchmarks.fakes import FakeEmbeddings
+from utils.vectorstore_cache import VectorStoreCache
+from utils.vectorstore_storage import load_vectorstore, save_vectorstore
+
+
+def _save_stores(tmp_path, count: int) -> list:
+    embeddings = FakeEmbeddings()
+    paths = []
+    for i in range(count):
+        path = str(tmp_path / f"store-{i}")
+        save_vectorstore(FAISS.from_texts([f"Store {i} chunk {j}." for j in range(50)], embeddings), path)
+        paths.append(path)
+    return paths
+
+
+def _open_fds() -> int:
+    return len(os.listdir("/proc/self/fd"))
+
+
+def test_memory_mapped_stores_count_against_the_budget(tmp_path):
+    embeddings = FakeEmbeddings()
+    paths = _save_stores(tmp_path, 20)
+    cache = VectorStoreCache(max_bytes=1024 * 1024)
+    fds = _open_fds()
+
+    for path in paths:
+        cache.get(path, lambda p: load_vectorstore(p, embeddings)).similarity_search("chunk", k=2)
+
+    assert cache.stats()["bytes"] <= cache.max_bytes
+    assert cache.stats()["evictions"] == 20 - len(cache)
+    # Only the stores still cached hold a connection and a mapping
+    assert _open_fds() - fds <= 2 * len(cache)
+
+
+def test_entry_cap(tmp_path):
+    embeddings = FakeEmbeddings()
+    cache = VectorStoreCache(max_bytes=1 << 40, max_entries=3)
+    for path in _save_stores(tmp_path, 5):
+        cache.get(path, lambda p: load_vectorstore(p, embeddings))
+    assert len(cache) == 3
+
+
+def test_evicted_store_still_answers(tmp_path):
+    embeddings = FakeEmbeddings()
+    first, second = _save_stores(tmp_path, 2)
+    cache = VectorStoreCache(max_bytes=1 << 40, max_entries=1)
+    # A request may still hold a store after it was evicted
+    in_use = cache.get(first, lambda p: load_vectorstore(p, embeddings))
+    cache.get(second, lambda p: load_vectorstore(p, embeddings))
+    assert len(in_use.similarity_search("Store 0", k=3)) == 3
+
+
+def test_held_store_keeps_its_files_when_rebuilt(tmp_path):
+    embeddings = FakeEmbeddings()
+    (path,) = _save_stores(tmp_path, 1)
+    cache = VectorStoreCache(max_bytes=1 << 40)
+    in_use = cache.get(path, lambda p: load_vectorstore(p, embeddings))
+    in_use.similarity_search("chunk", k=2)
+
+    # A refresh replaces the files and drops the cached store while a request still holds it
+    save_vectorstore(FAISS.from_texts([f"Rebuilt chunk {j}." for j in range(80)], embeddings), path)
+    cache.invalidate(path)
+
+    results = in_use.similarity_search("Store 0 chunk 7.", k=50)
+    assert len(results) == 50
+    assert all(doc.page_content.startswith("Store 0 ") for doc in results)
+    assert cache.get(path, lambda p: load_vectorstore(p, embeddings)).index.ntotal == 80
+
+
+def test_on_stale_only_for_rebuilt_stores(tmp_path):
+    embeddings = FakeEmbeddings()
+    first, second = _save_stores(tmp_path, 2)
+    versions = {first: 1, second: 1}
+    rebuilt = []
+    cache = VectorStoreCache(max_bytes=1 << 40, max_entries=1, version=versions.get, on_stale=rebuilt.append)
+    load = lambda p: load_vectorstore(p, embeddings)
+
+    cache.get(first, load)
+    cache.get(second, load)
+    # Evicted and loaded again at the same version: a plain miss
+    cache.get(first, load)
+    assert rebuilt == []
+
+    # Rebuilt while cached, and rebuilt while evicted
+    versions[first] = versions[second] = 2
+    cache.get(first, load)
+    cache.get(second, load)
+    assert rebuilt == [first, second]
+    assert cache.stats()["stale"] == 2
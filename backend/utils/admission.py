@@ -0,0 +1,147 @@
+import asyncio
+import math
+import time
+from collections import Counter, OrderedDict, deque
+from typing import Awaitable, Callable, Optional
+
+# How often a queued request checks whether its client is still connected, in seconds
+DISCONNECT_POLL_INTERVAL = 0.25
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request is turned away instead of answered, with a Retry-After estimate in seconds."""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"Server is busy ({reason.replace('_', ' ')}), retry in {retry_after}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """A request's place in an admission queue, and then its slot until released."""
+
+    def __init__(self, controller: "AdmissionController", key: str):
+        self.controller = controller
+        self.key = key
+        self.enqueued_at = time.monotonic()
+        self.admitted_at = None
+        self.released = False
+        self._granted = asyncio.get_running_loop().create_future()
+
+    async def wait(self, timeout: float, is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None) -> float:
+        """Wait until the request is admitted; returns the seconds it waited.
+
+        Raises AdmissionRejected, giving up the place in the queue, once the request has
+        waited `timeout` seconds or is_disconnected() reports that its client went away.
+        """
+        deadline = self.enqueued_at + timeout
+        while not self._granted.done():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.controller.drop(self, "queue_timeout")
+            try:
+                await asyncio.wait_for(asyncio.shield(self._granted), min(remaining, DISCONNECT_POLL_INTERVAL))
+            except asyncio.TimeoutError:
+                if is_disconnected is not None and await is_disconnected():
+                    self.controller.drop(self, "client_disconnected")
+        return self.admitted_at - self.enqueued_at
+
+    def release(self):
+        """Leave the queue or free the slot; safe to call more than once."""
+        self.controller.release(self)
+
+
+class AdmissionController:
+    """Caps concurrently running LLM-bound requests and queues the rest fairly.
+
+    Waiting requests are kept in one FIFO per fairness key (the device, or the session
+    for anonymous clients) and freed slots are handed out round-robin over the keys, so
+    a client sending many requests at once only delays itself. The queues are bounded:
+    beyond them requests are rejected immediately with a Retry-After estimate, instead
+    of adding to everyone's latency. max_active <= 0 admits everything at once.
+    """
+
+    def __init__(self, max_active: int, max_queue: int, max_queue_per_key: int):
+        self.max_active = max_active
+        self.max_queue = max_queue
+        self.max_queue_per_key = max_queue_per_key
+        self.active = 0
+        self.queued = 0
+        self.counts = Counter()
+        self._queues = OrderedDict()  # key -> deque of waiting tickets, in round-robin order
+        # Moving average of how long a request holds its slot, for Retry-After estimates
+        self._hold_seconds = 1.0
+
+    def check(self, key: str):
+        """Raise AdmissionRejected if a request for key would be rejected right now, without queueing it."""
+        if self.max_active <= 0 or (self.active < self.max_active and not self.queued):
+            return
+        queue = self._queues.get(key)
+        if self.queued >= self.max_queue:
+            self._reject("queue_full")
+        if queue is not None and len(queue) >= self.max_queue_per_key:
+            self._reject("device_queue_full")
+
+    def enqueue(self, key: str) -> Ticket:
+        """Take a slot if one is free, else a place in key's queue; raises AdmissionRejected if that is full."""
+        self.check(key)
+        ticket = Ticket(self, key)
+        if self.max_active <= 0 or (self.active < self.max_active and not self.queued):
+            self._admit(ticket)
+        else:
+            self._queues.setdefault(key, deque()).append(ticket)
+            self.queued += 1
+        return ticket
+
+    def release(self, ticket: Ticket):
+        if ticket.released:
+            return
+        ticket.released = True
+        if ticket.admitted_at is None:
+            queue = self._queues[ticket.key]
+            queue.remove(ticket)
+            self.queued -= 1
+            if not queue:
+                del self._queues[ticket.key]
+            return
+
+        self.active -= 1
+        self._hold_seconds = 0.8 * self._hold_seconds + 0.2 * (time.monotonic() - ticket.admitted_at)
+        while self._queues and (self.max_active <= 0 or self.active < self.max_active):
+            key, queue = next(iter(self._queues.items()))
+            self.queued -= 1
+            self._admit(queue.popleft())
+            # The key goes to the back of the line, or out of it once it has nobody waiting
+            if queue:
+                self._queues.move_to_end(key)
+            else:
+                del self._queues[key]
+
+    def drop(self, ticket: Ticket, reason: str):
+        """Give up a queued request's place and raise AdmissionRejected for it."""
+        self.release(ticket)
+        self._reject(reason)
+
+    def retry_after(self) -> int:
+        """Seconds until the current queue has likely drained."""
+        slots = max(self.max_active, 1)
+        return max(1, math.ceil(self._hold_seconds * (self.queued + 1) / slots))
+
+    def _admit(self, ticket: Ticket):
+        self.active += 1
+        self.counts["admitted"] += 1
+        ticket.admitted_at = time.monotonic()
+        ticket._granted.set_result(None)
+
+    def _reject(self, reason: str):
+        self.counts[reason] += 1
+        raise AdmissionRejected(reason, self.retry_after())
+
+    def stats(self) -> dict:
+        return {
+            "active": self.active,
+            "queued": self.queued,
+            "max_active": self.max_active,
+            "max_queue": self.max_queue,
+            **self.counts,
+        }
@@ -0,0 +1,127 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterable, List, Optional
+
+import numpy as np
+
+
+def normalize_question(question: str) -> str:
+    """Lower-case a question, collapse whitespace and drop trailing punctuation."""
+    return re.sub(r"\s+", " ", question.strip().lower()).rstrip("?!. ")
+
+
+def _unit(vector: np.ndarray) -> np.ndarray:
+    return vector / (np.linalg.norm(vector) or 1.0)
+
+
+class AnswerCache:
+    """TTL + LRU cache of answers to first-turn questions, scoped by the documents searched.
+
+    Lookups match the normalized question exactly and, when a similarity threshold is
+    set and a query embedding is given, fall back to the most similar cached question
+    in the same scope. Each scope keeps its questions' normalized embeddings in one
+    matrix, so that fallback is a single matrix-vector product.
+    """
+
+    def __init__(self, max_entries: int, ttl: float, similarity_threshold: float = 0.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self._entries = OrderedDict()  # (scope, normalized question) -> entry dict
+        # scope -> keys of its entries with an embedding, their unit vectors and the stacked matrix (None when stale)
+        self._scope_vectors = {}
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def scope_for(vectorstore_ids: Iterable[str]) -> frozenset:
+        return frozenset(vectorstore_ids)
+
+    def get(self, scope: frozenset, question: str, embedding: Optional[List[float]] = None) -> Optional[dict]:
+        key = (scope, normalize_question(question))
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and now - entry["created_at"] > self.ttl:
+                self._remove(key)
+                entry = None
+            if entry:
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                return entry
+
+            if embedding is not None and self.similarity_threshold > 0:
+                entry = self._most_similar(scope, np.asarray(embedding, dtype=np.float32), now)
+                if entry:
+                    self.similar_hits += 1
+                    return entry
+
+            self.misses += 1
+            return None
+
+    def _most_similar(self, scope: frozenset, embedding: np.ndarray, now: float) -> Optional[dict]:
+        vectors = self._scope_vectors.get(scope)
+        if not vectors:
+            return None
+        if vectors["matrix"] is None:
+            vectors["matrix"] = np.vstack(vectors["unit"])
+        similarities = vectors["matrix"] @ _unit(embedding)
+        candidates = np.flatnonzero(similarities >= self.similarity_threshold)
+        # Most similar first; expired entries are skipped and left for eviction
+        for position in candidates[np.argsort(-similarities[candidates], kind="stable")]:
+            entry = self._entries[vectors["keys"][position]]
+            if now - entry["created_at"] <= self.ttl:
+                return entry
+        return None
+
+    def put(self, scope: frozenset, question: str, answer: str, source_documents: list,
+            embedding: Optional[List[float]] = None):
+        key = (scope, normalize_question(question))
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = {
+                "answer": answer,
+                "source_documents": source_documents,
+                "created_at": time.monotonic()
+            }
+            if embedding is not None:
+                vectors = self._scope_vectors.setdefault(scope, {"keys": [], "unit": [], "matrix": None})
+                vectors["keys"].append(key)
+                vectors["unit"].append(_unit(np.asarray(embedding, dtype=np.float32)))
+                vectors["matrix"] = None
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, vectorstore_id: str):
+        """Drop every answer that was produced from the given vector store."""
+        with self._lock:
+            for key in [key for key in self._entries if vectorstore_id in key[0]]:
+                self._remove(key)
+
+    def _remove(self, key):
+        """Drop an entry and its embedding; called with the lock held."""
+        del self._entries[key]
+        vectors = self._scope_vectors.get(key[0])
+        if vectors and key in vectors["keys"]:
+            position = vectors["keys"].index(key)
+            del vectors["keys"][position], vectors["unit"][position]
+            vectors["matrix"] = None
+            if not vectors["keys"]:
+                del self._scope_vectors[key[0]]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "exact_hits": self.exact_hits,
+                "similar_hits": self.similar_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
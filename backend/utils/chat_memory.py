@@ -0,0 +1,168 @@
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import UUID
+
+from langchain.memory import (
+    ConversationBufferMemory, ConversationSummaryBufferMemory, ConversationTokenBufferMemory
+)
+from langchain_core.callbacks import AsyncCallbackHandler
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from langchain_core.outputs import LLMResult
+from langchain_core.tracers.context import register_configure_hook
+
+# Conversation memory modes; see CHAT_MEMORY_MODE
+MEMORY_MODES = ("buffer", "window", "summary")
+
+# Token totals over all answered turns, reported by /cache/stats
+token_usage = Counter()
+
+# TokenUsage of the turn being answered. LangChain adds it to every LLM call made in this context, including
+# the summaries memories write outside the chain's callbacks (it is never added twice to the same call).
+_turn_usage: ContextVar = ContextVar("senseai_turn_usage", default=None)
+register_configure_hook(_turn_usage, inheritable=True)
+
+
+class TokenWindowMemory(ConversationTokenBufferMemory):
+    """ConversationTokenBufferMemory that also prunes when saved through the async API."""
+
+    def prune(self):
+        messages = self.chat_memory.messages
+        total = self.llm.get_num_tokens_from_messages(messages)
+        if total <= self.max_token_limit:
+            return
+        # Each message is counted once and taken off a running total, instead of re-counting the rest per drop
+        overhead = self.llm.get_num_tokens_from_messages([])
+        drop = 0
+        while drop < len(messages) and total > self.max_token_limit:
+            total -= self.llm.get_num_tokens_from_messages([messages[drop]]) - overhead
+            drop += 1
+        del messages[:drop]
+
+    async def asave_context(self, inputs: Dict[str, Any], outputs: Dict[str, str]) -> None:
+        await super().asave_context(inputs, outputs)
+        self.prune()
+
+
+def build_memory(mode: str, llm, max_tokens: int):
+    """Create an empty conversation memory for a session.
+
+    "buffer" keeps the whole history, "window" only the most recent messages that fit
+    in max_tokens, and "summary" also folds the older ones into a rolling summary.
+    """
+    if mode not in MEMORY_MODES:
+        raise ValueError(f"Unknown chat memory mode {mode!r}, expected one of {', '.join(MEMORY_MODES)}")
+    if mode == "summary":
+        return ConversationSummaryBufferMemory(
+            llm=llm, max_token_limit=max_tokens, memory_key="chat_history", return_messages=True
+        )
+    if mode == "window":
+        return TokenWindowMemory(
+            llm=llm, max_token_limit=max_tokens, memory_key="chat_history", return_messages=True
+        )
+    return ConversationBufferMemory(memory_key="chat_history", return_messages=True)
+
+
+def _history_messages(history: List[dict]) -> List[BaseMessage]:
+    messages = []
+    for message in history:
+        if message["role"] == "user":
+            messages.append(HumanMessage(content=message["content"]))
+        elif message["role"] == "assistant":
+            messages.append(AIMessage(content=message["content"]))
+    return messages
+
+
+async def restore_memory(memory, history: List[dict]):
+    """Add persisted messages to a memory in one operation, then apply its token budget.
+
+    The budgeted memories only prune when an exchange is saved, so this does the same
+    once for the restored messages ("summary" mode may call the LLM to summarise them).
+    """
+    memory.chat_memory.add_messages(_history_messages(history))
+    if isinstance(memory, ConversationSummaryBufferMemory):
+        await memory.aprune()
+    elif isinstance(memory, TokenWindowMemory):
+        memory.prune()
+
+
+def has_history(memory) -> bool:
+    return bool(memory.chat_memory.messages or getattr(memory, "moving_summary_buffer", ""))
+
+
+@contextmanager
+def counting_tokens(usage: "TokenUsage"):
+    """Count the tokens of every LLM call made inside the block on usage."""
+    token = _turn_usage.set(usage)
+    try:
+        yield usage
+    finally:
+        try:
+            _turn_usage.reset(token)
+        except ValueError:
+            # Left from another context, e.g. an abandoned response stream finalised later; nothing to undo there
+            pass
+
+
+def _reported_usage(response: LLMResult) -> Optional[Tuple[int, int]]:
+    """(prompt, completion) tokens as reported by the provider, or None if it reported none."""
+    usage = (response.llm_output or {}).get("token_usage")
+    if usage:
+        return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+    # Streamed calls carry the usage on the aggregated message instead
+    reported = [
+        generation.message.usage_metadata
+        for generations in response.generations for generation in generations
+        if getattr(getattr(generation, "message", None), "usage_metadata", None)
+    ]
+    if not reported:
+        return None
+    return sum(usage["input_tokens"] for usage in reported), sum(usage["output_tokens"] for usage in reported)
+
+
+class TokenUsage(AsyncCallbackHandler):
+    """Counts prompt and completion tokens of the LLM calls made while answering one turn.
+
+    Uses the counts the provider returns with each call; only calls that come back
+    without them are tokenized locally.
+    """
+
+    # Only adds up numbers, so LangChain can await it in place instead of creating a task per event
+    run_inline = True
+
+    def __init__(self, llm):
+        self.llm = llm
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.llm_calls = 0
+        self._prompts = {}  # run id -> prompt messages, kept for the estimate
+
+    async def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[BaseMessage]],
+                                  *, run_id: UUID, **kwargs: Any) -> None:
+        self.llm_calls += 1
+        self._prompts[run_id] = messages
+
+    async def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        prompts = self._prompts.pop(run_id, [])
+        reported = _reported_usage(response)
+        if reported is not None:
+            prompt_tokens, completion_tokens = reported
+        else:
+            prompt_tokens = sum(self.llm.get_num_tokens_from_messages(prompt) for prompt in prompts)
+            completion_tokens = sum(
+                self.llm.get_num_tokens(generation.text)
+                for generations in response.generations for generation in generations
+            )
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+
+    async def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._prompts.pop(run_id, None)
+
+    def to_dict(self) -> dict:
+        return {
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "llm_calls": self.llm_calls
+        }
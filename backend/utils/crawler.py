@@ -0,0 +1,219 @@
+import asyncio
+import time
+import xml.etree.ElementTree as ET
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from urllib.parse import urldefrag, urljoin, urlparse
+from urllib.robotparser import RobotFileParser
+
+import httpx
+from bs4 import BeautifulSoup
+from langchain_core.documents import Document
+
+# Nested sitemap indexes are followed at most this deep
+MAX_SITEMAP_DEPTH = 3
+
+
+def html_to_document(html: str, url: str) -> Document:
+    """Extract a page's text and the same metadata WebBaseLoader records."""
+    return _parse_page(html, url, with_links=False)[0]
+
+
+def _parse_page(html: str, url: str, with_links: bool = True) -> Tuple[Document, List[str]]:
+    soup = BeautifulSoup(html, "html.parser")
+    metadata = {"source": url}
+    if title := soup.find("title"):
+        metadata["title"] = title.get_text()
+    if description := soup.find("meta", attrs={"name": "description"}):
+        metadata["description"] = description.get("content", "No description found.")
+    if page := soup.find("html"):
+        metadata["language"] = page.get("lang", "No language found.")
+
+    links = []
+    if with_links:
+        for anchor in soup.find_all("a", href=True):
+            link = urldefrag(urljoin(url, anchor["href"]))[0]
+            if urlparse(link).scheme in ("http", "https"):
+                links.append(link)
+    return Document(page_content=soup.get_text(), metadata=metadata), links
+
+
+def _host_allowed(url: str, allowed_domains: List[str]) -> bool:
+    host = urlparse(url).hostname or ""
+    return any(host == domain or host.endswith("." + domain) for domain in allowed_domains)
+
+
+class SiteCrawler:
+    """Concurrent crawler for one site, over a pooled async HTTP client.
+
+    Pages come from a sitemap and/or breadth-first link following from a root URL,
+    limited by depth, page count and allowed domains. Requests respect robots.txt
+    (including Crawl-delay) and a per-host concurrency cap.
+    """
+
+    def __init__(self, max_connections: int, per_host: int, timeout: float, user_agent: str):
+        self.max_connections = max_connections
+        self.per_host = per_host
+        self.timeout = timeout
+        self.user_agent = user_agent
+        self._host_slots: Dict[str, asyncio.Semaphore] = {}
+        # Earliest time (event loop clock) the next request to a host with a Crawl-delay may start
+        self._host_next_start: Dict[str, float] = {}
+        self._robots: Dict[str, Optional[RobotFileParser]] = {}
+        self._robots_locks: Dict[str, asyncio.Lock] = {}
+        self.stats = {"fetched": 0, "failed": 0, "robots_blocked": 0, "skipped": 0, "duration": 0.0}
+
+    async def crawl(self, root_url: Optional[str] = None, sitemap_url: Optional[str] = None, max_depth: int = 2,
+                    max_pages: int = 100, allowed_domains: Optional[List[str]] = None) -> AsyncIterator[Document]:
+        """Yield one Document per fetched HTML page, as soon as it is fetched."""
+        seeds = [url for url in (root_url, sitemap_url) if url]
+        if not seeds:
+            raise ValueError("A root URL or a sitemap URL is required")
+        allowed_domains = allowed_domains or [urlparse(seed).hostname for seed in seeds]
+
+        # Bounded, so fetching pauses while the consumer is busy embedding
+        pages: asyncio.Queue = asyncio.Queue(maxsize=2 * self.max_connections)
+        producer = asyncio.create_task(
+            self._run(pages, root_url, sitemap_url, max_depth, max_pages, allowed_domains)
+        )
+        try:
+            # No end-of-crawl sentinel: the producer finishing is the signal, so it never blocks on a full queue
+            while not (producer.done() and pages.empty()):
+                getter = asyncio.ensure_future(pages.get())
+                await asyncio.wait({getter, producer}, return_when=asyncio.FIRST_COMPLETED)
+                if getter.done():
+                    yield getter.result()
+                else:
+                    getter.cancel()
+            # Surface crawl errors such as an unreachable sitemap
+            await producer
+        finally:
+            if not producer.done():
+                producer.cancel()
+
+    async def _run(self, pages, root_url, sitemap_url, max_depth, max_pages, allowed_domains):
+        started = time.perf_counter()
+        limits = httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections)
+        headers = {"User-Agent": self.user_agent}
+        try:
+            async with httpx.AsyncClient(limits=limits, headers=headers, timeout=self.timeout,
+                                         follow_redirects=True) as client:
+                frontier: asyncio.Queue = asyncio.Queue()
+                seen = set()
+                # Pages requested so far; URLs blocked by robots.txt don't use up the budget
+                attempts = 0
+
+                def schedule(url: str, depth: int):
+                    if url in seen or attempts >= max_pages or not _host_allowed(url, allowed_domains):
+                        return
+                    seen.add(url)
+                    frontier.put_nowait((url, depth))
+
+                if sitemap_url:
+                    # Sitemap pages are listed explicitly, so their links are not followed
+                    for url in await self._sitemap_urls(client, sitemap_url, MAX_SITEMAP_DEPTH):
+                        schedule(url, max_depth)
+                if root_url:
+                    schedule(root_url, 0)
+
+                async def worker():
+                    nonlocal attempts
+                    while True:
+                        url, depth = await frontier.get()
+                        try:
+                            robots = await self._robots_for(client, url)
+                            if robots is not None and not robots.can_fetch(self.user_agent, url):
+                                self.stats["robots_blocked"] += 1
+                                continue
+                            if attempts >= max_pages:
+                                continue
+                            attempts += 1
+                            result = await self._fetch_page(client, url, robots)
+                            if result is not None:
+                                document, links = result
+                                await pages.put(document)
+                                if depth < max_depth:
+                                    for link in links:
+                                        schedule(link, depth + 1)
+                        except Exception as e:
+                            print(f"Error crawling {url}: {e}")
+                            self.stats["failed"] += 1
+                        finally:
+                            frontier.task_done()
+
+                workers = [asyncio.create_task(worker()) for _ in range(self.max_connections)]
+                try:
+                    await frontier.join()
+                finally:
+                    for task in workers:
+                        task.cancel()
+        finally:
+            self.stats["duration"] = round(time.perf_counter() - started, 4)
+
+    async def _fetch_page(self, client: httpx.AsyncClient, url: str, robots: Optional[RobotFileParser]):
+        host = urlparse(url).netloc
+        slots = self._host_slots.setdefault(host, asyncio.Semaphore(self.per_host))
+        async with slots:
+            delay = robots.crawl_delay(self.user_agent) if robots is not None else None
+            if delay:
+                await self._wait_for_turn(host, float(delay))
+            try:
+                response = await client.get(url)
+                response.raise_for_status()
+            except httpx.HTTPError as e:
+                print(f"Error crawling {url}: {e}")
+                self.stats["failed"] += 1
+                return None
+
+        if "html" not in response.headers.get("content-type", "text/html"):
+            self.stats["skipped"] += 1
+            return None
+        self.stats["fetched"] += 1
+        # HTML parsing is CPU bound; keep it off the event loop
+        return await asyncio.to_thread(_parse_page, response.text, str(response.url))
+
+    async def _wait_for_turn(self, host: str, delay: float):
+        """Space request starts to a host at least `delay` seconds apart, whatever its concurrency cap."""
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        # Reserved before sleeping, so concurrent requests take consecutive turns
+        start = max(now, self._host_next_start.get(host, now))
+        self._host_next_start[host] = start + delay
+        await asyncio.sleep(start - now)
+
+    async def _robots_for(self, client: httpx.AsyncClient, url: str) -> Optional[RobotFileParser]:
+        """robots.txt rules of a URL's host, fetched once per host. None means allow all."""
+        parsed = urlparse(url)
+        origin = f"{parsed.scheme}://{parsed.netloc}"
+        async with self._robots_locks.setdefault(origin, asyncio.Lock()):
+            if origin not in self._robots:
+                self._robots[origin] = await self._fetch_robots(client, origin)
+        return self._robots[origin]
+
+    async def _fetch_robots(self, client: httpx.AsyncClient, origin: str) -> Optional[RobotFileParser]:
+        robots = RobotFileParser(origin + "/robots.txt")
+        try:
+            response = await client.get(origin + "/robots.txt")
+        except httpx.HTTPError:
+            return None
+        # Same rules as RobotFileParser.read: auth errors block everything, other 4xx allow everything
+        if response.status_code in (401, 403):
+            robots.disallow_all = True
+        elif response.status_code >= 400:
+            return None
+        else:
+            robots.parse(response.text.splitlines())
+        return robots
+
+    async def _sitemap_urls(self, client: httpx.AsyncClient, sitemap_url: str, depth: int) -> List[str]:
+        response = await client.get(sitemap_url)
+        response.raise_for_status()
+        root = ET.fromstring(response.content)
+        locations = [element.text.strip() for element in root.iter() if element.tag.endswith("loc") and element.text]
+        if not root.tag.endswith("sitemapindex"):
+            return locations
+
+        urls = []
+        if depth > 0:
+            for nested in await asyncio.gather(*(self._sitemap_urls(client, url, depth - 1) for url in locations)):
+                urls.extend(nested)
+        return urls
@@ -0,0 +1,102 @@
+import base64
+import json
+import os
+import sqlite3
+import threading
+from typing import List, Optional, Tuple
+
+
+def encode_cursor(uploaded_at: str, doc_id: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps([uploaded_at, doc_id]).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """Decode a pagination cursor, raising ValueError if it is malformed."""
+    try:
+        uploaded_at, doc_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    return uploaded_at, doc_id
+
+
+class DocumentCatalog:
+    """Index of document and URL metadata, so listings never touch the per-document directories.
+
+    Kept up to date at upload/add/delete and when processing finishes; metadata.json
+    files remain the source of truth the catalog can be rebuilt from.
+    """
+
+    def __init__(self, db_path: str):
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS documents (
+                id TEXT PRIMARY KEY,
+                device_id TEXT,
+                uploaded_at TEXT NOT NULL,
+                metadata TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS documents_by_device ON documents (device_id, uploaded_at, id);
+            CREATE INDEX IF NOT EXISTS documents_by_date ON documents (uploaded_at, id);
+        """)
+
+    def upsert_many(self, documents: List[dict]):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO documents (id, device_id, uploaded_at, metadata) VALUES (?, ?, ?, ?)",
+                [(doc["id"], doc.get("device_id"), doc.get("uploadedAt") or "", json.dumps(doc)) for doc in documents]
+            )
+            self._conn.execute("COMMIT")
+
+    def upsert(self, metadata: dict):
+        self.upsert_many([metadata])
+
+    def get(self, doc_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT metadata FROM documents WHERE id = ?", (doc_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def delete(self, doc_id: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM documents WHERE id = ?", (doc_id,))
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def list(self, device_id: Optional[str] = None, limit: Optional[int] = None, cursor: Optional[str] = None,
+             order: str = "desc") -> Tuple[List[dict], Optional[str]]:
+        """Return a page of documents sorted by uploadedAt, and the cursor of the next page.
+
+        Uses keyset pagination on (uploadedAt, id), so deep pages cost the same as the first.
+        """
+        descending = order == "desc"
+        clauses, params = [], []
+        if device_id is not None:
+            clauses.append("device_id = ?")
+            params.append(device_id)
+        if cursor:
+            clauses.append(f"(uploaded_at, id) {'<' if descending else '>'} (?, ?)")
+            params.extend(decode_cursor(cursor))
+
+        direction = "DESC" if descending else "ASC"
+        query = "SELECT id, uploaded_at, metadata FROM documents"
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        query += f" ORDER BY uploaded_at {direction}, id {direction}"
+        if limit is not None:
+            # Fetch one extra row to know whether there is a next page
+            query += " LIMIT ?"
+            params.append(limit + 1)
+
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+
+        next_cursor = None
+        if limit is not None and len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1][1], rows[-1][0])
+        return [json.loads(row[2]) for row in rows], next_cursor
@@ -1,176 +1,761 @@
 import os
 import json
-import shutil
+import time
+import asyncio
+import math
 import datetime
+from collections import defaultdict
+from contextlib import contextmanager
+import faiss
+import httpx
+import numpy as np
 from langchain_community.document_loaders import (
     PyPDFLoader,
     Docx2txtLoader,
     TextLoader,
     CSVLoader,
-    UnstructuredExcelLoader,
-    WebBaseLoader
+    UnstructuredExcelLoader
 )
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_openai import OpenAIEmbeddings
+from langchain_core.documents import Document
 from langchain.vectorstores import FAISS
-from config.settings import UPLOAD_DIR, VECTORSTORE_DIR, URL_DIR, SESSION_DATA_DIR, SESSION_METADATA_FILE, CHAT_SESSIONS_FILE
+from utils.vectorstore_storage import (
+    MmapFlatIndex, VectorStoreWriter, load_vectorstore, save_vectorstore, stored_chunks
+)
+from utils.crawler import SiteCrawler, html_to_document
+from config.settings import (
+    UPLOAD_DIR, VECTORSTORE_DIR, URL_DIR,
+    INGESTION_STREAMING_MIN_BYTES, INGESTION_EMBED_BATCH_SIZE,
+    INDEX_TYPE, INDEX_HNSW_MIN_CHUNKS, INDEX_QUANTIZED_MIN_CHUNKS, INDEX_QUANTIZED_TYPE,
+    URL_FETCH_TIMEOUT, URL_FETCH_USER_AGENT, CRAWL_CONCURRENCY, CRAWL_PER_HOST_CONCURRENCY
+)
 
+# Characters per block when streaming plain text files
+TEXT_STREAM_BLOCK_SIZE = 64 * 1024
+# How often the parent checks the spool file for new chunks
+SPOOL_POLL_INTERVAL = 0.05
 
-async def process_document(doc_id: str, file_path: str, file_extension: str, embeddings):
-    try:
-        # Load document based on file type
-        if file_extension == ".pdf":
-            loader = PyPDFLoader(file_path)
-        elif file_extension in [".docx", ".doc"]:
-            loader = Docx2txtLoader(file_path)
-        elif file_extension == ".txt":
-            loader = TextLoader(file_path)
-        elif file_extension == ".csv":
-            loader = CSVLoader(file_path)
-        elif file_extension in [".xlsx", ".xls"]:
-            loader = UnstructuredExcelLoader(file_path)
-        else:
-            raise ValueError(f"Unsupported file type: {file_extension}")
 
-        # Load the document
-        documents = loader.load()
+def _get_text_splitter():
+    return RecursiveCharacterTextSplitter(
+        chunk_size=1000,
+        chunk_overlap=200
+    )
+
+
+# Extensions _get_loader can parse
+SUPPORTED_EXTENSIONS = (".pdf", ".docx", ".doc", ".txt", ".csv", ".xlsx", ".xls")
+
+
+def _get_loader(file_path: str, file_extension: str):
+    # Load document based on file type
+    if file_extension == ".pdf":
+        return PyPDFLoader(file_path)
+    elif file_extension in [".docx", ".doc"]:
+        return Docx2txtLoader(file_path)
+    elif file_extension == ".txt":
+        return TextLoader(file_path)
+    elif file_extension == ".csv":
+        return CSVLoader(file_path)
+    elif file_extension in [".xlsx", ".xls"]:
+        return UnstructuredExcelLoader(file_path)
+    else:
+        raise ValueError(f"Unsupported file type: {file_extension}")
+
+
+def load_and_split_document(file_path: str, file_extension: str):
+    """Parse a file and split it into chunks.
+
+    Runs in the ingestion process pool, so it must stay a picklable top-level function.
+    """
+    # Load the document and split it into chunks
+    documents = _get_loader(file_path, file_extension).load()
+    return _get_text_splitter().split_documents(documents)
 
-        # Split the document into chunks
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200
+
+def _iter_text_blocks(file_path: str):
+    file_size = max(os.path.getsize(file_path), 1)
+    consumed = 0
+    with open(file_path, "r") as f:
+        while block := f.read(TEXT_STREAM_BLOCK_SIZE):
+            consumed += len(block.encode("utf-8", errors="ignore"))
+            yield Document(page_content=block, metadata={"source": file_path}), min(consumed / file_size, 1.0)
+
+
+def _iter_excel_rows(file_path: str, rows_per_page: int = 200):
+    # Read-only mode streams rows instead of building the whole workbook in memory
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        total_rows = max(sum(sheet.max_row or 0 for sheet in workbook.worksheets), 1)
+        done = 0
+        for sheet in workbook.worksheets:
+            lines = []
+            for row in sheet.iter_rows(values_only=True):
+                done += 1
+                lines.append(" ".join(str(value) for value in row if value is not None))
+                if len(lines) >= rows_per_page:
+                    yield Document(page_content="\n".join(lines),
+                                   metadata={"source": file_path, "sheet": sheet.title}), min(done / total_rows, 1.0)
+                    lines = []
+            if lines:
+                yield Document(page_content="\n".join(lines),
+                               metadata={"source": file_path, "sheet": sheet.title}), min(done / total_rows, 1.0)
+    finally:
+        workbook.close()
+
+
+def iter_document_pages(file_path: str, file_extension: str):
+    """Lazily yield (page document, fraction of the source consumed) for a file.
+
+    PDFs are read page by page, CSVs row by row, text files in blocks and spreadsheets in
+    row groups; other formats have no lazy reader and are loaded in one go.
+    """
+    if file_extension == ".pdf":
+        from pypdf import PdfReader
+
+        total_pages = max(len(PdfReader(file_path).pages), 1)
+        for i, page in enumerate(PyPDFLoader(file_path).lazy_load()):
+            yield page, min((i + 1) / total_pages, 1.0)
+    elif file_extension == ".csv":
+        with open(file_path, "rb") as f:
+            total_rows = max(sum(1 for _ in f) - 1, 1)
+        for i, row in enumerate(CSVLoader(file_path).lazy_load()):
+            yield row, min((i + 1) / total_rows, 1.0)
+    elif file_extension == ".txt":
+        yield from _iter_text_blocks(file_path)
+    elif file_extension == ".xlsx":
+        yield from _iter_excel_rows(file_path)
+    else:
+        documents = _get_loader(file_path, file_extension).load()
+        for i, document in enumerate(documents):
+            yield document, (i + 1) / len(documents)
+
+
+def spool_document_chunks(file_path: str, file_extension: str, spool_path: str) -> int:
+    """Split a file page by page into a JSON-lines spool file, flushing after every page.
+
+    Runs in the ingestion process pool; the parent tails the spool file and embeds chunks
+    while parsing continues, so neither process holds the whole document. Returns the
+    number of chunks written.
+    """
+    text_splitter = _get_text_splitter()
+    count = 0
+    with open(spool_path, "w") as spool:
+        for page, progress in iter_document_pages(file_path, file_extension):
+            for chunk in text_splitter.split_documents([page]):
+                spool.write(json.dumps({
+                    "text": chunk.page_content,
+                    "metadata": chunk.metadata,
+                    "progress": progress
+                }) + "\n")
+                count += 1
+            spool.flush()
+    return count
+
+
+async def _read_spooled_batches(spool_path: str, producer, batch_size: int):
+    """Yield (chunks, progress) batches from a spool file while producer is still writing it."""
+    while not os.path.exists(spool_path):
+        if producer.done():
+            producer.result()  # Surface the producer's error, if any
+            return
+        await asyncio.sleep(SPOOL_POLL_INTERVAL)
+
+    batch, progress = [], 0.0
+    with open(spool_path, "r") as spool:
+        while True:
+            position = spool.tell()
+            line = spool.readline()
+            if line.endswith("\n"):
+                record = json.loads(line)
+                batch.append(Document(page_content=record["text"], metadata=record["metadata"]))
+                progress = record["progress"]
+                if len(batch) >= batch_size:
+                    yield batch, progress
+                    batch = []
+                continue
+
+            # Reached the end of what was written so far
+            spool.seek(position)
+            if producer.done():
+                producer.result()
+                if spool.readline() == "":
+                    break
+                spool.seek(position)
+                continue
+            await asyncio.sleep(SPOOL_POLL_INTERVAL)
+
+    if batch:
+        yield batch, progress
+
+
+def fetch_url(url: str, etag: str = None, last_modified: str = None):
+    """Fetch a web page, conditionally when validators from an earlier fetch are given.
+
+    Returns (documents, validators), with documents None if the server answered
+    304 Not Modified. validators holds the response's ETag and Last-Modified.
+    """
+    headers = {"User-Agent": URL_FETCH_USER_AGENT}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+
+    response = httpx.get(url, headers=headers, follow_redirects=True, timeout=URL_FETCH_TIMEOUT)
+    if response.status_code == 304:
+        # A 304 may omit the validators; the ones we sent are still current then
+        return None, {
+            "etag": response.headers.get("etag", etag),
+            "last_modified": response.headers.get("last-modified", last_modified)
+        }
+    response.raise_for_status()
+    validators = {"etag": response.headers.get("etag"), "last_modified": response.headers.get("last-modified")}
+
+    return [html_to_document(response.text, url)], validators
+
+
+def load_and_split_url(url: str, etag: str = None, last_modified: str = None):
+    """Fetch a web page and split it into chunks. Returns (documents, chunks, validators).
+
+    documents and chunks are None if the page did not change since the given validators.
+    """
+    documents, validators = fetch_url(url, etag, last_modified)
+    if documents is None:
+        return None, None, validators
+    return documents, _get_text_splitter().split_documents(documents), validators
+
+
+async def embed_chunks(chunks, embeddings):
+    """Embed chunks, returning the vectors and how many were served from the embedding cache."""
+    texts = [chunk.page_content for chunk in chunks]
+    if hasattr(embeddings, "aembed_documents_with_stats"):
+        return await embeddings.aembed_documents_with_stats(texts)
+    return await embeddings.aembed_documents(texts), 0
+
+
+def index_chunks(chunks, vectors, embeddings, vectorstore_path: str, job=None):
+    """Build a FAISS index from already embedded chunks and save it.
+
+    Building is timed as the job's "indexing" stage and saving as "persisting".
+    Returns the index type chosen for the number of chunks.
+    """
+    index_type = choose_index_type(len(chunks))
+    with _stage(job, "indexing"):
+        vectorstore = FAISS.from_embeddings(
+            list(zip([chunk.page_content for chunk in chunks], vectors)),
+            embeddings,
+            metadatas=[chunk.metadata for chunk in chunks]
         )
-        chunks = text_splitter.split_documents(documents)
+        compact_vectorstore(vectorstore, index_type)
+    with _stage(job, "persisting"):
+        save_vectorstore(vectorstore, vectorstore_path)
+    return index_type
 
-        # Create a vector store
-        vectorstore = FAISS.from_documents(chunks, embeddings)
 
-        # Save the vector store
-        vectorstore_path = os.path.join(VECTORSTORE_DIR, doc_id)
-        vectorstore.save_local(vectorstore_path)
+INDEX_TYPES = ("flat", "hnsw", "sq8", "ivfpq")
 
-        # Update metadata with content size
-        doc_dir = os.path.join(UPLOAD_DIR, doc_id)
-        metadata_path = os.path.join(doc_dir, "metadata.json")
-        if os.path.exists(metadata_path):
-            with open(metadata_path, "r") as f:
-                metadata = json.load(f)
+# Search-time knobs; both are saved with the index
+HNSW_NEIGHBORS = 32
+HNSW_EF_SEARCH = 64
+IVF_NPROBE = 16
+# Fewer vectors than this can't train the 256 PQ centroids per subquantizer well
+IVFPQ_MIN_VECTORS = 10000
 
-            # Update with actual content size (sum of all chunks)
-            content_size = sum(len(chunk.page_content) for chunk in chunks)
-            metadata["size"] = content_size
 
-            with open(metadata_path, "w") as f:
-                json.dump(metadata, f)
+def choose_index_type(chunk_count: int, index_type: str = INDEX_TYPE) -> str:
+    """Pick the FAISS index type for a corpus of chunk_count chunks.
+
+    "auto" keeps exact flat search for small corpora, switches to HNSW above
+    INDEX_HNSW_MIN_CHUNKS and to a quantized index above INDEX_QUANTIZED_MIN_CHUNKS.
+    """
+    if index_type == "auto":
+        if chunk_count >= INDEX_QUANTIZED_MIN_CHUNKS:
+            index_type = INDEX_QUANTIZED_TYPE
+        elif chunk_count >= INDEX_HNSW_MIN_CHUNKS:
+            index_type = "hnsw"
+        else:
+            index_type = "flat"
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type: {index_type}")
+    if index_type == "ivfpq" and chunk_count < IVFPQ_MIN_VECTORS:
+        return "flat"
+    return index_type
+
+
+def _pq_subquantizers(dimension: int) -> int:
+    # About 8 dimensions per one-byte code, using a divisor of the dimension
+    for m in range(max(1, dimension // 8), 0, -1):
+        if dimension % m == 0:
+            return m
+    return 1
+
+
+def build_index(vectors: np.ndarray, index_type: str):
+    """Build a FAISS index of the given type holding vectors, all using L2 distance.
+
+    The L2 metric matches what FAISS.from_embeddings builds, so scores stay comparable
+    across documents indexed with different types.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    count, dimension = vectors.shape
+    if index_type == "flat":
+        index = faiss.IndexFlatL2(dimension)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dimension, HNSW_NEIGHBORS)
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+    elif index_type == "sq8":
+        index = faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_8bit)
+    elif index_type == "ivfpq":
+        # Enough points per list to train the coarse quantizer
+        nlist = max(1, min(int(4 * math.sqrt(count)), count // 39))
+        index = faiss.IndexIVFPQ(faiss.IndexFlatL2(dimension), dimension, nlist, _pq_subquantizers(dimension), 8)
+        index.nprobe = min(IVF_NPROBE, nlist)
+    else:
+        raise ValueError(f"Unknown index type: {index_type}")
+
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    return index
+
+
+def compact_vectorstore(vectorstore, index_type: str):
+    """Swap a vector store's flat index for one of index_type built from the same vectors."""
+    if index_type == "flat":
+        return vectorstore
+    vectors = vectorstore.index.reconstruct_n(0, vectorstore.index.ntotal)
+    vectorstore.index = build_index(vectors, index_type)
+    return vectorstore
+
+
+def update_metadata(metadata_path: str, updates: dict):
+    """Merge updates into a document's metadata.json if it exists."""
+    if not os.path.exists(metadata_path):
+        return None
+    with open(metadata_path, "r") as f:
+        metadata = json.load(f)
+    metadata.update(updates)
+    with open(metadata_path, "w") as f:
+        json.dump(metadata, f)
+    return metadata
+
+
+@contextmanager
+def _stage(job, name: str):
+    if job is None:
+        yield
+    else:
+        with job.stage(name):
+            yield
+
+
+async def process_document(doc_id: str, file_path: str, file_extension: str, embeddings, job=None, executor=None):
+    """Parse, embed and index an uploaded file.
+
+    Parsing runs on executor (the ingestion process pool) and progress is reported on
+    job when given. Files of at least INGESTION_STREAMING_MIN_BYTES are ingested in
+    streaming mode. Returns True on success.
+    """
+    metadata_path = os.path.join(UPLOAD_DIR, doc_id, "metadata.json")
+    vectorstore_path = os.path.join(VECTORSTORE_DIR, doc_id)
+    try:
+        if os.path.getsize(file_path) >= INGESTION_STREAMING_MIN_BYTES:
+            chunk_count, content_size, cached_chunks, index_type = await _ingest_streaming(
+                doc_id, file_path, file_extension, embeddings, vectorstore_path, job, executor
+            )
+        else:
+            chunk_count, content_size, cached_chunks, index_type = await _ingest_in_memory(
+                file_path, file_extension, embeddings, vectorstore_path, job, executor
+            )
+        print(f"Embedded {chunk_count} chunks for {doc_id}, {cached_chunks} served from cache")
+
+        # Update metadata with actual content size (sum of all chunks)
+        update_metadata(metadata_path, {
+            "size": content_size,
+            "chunks": chunk_count,
+            "cached_chunks": cached_chunks,
+            "index_type": index_type,
+            "status": "ready"
+        })
 
         return True
     except Exception as e:
         print(f"Error processing document: {e}")
+        if job is not None:
+            job.error = str(e)
+        update_metadata(metadata_path, {"status": "failed", "error": str(e)})
         return False
 
 
-async def process_url(url_id: str, url: str, embeddings):
-    try:
-        # Create a WebBaseLoader for the URL
-        loader = WebBaseLoader(url)
-
-        # Load the content
-        documents = loader.load()
+async def _ingest_in_memory(file_path, file_extension, embeddings, vectorstore_path, job, executor):
+    loop = asyncio.get_running_loop()
+    with _stage(job, "parsing"):
+        chunks = await loop.run_in_executor(executor, load_and_split_document, file_path, file_extension)
 
-        # Get content size
-        content_size = sum(len(doc.page_content) for doc in documents)
+    with _stage(job, "embedding"):
+        vectors, cached_chunks = await embed_chunks(chunks, embeddings)
 
-        # Update metadata with actual content size and title
-        url_dir = os.path.join(URL_DIR, url_id)
-        metadata_path = os.path.join(url_dir, "metadata.json")
+    # Create and save the vector store
+    index_type = await asyncio.to_thread(index_chunks, chunks, vectors, embeddings, vectorstore_path, job)
 
-        if os.path.exists(metadata_path):
-            with open(metadata_path, "r") as f:
-                metadata = json.load(f)
+    return len(chunks), sum(len(chunk.page_content) for chunk in chunks), cached_chunks, index_type
 
-            # Update size
-            metadata["size"] = content_size
 
-            # Try to extract title from first document
-            if documents and hasattr(documents[0], 'metadata') and 'title' in documents[0].metadata:
-                metadata["name"] = documents[0].metadata['title']
+async def _ingest_streaming(doc_id, file_path, file_extension, embeddings, vectorstore_path, job, executor):
+    """Embed and index a large file batch by batch while it is still being parsed.
 
-            with open(metadata_path, "w") as f:
-                json.dump(metadata, f)
+    Each batch's chunks and vectors are written to disk as soon as they are embedded,
+    so memory use depends on the batch size, not on the size of the document (except
+    for HNSW and quantized indexes, which are built in memory from the stored vectors).
+    """
+    loop = asyncio.get_running_loop()
+    spool_path = os.path.join(os.path.dirname(file_path), f".{doc_id}.chunks.jsonl")
+    producer = loop.run_in_executor(executor, spool_document_chunks, file_path, file_extension, spool_path)
+    if job is not None:
+        # Parsing overlaps with embedding here, so it is timed as the producer's wall time
+        job.status = "parsing"
+        parse_started = time.perf_counter()
+        producer.add_done_callback(lambda _: job.stages.__setitem__(
+            "parsing", {"duration": round(time.perf_counter() - parse_started, 4)}
+        ))
 
-        # Split the content into chunks
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200
-        )
-        chunks = text_splitter.split_documents(documents)
+    writer = await asyncio.to_thread(VectorStoreWriter, vectorstore_path)
+    finished = False
+    content_size = cached_chunks = 0
+    try:
+        async for batch, progress in _read_spooled_batches(spool_path, producer, INGESTION_EMBED_BATCH_SIZE):
+            with _stage(job, "embedding"):
+                vectors, cached = await embed_chunks(batch, embeddings)
+            with _stage(job, "indexing"):
+                await asyncio.to_thread(writer.add, batch, vectors)
+
+            content_size += sum(len(chunk.page_content) for chunk in batch)
+            cached_chunks += cached
+            if job is not None:
+                job.progress = progress
+                job.status = "parsing" if not producer.done() else "embedding"
+
+        if not writer.count:
+            raise ValueError("No content could be extracted from the document")
+
+        # The final index type is only known once all chunks are in
+        index_type = choose_index_type(writer.count)
+        index = None
+        if index_type != "flat":
+            with _stage(job, "indexing"):
+                index = await asyncio.to_thread(build_index, writer.vectors(), index_type)
+        with _stage(job, "persisting"):
+            await asyncio.to_thread(writer.finish, index)
+        finished = True
+    finally:
+        if not producer.done():
+            producer.cancel()
+        if os.path.exists(spool_path):
+            os.remove(spool_path)
+        if not finished:
+            await asyncio.to_thread(writer.discard)
+
+    return writer.count, content_size, cached_chunks, index_type
+
+
+async def process_documents(files, embeddings, jobs=None, executor=None):
+    """Parse, embed and index several uploaded files as one batch.
+
+    files is a list of (doc_id, file_path, file_extension). Files are parsed in
+    parallel and the chunks of all of them are embedded together, so small files
+    share embedding calls; each file still gets its own vector store. Files of at
+    least INGESTION_STREAMING_MIN_BYTES go through process_document instead.
+    Returns a dict of doc_id -> success.
+    """
+    jobs = {job.doc_id: job for job in jobs or []}
+    results = {}
+    small = []
+    for doc_id, file_path, file_extension in files:
+        if os.path.getsize(file_path) >= INGESTION_STREAMING_MIN_BYTES:
+            results[doc_id] = await process_document(
+                doc_id, file_path, file_extension, embeddings, job=jobs.get(doc_id), executor=executor
+            )
+        else:
+            small.append((doc_id, file_path, file_extension))
+
+    def fail(doc_id, error):
+        print(f"Error processing document {doc_id}: {error}")
+        if doc_id in jobs:
+            jobs[doc_id].error = str(error)
+        update_metadata(os.path.join(UPLOAD_DIR, doc_id, "metadata.json"), {"status": "failed", "error": str(error)})
+        results[doc_id] = False
+
+    loop = asyncio.get_running_loop()
+
+    async def parse(doc_id, file_path, file_extension):
+        with _stage(jobs.get(doc_id), "parsing"):
+            return await loop.run_in_executor(executor, load_and_split_document, file_path, file_extension)
+
+    parsed = await asyncio.gather(*(parse(*file) for file in small), return_exceptions=True)
+    batch = []
+    for (doc_id, _, _), chunks in zip(small, parsed):
+        if isinstance(chunks, BaseException):
+            fail(doc_id, chunks)
+        elif not chunks:
+            fail(doc_id, "No content could be extracted from the document")
+        else:
+            batch.append((doc_id, chunks))
+    if not batch:
+        return results
+
+    # One embedding request stream for the whole batch instead of one per file
+    all_chunks = [chunk for _, chunks in batch for chunk in chunks]
+    for doc_id, _ in batch:
+        if doc_id in jobs:
+            jobs[doc_id].status = "embedding"
+    started = time.perf_counter()
+    try:
+        vectors, _ = await embed_chunks(all_chunks, embeddings)
+    except Exception as e:
+        for doc_id, _ in batch:
+            fail(doc_id, e)
+        return results
+    embedding_duration = round(time.perf_counter() - started, 4)
+
+    async def index(doc_id, chunks, file_vectors):
+        job = jobs.get(doc_id)
+        if job is not None:
+            job.stages["embedding"] = {"duration": embedding_duration}
+        try:
+            index_type = await asyncio.to_thread(
+                index_chunks, chunks, file_vectors, embeddings, os.path.join(VECTORSTORE_DIR, doc_id), job
+            )
+            update_metadata(os.path.join(UPLOAD_DIR, doc_id, "metadata.json"), {
+                "size": sum(len(chunk.page_content) for chunk in chunks),
+                "chunks": len(chunks),
+                "index_type": index_type,
+                "status": "ready"
+            })
+            results[doc_id] = True
+        except Exception as e:
+            fail(doc_id, e)
+
+    indexing, offset = [], 0
+    for doc_id, chunks in batch:
+        indexing.append(index(doc_id, chunks, vectors[offset:offset + len(chunks)]))
+        offset += len(chunks)
+    await asyncio.gather(*indexing)
+    print(f"Processed a batch of {len(files)} files, {len(all_chunks)} chunks embedded together")
+    return results
+
+
+async def process_url(url_id: str, url: str, embeddings, job=None, executor=None):
+    """Fetch, embed and index a web page. Returns True on success."""
+    metadata_path = os.path.join(URL_DIR, url_id, "metadata.json")
+    try:
+        # Fetching is network bound, so a thread is enough to keep it off the event loop
+        with _stage(job, "parsing"):
+            documents, chunks, validators = await asyncio.to_thread(load_and_split_url, url)
 
-        # Create a vector store
-        vectorstore = FAISS.from_documents(chunks, embeddings)
+        with _stage(job, "embedding"):
+            vectors, cached_chunks = await embed_chunks(chunks, embeddings)
+        print(f"Embedded {len(chunks)} chunks for {url_id}, {cached_chunks} served from cache")
 
         # Save the vector store with a special prefix to distinguish from documents
         vectorstore_path = os.path.join(VECTORSTORE_DIR, f"url_{url_id}")
-        vectorstore.save_local(vectorstore_path)
+        index_type = await asyncio.to_thread(index_chunks, chunks, vectors, embeddings, vectorstore_path, job)
+
+        # Update metadata with actual content size and title
+        updates = {
+            "size": sum(len(doc.page_content) for doc in documents),
+            "chunks": len(chunks),
+            "cached_chunks": cached_chunks,
+            "index_type": index_type,
+            "status": "ready",
+            **validators,
+            "refreshed_at": datetime.datetime.now().isoformat()
+        }
+
+        # Try to extract title from first document
+        if documents and hasattr(documents[0], 'metadata') and 'title' in documents[0].metadata:
+            updates["name"] = documents[0].metadata['title']
+
+        update_metadata(metadata_path, updates)
 
         return True
     except Exception as e:
         print(f"Error processing URL: {e}")
+        if job is not None:
+            job.error = str(e)
+        update_metadata(metadata_path, {"status": "failed", "error": str(e)})
         return False
 
 
-def save_session_data(session_metadata: dict, chat_sessions: dict):
-    """Save session metadata and chat sessions to JSON files."""
-    os.makedirs(SESSION_DATA_DIR, exist_ok=True)
-
-    # Save session metadata
-    serializable_metadata = {
-        key: {
-            "created_at": value["created_at"].isoformat(),
-            "message_count": value["message_count"],
-            "device_id": value.get("device_id")  # Include device_id in serialized metadata
-        } for key, value in session_metadata.items()
-    }
-    with open(SESSION_METADATA_FILE, "w") as f:
-        json.dump(serializable_metadata, f)
-
-    # Save chat session memory (only the conversation history)
-    serializable_sessions = {}
-    for session_id, chain in chat_sessions.items():
-        memory = chain.memory
-        if hasattr(memory, 'buffer'):
-            chat_history = []
-            for msg in memory.buffer:
-                if msg.__class__.__name__ == "HumanMessage":
-                    chat_history.append({"role": "user", "content": msg.content})
-                elif msg.__class__.__name__ == "AIMessage":
-                    chat_history.append({"role": "assistant", "content": msg.content})
-            serializable_sessions[session_id] = {"chat_history": chat_history}
-    with open(CHAT_SESSIONS_FILE, "w") as f:
-        json.dump(serializable_sessions, f)
-
-
-def load_session_data():
-    """Load session metadata and chat sessions from JSON files."""
-    session_metadata = {}
-    chat_sessions = {}
-
-    # Load session metadata
-    if os.path.exists(SESSION_METADATA_FILE):
-        with open(SESSION_METADATA_FILE, "r") as f:
-            data = json.load(f)
-            session_metadata = {
-                key: {
-                    "created_at": datetime.datetime.fromisoformat(value["created_at"]),
-                    "message_count": value["message_count"],
-                    "device_id": value.get("device_id")  # Load device_id from serialized metadata
-                } for key, value in data.items()
-            }
-            print(session_metadata)
-
-    # Load chat sessions
-    if os.path.exists(CHAT_SESSIONS_FILE):
-        with open(CHAT_SESSIONS_FILE, "r") as f:
-            chat_sessions = json.load(f)
-            print(chat_sessions)
-
-    return session_metadata, chat_sessions
+def diff_chunks(old_chunks, new_chunks):
+    """Match new chunks to stored ones with the same text.
+
+    old_chunks is a list of (position, Document). Returns the old position for each
+    new chunk (None for new or changed text) and the number of stored chunks that
+    vanished.
+    """
+    available = defaultdict(list)
+    for position, doc in old_chunks:
+        available[doc.page_content].append(position)
+    matches = [
+        available[chunk.page_content].pop(0) if available.get(chunk.page_content) else None
+        for chunk in new_chunks
+    ]
+    return matches, sum(len(positions) for positions in available.values())
+
+
+def _reusable_vectors(vectorstore, positions):
+    # Only exact stored vectors are reused; quantized indexes would hand back lossy ones
+    if not isinstance(vectorstore.index, (faiss.IndexFlat, faiss.IndexHNSWFlat, MmapFlatIndex)):
+        return None
+    return [vectorstore.index.reconstruct(int(position)).tolist() for position in positions]
+
+
+async def refresh_url(url_id: str, url: str, embeddings, job=None):
+    """Re-fetch a web page and update its index if the page changed. Returns True on success.
+
+    Uses a conditional request with the ETag/Last-Modified of the previous fetch.
+    Only new or changed chunks are embedded; unchanged chunks keep their stored
+    vectors and chunks that vanished are left out of the rebuilt index.
+    """
+    metadata_path = os.path.join(URL_DIR, url_id, "metadata.json")
+    vectorstore_path = os.path.join(VECTORSTORE_DIR, f"url_{url_id}")
+    with open(metadata_path, "r") as f:
+        metadata = json.load(f)
+    refreshed_at = datetime.datetime.now().isoformat()
+    try:
+        with _stage(job, "parsing"):
+            documents, chunks, validators = await asyncio.to_thread(
+                load_and_split_url, url, metadata.get("etag"), metadata.get("last_modified")
+            )
+        if documents is None:
+            update_metadata(metadata_path, {
+                **validators, "refreshed_at": refreshed_at, "last_refresh": {"changed": False}
+            })
+            return True
+
+        existing = None
+        if os.path.exists(vectorstore_path):
+            existing = await asyncio.to_thread(load_vectorstore, vectorstore_path, embeddings)
+        old_chunks = await asyncio.to_thread(stored_chunks, existing) if existing else []
+        matches, removed = diff_chunks(old_chunks, chunks)
+        added = sum(1 for position in matches if position is None)
+        summary = {"changed": bool(added or removed), "added": added, "removed": removed,
+                   "unchanged": len(chunks) - added}
+
+        updates = {**validators, "refreshed_at": refreshed_at, "last_refresh": summary, "status": "ready"}
+        if summary["changed"] or existing is None:
+            with _stage(job, "embedding"):
+                vectors = await _refresh_vectors(existing, chunks, matches, embeddings)
+            updates["index_type"] = await asyncio.to_thread(
+                index_chunks, chunks, vectors, embeddings, vectorstore_path, job
+            )
+            updates["size"] = sum(len(doc.page_content) for doc in documents)
+            updates["chunks"] = len(chunks)
+            if "title" in documents[0].metadata:
+                updates["name"] = documents[0].metadata["title"]
+        print(f"Refreshed {url_id}: {summary}")
+
+        update_metadata(metadata_path, updates)
+        return True
+    except Exception as e:
+        print(f"Error refreshing URL: {e}")
+        if job is not None:
+            job.error = str(e)
+        # The previous index stays in place, so the URL remains usable
+        update_metadata(metadata_path, {"refreshed_at": refreshed_at, "last_refresh": {"error": str(e)}})
+        return False
+
+
+async def _refresh_vectors(existing, chunks, matches, embeddings):
+    kept = [position for position in matches if position is not None]
+    kept_vectors = await asyncio.to_thread(_reusable_vectors, existing, kept) if existing and kept else None
+    if kept_vectors is None:
+        # Unchanged texts are still served by the embedding cache
+        vectors, _ = await embed_chunks(chunks, embeddings)
+        return vectors
+
+    new_chunks = [chunk for chunk, position in zip(chunks, matches) if position is None]
+    new_vectors, _ = await embed_chunks(new_chunks, embeddings) if new_chunks else ([], 0)
+    kept_iter, new_iter = iter(kept_vectors), iter(new_vectors)
+    return [next(new_iter) if position is None else next(kept_iter) for position in matches]
+
+
+async def process_site(site_id: str, crawl: dict, embeddings, job=None):
+    """Crawl a site and index all its pages into one vector store. Returns True on success.
+
+    crawl holds the SiteCrawler.crawl arguments. Pages are split and embedded in
+    batches while the crawl is still running; each chunk keeps its page's URL as
+    source metadata.
+    """
+    metadata_path = os.path.join(URL_DIR, site_id, "metadata.json")
+    vectorstore_path = os.path.join(VECTORSTORE_DIR, f"url_{site_id}")
+    crawler = SiteCrawler(CRAWL_CONCURRENCY, CRAWL_PER_HOST_CONCURRENCY, URL_FETCH_TIMEOUT, URL_FETCH_USER_AGENT)
+    splitter = _get_text_splitter()
+    writer = None
+    try:
+        # Chunks and vectors go to disk batch by batch, as in _ingest_streaming
+        writer = await asyncio.to_thread(VectorStoreWriter, vectorstore_path)
+        pages = chunk_count = content_size = cached_chunks = 0
+        batch = []
+
+        async def flush():
+            nonlocal cached_chunks
+            with _stage(job, "embedding"):
+                vectors, cached = await embed_chunks(batch, embeddings)
+            with _stage(job, "indexing"):
+                await asyncio.to_thread(writer.add, batch, vectors)
+            cached_chunks += cached
+            batch.clear()
+
+        if job is not None:
+            job.status = "parsing"
+        async for document in crawler.crawl(**crawl):
+            pages += 1
+            content_size += len(document.page_content)
+            chunks = splitter.split_documents([document])
+            chunk_count += len(chunks)
+            batch.extend(chunks)
+            if job is not None:
+                job.progress = min(pages / crawl.get("max_pages", pages), 0.99)
+            if len(batch) >= INGESTION_EMBED_BATCH_SIZE:
+                await flush()
+        if batch:
+            await flush()
+        if job is not None:
+            job.stages["parsing"] = {"duration": crawler.stats["duration"]}
+
+        if not writer.count:
+            raise ValueError("No pages could be fetched from the site")
+
+        index_type = choose_index_type(chunk_count)
+        index = None
+        if index_type != "flat":
+            with _stage(job, "indexing"):
+                index = await asyncio.to_thread(build_index, writer.vectors(), index_type)
+        with _stage(job, "persisting"):
+            await asyncio.to_thread(writer.finish, index)
+        writer = None
+        print(f"Crawled {pages} pages for {site_id}: {crawler.stats}")
+
+        update_metadata(metadata_path, {
+            "size": content_size,
+            "pages": pages,
+            "chunks": chunk_count,
+            "cached_chunks": cached_chunks,
+            "index_type": index_type,
+            "crawl_stats": crawler.stats,
+            "status": "ready",
+            "refreshed_at": datetime.datetime.now().isoformat()
+        })
+        return True
+    except Exception as e:
+        print(f"Error crawling site: {e}")
+        if job is not None:
+            job.error = str(e)
+        update_metadata(metadata_path, {"status": "failed", "error": str(e)})
+        return False
+    finally:
+        if writer is not None:
+            await asyncio.to_thread(writer.discard)
@@ -0,0 +1,247 @@
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import List, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# SQLite caps the number of bound parameters per statement
+_SQLITE_BATCH = 500
+
+
+def embedding_cache_key(model_name: str, text: str) -> str:
+    """Content address of a text embedded with a given model."""
+    return hashlib.sha256(f"{model_name}\0{text}".encode("utf-8")).hexdigest()
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that only sends texts it has never seen to the real embedder.
+
+    Vectors are keyed by a hash of the model name and the text, kept in an
+    in-memory LRU and persisted in a SQLite file shared by every document and URL.
+
+    Query embeddings have their own in-memory LRU. Async queries that miss it are
+    held for up to `query_batch_window` seconds so that concurrent chat requests
+    share one batched embedding call.
+    """
+
+    def __init__(self, embeddings: Embeddings, model_name: str, cache_path: str, max_memory_items: int = 20000,
+                 max_query_items: int = 10000, query_batch_window: float = 0.005, query_max_batch: int = 64):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.cache_path = cache_path
+        self.max_memory_items = max_memory_items
+        self.max_query_items = max_query_items
+        self.query_batch_window = query_batch_window
+        self.query_max_batch = query_max_batch
+        self._memory = OrderedDict()
+        self._queries = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        # Async queries waiting for the next batch, and batches sent but not answered yet (key -> future)
+        self._pending_queries = OrderedDict()
+        self._inflight_queries = {}
+        self._flush_handle = None
+        self._query_tasks = set()
+        self.query_hits = 0
+        self.query_misses = 0
+        self.query_coalesced = 0
+        self.query_batches = 0
+        self.query_batched_texts = 0
+        self.query_max_batch_seen = 0
+
+        os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(cache_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+        self._conn.commit()
+
+    def _remember(self, key: str, vector: List[float]):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def _lookup(self, keys: List[str]) -> dict:
+        """Return the cached vectors for the given keys, checking memory before disk."""
+        found = {}
+        with self._lock:
+            missing = []
+            for key in keys:
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    found[key] = self._memory[key]
+                    self.memory_hits += 1
+                else:
+                    missing.append(key)
+
+            for i in range(0, len(missing), _SQLITE_BATCH):
+                batch = missing[i:i + _SQLITE_BATCH]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    vector = np.frombuffer(blob, dtype=np.float32).tolist()
+                    found[key] = vector
+                    self._remember(key, vector)
+                    self.disk_hits += 1
+        return found
+
+    def _store(self, items: List[Tuple[str, List[float]]]):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                [(key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in items]
+            )
+            self._conn.commit()
+            for key, vector in items:
+                self._remember(key, vector)
+
+    def _plan(self, texts: List[str]):
+        keys = [embedding_cache_key(self.model_name, text) for text in texts]
+        found = self._lookup(list(dict.fromkeys(keys)))
+        # Embed each distinct missing text once, even if it repeats within the batch
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        return keys, found, missing
+
+    def _finish(self, keys: List[str], found: dict, missing: dict, vectors: List[List[float]]):
+        computed = list(zip(missing.keys(), vectors))
+        if computed:
+            self._store(computed)
+            found.update(computed)
+        with self._lock:
+            self.misses += len(missing)
+        cached = sum(1 for key in keys if key not in missing)
+        return [found[key] for key in keys], cached
+
+    def embed_documents_with_stats(self, texts: List[str]) -> Tuple[List[List[float]], int]:
+        """Embed texts and also return how many of them were served from the cache."""
+        keys, found, missing = self._plan(texts)
+        vectors = self.embeddings.embed_documents(list(missing.values())) if missing else []
+        return self._finish(keys, found, missing, vectors)
+
+    async def aembed_documents_with_stats(self, texts: List[str]) -> Tuple[List[List[float]], int]:
+        keys, found, missing = await asyncio.to_thread(self._plan, texts)
+        vectors = await self.embeddings.aembed_documents(list(missing.values())) if missing else []
+        return await asyncio.to_thread(self._finish, keys, found, missing, vectors)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_documents_with_stats(texts)[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return (await self.aembed_documents_with_stats(texts))[0]
+
+    def _cached_query(self, key: str):
+        with self._lock:
+            vector = self._queries.get(key)
+            if vector is not None:
+                self._queries.move_to_end(key)
+                self.query_hits += 1
+            return vector
+
+    def _remember_query(self, key: str, vector: List[float]):
+        with self._lock:
+            self._queries[key] = vector
+            self._queries.move_to_end(key)
+            while len(self._queries) > self.max_query_items:
+                self._queries.popitem(last=False)
+
+    def embed_query(self, text: str) -> List[float]:
+        key = embedding_cache_key(self.model_name, text)
+        vector = self._cached_query(key)
+        if vector is None:
+            with self._lock:
+                self.query_misses += 1
+            vector = self.embeddings.embed_query(text)
+            self._remember_query(key, vector)
+        return vector
+
+    async def aembed_query(self, text: str) -> List[float]:
+        key = embedding_cache_key(self.model_name, text)
+        vector = self._cached_query(key)
+        if vector is not None:
+            return vector
+
+        # Join an identical query that is already queued or being embedded
+        pending = self._pending_queries.get(key)
+        future = pending[1] if pending else self._inflight_queries.get(key)
+        if future is not None:
+            with self._lock:
+                self.query_coalesced += 1
+            return await asyncio.shield(future)
+
+        with self._lock:
+            self.query_misses += 1
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending_queries[key] = (text, future)
+        if len(self._pending_queries) >= self.query_max_batch:
+            self._flush_queries()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.query_batch_window, self._flush_queries)
+        return await asyncio.shield(future)
+
+    def _flush_queries(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self._pending_queries:
+            return
+        batch = self._pending_queries
+        self._pending_queries = OrderedDict()
+        for key, (_, future) in batch.items():
+            self._inflight_queries[key] = future
+        task = asyncio.get_running_loop().create_task(self._embed_query_batch(batch))
+        self._query_tasks.add(task)
+        task.add_done_callback(self._query_tasks.discard)
+
+    async def _embed_query_batch(self, batch: OrderedDict):
+        texts = [text for text, _ in batch.values()]
+        with self._lock:
+            self.query_batches += 1
+            self.query_batched_texts += len(texts)
+            self.query_max_batch_seen = max(self.query_max_batch_seen, len(texts))
+        try:
+            if len(texts) == 1:
+                vectors = [await self.embeddings.aembed_query(texts[0])]
+            else:
+                vectors = await self.embeddings.aembed_documents(texts)
+        except Exception as e:
+            for key, (_, future) in batch.items():
+                self._inflight_queries.pop(key, None)
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (key, (_, future)), vector in zip(batch.items(), vectors):
+            self._remember_query(key, vector)
+            self._inflight_queries.pop(key, None)
+            if not future.done():
+                future.set_result(vector)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "memory_entries": len(self._memory),
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "query_entries": len(self._queries),
+                "query_hits": self.query_hits,
+                "query_misses": self.query_misses,
+                "query_coalesced": self.query_coalesced,
+                "query_batches": self.query_batches,
+                "query_avg_batch_size": round(self.query_batched_texts / self.query_batches, 2)
+                if self.query_batches else 0.0,
+                "query_max_batch_size": self.query_max_batch_seen,
+            }
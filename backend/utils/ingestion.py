@@ -0,0 +1,231 @@
+import asyncio
+import multiprocessing
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, List, Optional
+
+from utils.metrics import ingestion_stage_seconds
+
+# Stages a job moves through, in order
+STAGES = ("parsing", "embedding", "indexing", "persisting")
+
+
+def _warm_up_worker():
+    # Importing the parsers is the slow part of a worker's first job
+    import utils.document_processing  # noqa: F401
+
+
+class IngestionQueueFull(Exception):
+    """Raised when accepting another job would exceed the configured queue depth."""
+
+
+class IngestionJob:
+    """Status and per-stage timings of one document or URL being processed."""
+
+    def __init__(self, doc_id: str, on_change: Optional[Callable[["IngestionJob"], None]] = None):
+        self.doc_id = doc_id
+        # Called whenever the job starts, enters a stage or finishes, e.g. to persist its status
+        self.on_change = on_change
+        self.status = "queued"
+        self.error = None
+        self.queued_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.stages = {}
+        # Fraction of the source consumed so far; only updated incrementally in streaming mode
+        self.progress = 0.0
+
+    @contextmanager
+    def stage(self, name: str):
+        """Mark the job as being in a stage and time it.
+
+        A stage may be entered several times (once per batch in streaming mode); its
+        durations add up.
+        """
+        self.status = name
+        self.changed()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            timing = self.stages.setdefault(name, {"duration": 0.0})
+            timing["duration"] = round(timing["duration"] + time.perf_counter() - started, 4)
+
+    def start(self):
+        self.started_at = time.time()
+        self.changed()
+
+    def changed(self):
+        if self.on_change is not None:
+            try:
+                self.on_change(self)
+            except Exception as e:
+                print(f"Error saving status of ingestion job {self.doc_id}: {e}")
+
+    def finish(self, error: Optional[str] = None):
+        self.finished_at = time.time()
+        self.status = "failed" if error else "done"
+        self.error = error
+        if not error:
+            self.progress = 1.0
+        self.changed()
+
+        for name, timing in self.stages.items():
+            ingestion_stage_seconds.observe(timing["duration"], name)
+        if self.started_at is not None:
+            ingestion_stage_seconds.observe(self.started_at - self.queued_at, "queued")
+        ingestion_stage_seconds.observe(self.finished_at - self.queued_at, "total")
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed")
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.doc_id,
+            "status": self.status,
+            "error": self.error,
+            "queued_for": round((self.started_at or time.time()) - self.queued_at, 4),
+            "progress": round(self.progress, 4),
+            "stages": self.stages,
+            "total_duration": round(self.finished_at - self.queued_at, 4) if self.finished_at else None,
+        }
+
+
+class IngestionManager:
+    """Runs ingestion jobs with bounded parallelism and queue depth.
+
+    CPU-heavy parsing goes to a process pool so it never competes with request
+    handling on the event loop; at most `workers` jobs run at a time. With a JobStore,
+    job status is also written there, for other server workers to read.
+    """
+
+    def __init__(self, workers: int, max_queue: int, history: int = 1000, store=None):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.history = history
+        self.store = store
+        self.jobs = OrderedDict()
+        self._slots = asyncio.Semaphore(workers)
+        self._tasks = set()
+        self._process_pool = None
+
+    @property
+    def process_pool(self) -> ProcessPoolExecutor:
+        # Created on first use; spawn avoids forking a process that holds the event loop and model clients
+        if self._process_pool is None:
+            self._process_pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._process_pool
+
+    def warm_up(self):
+        """Start the worker processes ahead of the first upload."""
+        for _ in range(self.workers):
+            self.process_pool.submit(_warm_up_worker)
+
+    def pending(self) -> int:
+        return sum(1 for job in self.jobs.values() if not job.finished)
+
+    def check_capacity(self, count: int = 1):
+        if self.pending() + count > self.max_queue:
+            raise IngestionQueueFull(f"Ingestion queue is full ({self.max_queue} jobs)")
+
+    def submit(self, doc_id: str, process, *args, **kwargs) -> IngestionJob:
+        """Queue process(*args, job=job, **kwargs) to run when a worker slot is free."""
+        self.check_capacity()
+        job = self._new_job(doc_id)
+        self.jobs[doc_id] = job
+        self._prune()
+
+        task = asyncio.create_task(self._run(job, process, *args, **kwargs))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    async def _run(self, job: IngestionJob, process, *args, **kwargs):
+        async with self._slots:
+            job.start()
+            try:
+                ok = await process(*args, job=job, **kwargs)
+                job.finish(None if ok else job.error or "Processing failed")
+            except Exception as e:
+                print(f"Error in ingestion job {job.doc_id}: {e}")
+                job.finish(str(e))
+
+    def submit_batch(self, doc_ids: List[str], process, *args, **kwargs) -> List[IngestionJob]:
+        """Queue process(*args, jobs=jobs, **kwargs) as one task for several documents.
+
+        Each document gets its own job for status reporting. process returns a dict of
+        doc_id -> success; the batch takes a single worker slot.
+        """
+        self.check_capacity(len(doc_ids))
+        jobs = [self._new_job(doc_id) for doc_id in doc_ids]
+        for job in jobs:
+            self.jobs[job.doc_id] = job
+        self._prune()
+
+        task = asyncio.create_task(self._run_batch(jobs, process, *args, **kwargs))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return jobs
+
+    async def _run_batch(self, jobs: List[IngestionJob], process, *args, **kwargs):
+        async with self._slots:
+            for job in jobs:
+                job.start()
+            try:
+                results = await process(*args, jobs=jobs, **kwargs)
+            except Exception as e:
+                print(f"Error in ingestion batch: {e}")
+                results = {}
+                for job in jobs:
+                    job.error = job.error or str(e)
+            for job in jobs:
+                if not job.finished:
+                    job.finish(None if results.get(job.doc_id) else job.error or "Processing failed")
+
+    def _new_job(self, doc_id: str) -> IngestionJob:
+        job = IngestionJob(doc_id, on_change=self._save if self.store is not None else None)
+        job.changed()
+        return job
+
+    def _save(self, job: IngestionJob):
+        self.store.save(job.to_dict())
+
+    def get(self, doc_id: str) -> Optional[IngestionJob]:
+        return self.jobs.get(doc_id)
+
+    def status(self, doc_id: str) -> Optional[dict]:
+        """Status of the latest job for doc_id, whichever server worker runs or ran it."""
+        job = self.jobs.get(doc_id)
+        if job is not None:
+            return job.to_dict()
+        return self.store.get(doc_id) if self.store is not None else None
+
+    def claim(self, doc_id: str) -> bool:
+        """Mark a job for doc_id as queued unless one is already running on any worker.
+
+        Use before submit() for work that must not run twice at once, like URL refreshes.
+        """
+        job = self.jobs.get(doc_id)
+        if job is not None and not job.finished:
+            return False
+        if self.store is None:
+            return True
+        return self.store.claim(doc_id, IngestionJob(doc_id).to_dict())
+
+    def _prune(self):
+        # Only keep the most recent finished jobs around for status lookups
+        finished = [doc_id for doc_id, job in self.jobs.items() if job.finished]
+        for doc_id in finished[:max(0, len(finished) - self.history)]:
+            del self.jobs[doc_id]
+        if self.store is not None:
+            self.store.prune()
+
+    def shutdown(self):
+        if self._process_pool is not None:
+            self._process_pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,94 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+import psutil
+
+FINISHED = ("done", "failed")
+
+
+class JobStore:
+    """Ingestion job status in SQLite, shared by all server workers.
+
+    A job runs in the worker that accepted it, but its status is written here at every
+    stage change, so a status request served by any worker sees it. Rows remember the
+    pid of the owning worker: a job whose worker died is reported as failed instead of
+    staying in its last stage forever.
+    """
+
+    def __init__(self, db_path: str, history: int = 1000):
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self.history = history
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                doc_id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                pid INTEGER NOT NULL,
+                updated_at REAL NOT NULL,
+                data TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS jobs_by_update ON jobs (updated_at);
+        """)
+
+    def save(self, status: dict):
+        """Write a job's status dict (IngestionJob.to_dict()) as owned by this process."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO jobs (doc_id, status, pid, updated_at, data) VALUES (?, ?, ?, ?, ?)",
+                (status["id"], status["status"], os.getpid(), time.time(), json.dumps(status))
+            )
+
+    def get(self, doc_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT status, pid, data FROM jobs WHERE doc_id = ?", (doc_id,)).fetchone()
+        if not row:
+            return None
+        status, pid, data = row
+        status_dict = json.loads(data)
+        if status not in FINISHED and not _is_alive(pid):
+            status_dict.update(status="failed", error="Interrupted: the worker running this job stopped")
+        return status_dict
+
+    def claim(self, doc_id: str, status: dict) -> bool:
+        """Save a new job's status unless a live worker is already running a job for doc_id.
+
+        Check and write happen in one transaction, so of several workers claiming the
+        same id at once only one succeeds.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT status, pid FROM jobs WHERE doc_id = ?", (doc_id,)).fetchone()
+                if row and row[0] not in FINISHED and _is_alive(row[1]):
+                    self._conn.execute("COMMIT")
+                    return False
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO jobs (doc_id, status, pid, updated_at, data) VALUES (?, ?, ?, ?, ?)",
+                    (doc_id, status["status"], os.getpid(), time.time(), json.dumps(status))
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return True
+
+    def prune(self):
+        """Keep only the most recent `history` finished jobs; older ones fall back to metadata.json."""
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated_at < ("
+                "SELECT updated_at FROM jobs WHERE status IN ('done', 'failed') "
+                "ORDER BY updated_at DESC LIMIT 1 OFFSET ?)",
+                (self.history,)
+            )
+
+
+def _is_alive(pid: int) -> bool:
+    return pid == os.getpid() or psutil.pid_exists(pid)
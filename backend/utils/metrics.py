@@ -0,0 +1,228 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+from uuid import UUID
+
+from langchain_core.callbacks import AsyncCallbackHandler
+
+# Latency buckets in seconds, from cache hits to long LLM calls and ingestion stages
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Histogram:
+    """Latency histogram with one series per combination of label values.
+
+    observe() is a bisect and a few additions under a lock; cumulative bucket counts
+    are only computed when rendering.
+    """
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = tuple(sorted(buckets))
+        # label values -> per-bucket counts (the last one is +Inf), then the sum
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float, *label_values: str):
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += seconds
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {values: list(counts) for values, counts in self._series.items()}
+        for values, counts in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                bucket_labels = _labels(self.labels, values, 'le="' + le + '"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, values)} {counts[-1]}")
+            lines.append(f"{self.name}_count{_labels(self.labels, values)} {cumulative}")
+        return lines
+
+
+class _Sampled:
+    """Gauge or counter whose value is read from the app's own state when scraped."""
+
+    def __init__(self, kind: str, name: str, documentation: str,
+                 read: Callable[[], Union[float, Dict[str, float]]], label: Optional[str]):
+        self.kind = kind
+        self.name = name
+        self.documentation = documentation
+        self.read = read
+        self.label = label
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        try:
+            value = self.read()
+        except Exception as e:
+            print(f"Error reading metric {self.name}: {e}")
+            return lines
+        if self.label is None:
+            lines.append(f"{self.name} {value}")
+        else:
+            for label_value, sample in sorted(value.items()):
+                lines.append(f"{self.name}{_labels((self.label,), (label_value,))} {sample}")
+        return lines
+
+
+class MetricsRegistry:
+    """Collects metrics and renders them in the Prometheus text exposition format."""
+
+    def __init__(self):
+        self._metrics = []
+
+    def histogram(self, name: str, documentation: str, labels: Tuple[str, ...] = (),
+                  buckets=DEFAULT_BUCKETS) -> Histogram:
+        histogram = Histogram(name, documentation, labels, buckets)
+        self._metrics.append(histogram)
+        return histogram
+
+    def gauge(self, name: str, documentation: str, read, label: Optional[str] = None):
+        """Register a gauge read by calling read(); with a label, read() returns {label value: value}."""
+        self._metrics.append(_Sampled("gauge", name, documentation, read, label))
+
+    def counter(self, name: str, documentation: str, read, label: Optional[str] = None):
+        """Like gauge, for values that only ever grow."""
+        self._metrics.append(_Sampled("counter", name, documentation, read, label))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+chat_stage_seconds = registry.histogram(
+    "senseai_chat_stage_seconds", "Time spent in each stage of answering a chat message.", ("stage",)
+)
+ingestion_stage_seconds = registry.histogram(
+    "senseai_ingestion_stage_seconds", "Time spent in each stage of ingesting a document, URL or site.", ("stage",)
+)
+http_request_seconds = registry.histogram(
+    "senseai_http_request_seconds", "HTTP request latency by route.", ("method", "route", "status")
+)
+
+
+class StageTimer:
+    """Stage durations of one request, observed into a histogram when it completes."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def add(self, name: str, seconds: float):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def callbacks(self, answer_tag: str) -> "ChainStageCallback":
+        """Callback handler timing the condense, retrieve and answer steps of a chain run."""
+        return ChainStageCallback(self, answer_tag)
+
+    def finish(self, histogram: Histogram) -> dict:
+        """Observe all stages plus "total" and return them, rounded, as a timing record."""
+        self.stages["total"] = time.perf_counter() - self.started
+        for name, seconds in self.stages.items():
+            histogram.observe(seconds, name)
+        return {name: round(seconds, 4) for name, seconds in self.stages.items()}
+
+
+class ChainStageCallback(AsyncCallbackHandler):
+    """Times the LLM and retriever runs of a conversational retrieval chain.
+
+    LLM calls tagged with the answer tag count as "answer", other ones as "condense".
+    """
+
+    # Trivial handlers: awaiting them in place is cheaper than scheduling them as tasks
+    run_inline = True
+
+    def __init__(self, timer: StageTimer, answer_tag: str):
+        self.timer = timer
+        self.answer_tag = answer_tag
+        self._running: Dict[UUID, Tuple[str, float]] = {}
+
+    async def on_chat_model_start(self, serialized: Dict[str, Any], messages, *, run_id: UUID,
+                                  tags: Optional[List[str]] = None, **kwargs: Any) -> None:
+        stage = "answer" if tags and self.answer_tag in tags else "condense"
+        self._running[run_id] = (stage, time.perf_counter())
+
+    async def on_retriever_start(self, serialized: Dict[str, Any], query: str, *, run_id: UUID,
+                                 **kwargs: Any) -> None:
+        self._running[run_id] = ("retrieve", time.perf_counter())
+
+    def _end(self, run_id: UUID):
+        started = self._running.pop(run_id, None)
+        if started is not None:
+            self.timer.add(started[0], time.perf_counter() - started[1])
+
+    async def on_llm_end(self, response, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id)
+
+    async def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id)
+
+    async def on_retriever_end(self, documents, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id)
+
+    async def on_retriever_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id)
+
+
+class RequestMetrics:
+    """ASGI middleware observing every HTTP request's latency by method, route template and status."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = "500"
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # The route template keeps ids out of the labels; unmatched paths share one series
+            route = getattr(scope.get("route"), "path", "unmatched")
+            http_request_seconds.observe(time.perf_counter() - started, scope["method"], route, status)
@@ -0,0 +1,112 @@
+import os
+import shutil
+import time
+from typing import Callable, List
+
+from utils.vectorstore_storage import vectorstore_version
+
+# Left behind by writes interrupted before their final rename (see vectorstore_storage._replace_file)
+TEMP_SUFFIX = ".tmp"
+
+
+def tree_bytes(path: str) -> int:
+    """Total size of the files under a directory (or of a single file)."""
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def remove_paths(paths: List[str]) -> int:
+    """Delete files and directory trees; returns the bytes freed."""
+    freed = 0
+    for path in paths:
+        size = tree_bytes(path)
+        try:
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+        except FileNotFoundError:
+            # Another worker's reaper got there first
+            continue
+        except OSError as e:
+            print(f"Error removing {path}: {e}")
+            continue
+        freed += size
+    return freed
+
+
+def idle_for(path: str, seconds: float) -> bool:
+    """Whether neither a directory nor anything directly in it changed in the last `seconds`."""
+    cutoff = time.time() - seconds
+    try:
+        if os.stat(path).st_mtime > cutoff:
+            return False
+        if os.path.isdir(path):
+            with os.scandir(path) as entries:
+                return all(entry.stat().st_mtime <= cutoff for entry in entries)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def find_incomplete_sources(source_dir: str, grace: float) -> List[str]:
+    """Upload or URL directories without a metadata.json, i.e. whose creation never finished."""
+    if not os.path.isdir(source_dir):
+        return []
+    incomplete = []
+    for name in os.listdir(source_dir):
+        path = os.path.join(source_dir, name)
+        if os.path.isdir(path) and not os.path.exists(os.path.join(path, "metadata.json")) \
+                and idle_for(path, grace):
+            incomplete.append(path)
+    return incomplete
+
+
+def find_orphan_vectorstores(vectorstore_dir: str, upload_dir: str, url_dir: str,
+                             refs: Callable[[str], int], busy: Callable[[str], bool], grace: float) -> List[str]:
+    """Vector store directories no document or URL reads from, or whose build never completed.
+
+    refs(vectorstore_id) is the number of documents registered on a store and busy(doc_id)
+    whether an ingestion job for it is still queued or running on any worker. Stores
+    changed within the last `grace` seconds are left alone.
+    """
+    if not os.path.isdir(vectorstore_dir):
+        return []
+    orphans = []
+    for name in os.listdir(vectorstore_dir):
+        path = os.path.join(vectorstore_dir, name)
+        if not os.path.isdir(path) or not idle_for(path, grace):
+            continue
+        if name.startswith("url_"):
+            owner = name[len("url_"):]
+            referenced = os.path.isdir(os.path.join(url_dir, owner))
+        else:
+            # Uploads from before the registry own a store named after them without being registered
+            owner = name
+            referenced = refs(name) > 0 or os.path.isdir(os.path.join(upload_dir, name))
+        if not referenced or (vectorstore_version(path) is None and not busy(owner)):
+            orphans.append(path)
+    return orphans
+
+
+def find_temp_files(root: str, grace: float) -> List[str]:
+    """Temporary files of interrupted writes under root."""
+    cutoff = time.time() - grace
+    found = []
+    for directory, _, files in os.walk(root):
+        for name in files:
+            path = os.path.join(directory, name)
+            try:
+                if name.endswith(TEMP_SUFFIX) and os.path.getmtime(path) <= cutoff:
+                    found.append(path)
+            except OSError:
+                pass
+    return found
@@ -0,0 +1,160 @@
+import asyncio
+from collections import Counter
+from typing import Any, List, Optional
+
+from langchain_community.vectorstores.utils import DistanceStrategy
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from pydantic import ConfigDict
+
+from utils.vectorstore_storage import tokenize
+
+# How HybridRetriever answered queries: "hybrid", or "lexical" for the fast path without an embedding
+retrieval_counts = Counter()
+
+# Words that never make a query "rare-token" shaped
+STOPWORDS = frozenset("""
+    a an and are as at be by can do does for from how i in is it me of on or please show tell that the
+    this to was what when where which who why with you your about explain find give list
+""".split())
+
+
+def _rank_key(vectorstore, score: float) -> float:
+    # FAISS returns distances for L2/cosine (lower is better) and similarities for inner product
+    if vectorstore.distance_strategy in (DistanceStrategy.MAX_INNER_PRODUCT, DistanceStrategy.DOT_PRODUCT):
+        return -score
+    return score
+
+
+class MultiIndexRetriever(BaseRetriever):
+    """Searches several FAISS indexes with one query embedding and merges the top k by score.
+
+    The searches run concurrently, so latency stays close to that of a single index.
+    All indexes must have been built with the same embedding model.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    vectorstores: List[Any]
+    document_ids: List[str]
+    embeddings: Any
+    k: int = 4
+
+    def _merge(self, results) -> List[Document]:
+        scored = []
+        for document_id, vectorstore, hits in zip(self.document_ids, self.vectorstores, results):
+            for doc, score in hits:
+                # Copy so tagging the source doesn't modify the document in the shared cached index
+                tagged = Document(page_content=doc.page_content, metadata={**doc.metadata, "document_id": document_id})
+                scored.append((_rank_key(vectorstore, score), tagged))
+        scored.sort(key=lambda item: item[0])
+        return [doc for _, doc in scored[:self.k]]
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        embedding = self.embeddings.embed_query(query)
+        return self._merge([
+            vectorstore.similarity_search_with_score_by_vector(embedding, self.k)
+            for vectorstore in self.vectorstores
+        ])
+
+    async def _aget_relevant_documents(
+            self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        # Embed the query once and reuse the vector for every index
+        embedding = await self.embeddings.aembed_query(query)
+        results = await asyncio.gather(*(
+            asyncio.to_thread(vectorstore.similarity_search_with_score_by_vector, embedding, self.k)
+            for vectorstore in self.vectorstores
+        ))
+        return self._merge(results)
+
+
+def reciprocal_rank_fusion(rankings: List[List[Document]], k: int, rrf_k: int = 60) -> List[Document]:
+    """Merge ranked lists by summing 1 / (rrf_k + rank) per document, keyed by document id."""
+    scores, documents = {}, {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking, start=1):
+            key = doc.id or doc.page_content
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank)
+            documents.setdefault(key, doc)
+    ordered = sorted(scores, key=scores.get, reverse=True)
+    return [documents[key] for key in ordered[:k]]
+
+
+class HybridRetriever(BaseRetriever):
+    """BM25 + vector retrieval over one vector store, fused with reciprocal-rank fusion.
+
+    Queries made mostly of tokens that occur in few chunks (clause numbers, SKUs,
+    names) are answered from the BM25 index alone, without embedding the query. In
+    stores below min_chunks most tokens occur in few chunks anyway, so they always
+    use both searches, as do queries whose BM25 search finds fewer than k chunks.
+    Needs a store with a lexical index (see ChunkDocstore).
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    vectorstore: Any
+    k: int = 4
+    fetch_k: int = 20
+    rrf_k: int = 60
+    lexical_fast_path: bool = True
+    # A token is rare if it occurs in at most this fraction of the chunks (and at least once)
+    rare_token_fraction: float = 0.01
+    # Smallest store (in chunks) the fast path is used for
+    min_chunks: int = 200
+    # Share of the query's known content tokens that must be rare to skip the vector search
+    fast_path_min_share: float = 0.5
+
+    def _query_tokens(self, query: str) -> List[str]:
+        return [token for token in tokenize(query) if token not in STOPWORDS]
+
+    def _lexical_only(self, tokens: List[str]) -> bool:
+        ntotal = self.vectorstore.index.ntotal
+        if not self.lexical_fast_path or not tokens or ntotal < self.min_chunks:
+            return False
+        docstore = self.vectorstore.docstore
+        frequencies = docstore.document_frequencies(tokens)
+        max_frequency = max(1, int(self.rare_token_fraction * ntotal))
+        # Tokens that occur nowhere can't be matched either way, so only known tokens count
+        known = [frequencies[token] for token in tokens if frequencies[token] > 0]
+        rare = sum(1 for frequency in known if frequency <= max_frequency)
+        return rare > 0 and rare / len(known) >= self.fast_path_min_share
+
+    def _lexical(self, tokens: List[str]) -> List[Document]:
+        return [doc for doc, _ in self.vectorstore.docstore.lexical_search(tokens, self.fetch_k)]
+
+    def _vector(self, embedding: List[float]) -> List[Document]:
+        return [doc for doc, _ in self.vectorstore.similarity_search_with_score_by_vector(embedding, self.fetch_k)]
+
+    def _fast_path(self, tokens: List[str]) -> Optional[List[Document]]:
+        if self._lexical_only(tokens):
+            hits = self._lexical(tokens)
+            # Too few matches to fill the answer context; the vector search finds the rest
+            if len(hits) >= self.k:
+                retrieval_counts["lexical"] += 1
+                return hits[:self.k]
+        return None
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        tokens = self._query_tokens(query)
+        hits = self._fast_path(tokens)
+        if hits is not None:
+            return hits
+        retrieval_counts["hybrid"] += 1
+        embedding = self.vectorstore.embedding_function.embed_query(query)
+        return reciprocal_rank_fusion([self._vector(embedding), self._lexical(tokens)], self.k, self.rrf_k)
+
+    async def _aget_relevant_documents(
+            self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        tokens = self._query_tokens(query)
+        hits = await asyncio.to_thread(self._fast_path, tokens)
+        if hits is not None:
+            return hits
+        retrieval_counts["hybrid"] += 1
+        # BM25 runs while the query is being embedded
+        lexical = asyncio.create_task(asyncio.to_thread(self._lexical, tokens))
+        embedding = await self.vectorstore.embedding_function.aembed_query(query)
+        vector = await asyncio.to_thread(self._vector, embedding)
+        return reciprocal_rank_fusion([vector, await lexical], self.k, self.rrf_k)
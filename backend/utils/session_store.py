@@ -0,0 +1,216 @@
+import datetime
+import json
+import os
+import sqlite3
+import threading
+from typing import List, Optional
+
+
+class SessionStore:
+    """Session metadata and chat history in SQLite (WAL mode).
+
+    Every event writes only its own delta in a single transaction, instead of
+    re-serializing all sessions, and lookups go through the primary key. All
+    server workers share the database, so message counts are only ever changed by
+    single atomic statements.
+    """
+
+    def __init__(self, db_path: str):
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self.db_path = db_path
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                created_at TEXT NOT NULL,
+                message_count INTEGER NOT NULL DEFAULT 0,
+                device_id TEXT
+            );
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS messages_by_session ON messages (session_id, id);
+        """)
+
+    def create_session(self, session_id: str, created_at: datetime.datetime, device_id: Optional[str] = None):
+        self.create_sessions([session_id], created_at, device_id)
+
+    def create_sessions(self, session_ids: List[str], created_at: datetime.datetime, device_id: Optional[str] = None):
+        """Create several sessions in one transaction, e.g. for the files of a bulk upload."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO sessions (session_id, created_at, message_count, device_id) VALUES (?, ?, 0, ?)",
+                [(session_id, created_at.isoformat(), device_id) for session_id in session_ids]
+            )
+            self._conn.execute("COMMIT")
+
+    def get_session(self, session_id: str) -> Optional[dict]:
+        """Return a session's metadata, or None if it doesn't exist."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT created_at, message_count, device_id FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        if not row:
+            return None
+        return {
+            "created_at": datetime.datetime.fromisoformat(row[0]),
+            "message_count": row[1],
+            "device_id": row[2]
+        }
+
+    def reserve_message(self, session_id: str, limit: int) -> Optional[int]:
+        """Count one more message against a session's limit, atomically across processes.
+
+        Returns the new message count, or None if the session already has `limit`
+        messages (or doesn't exist). The check and the increment are one UPDATE, so
+        concurrent requests on any number of workers can never go over the limit.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "UPDATE sessions SET message_count = message_count + 1 "
+                "WHERE session_id = ? AND message_count < ? RETURNING message_count",
+                (session_id, limit)
+            ).fetchone()
+        return row[0] if row else None
+
+    def release_message(self, session_id: str):
+        """Give back a reservation whose message was never answered."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE sessions SET message_count = message_count - 1 WHERE session_id = ? AND message_count > 0",
+                (session_id,)
+            )
+
+    def record_exchange(self, session_id: str, question: str, answer: str) -> int:
+        """Append one question/answer pair, already counted by reserve_message.
+
+        Returns the id of the last message written, see get_history.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for role, content in (("user", question), ("assistant", answer)):
+                    cursor = self._conn.execute(
+                        "INSERT INTO messages (session_id, role, content) VALUES (?, ?, ?)", (session_id, role, content)
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return cursor.lastrowid
+
+    def get_history(self, session_id: str, after_id: int = 0) -> List[dict]:
+        """Return a session's messages in order, as {"id", "role", "content"} dicts.
+
+        With after_id, only the messages written after that one, e.g. by another worker.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, role, content FROM messages WHERE session_id = ? AND id > ? ORDER BY id",
+                (session_id, after_id)
+            ).fetchall()
+        return [{"id": message_id, "role": role, "content": content} for message_id, role, content in rows]
+
+    def delete_session(self, session_id: str):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            self._conn.execute("COMMIT")
+
+    def delete_history(self, created_before: datetime.datetime) -> int:
+        """Delete the messages of sessions created before a cutoff; returns how many were deleted.
+
+        The sessions themselves stay, so their ownership and message counts still apply.
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM messages WHERE session_id IN (SELECT session_id FROM sessions WHERE created_at < ?)",
+                (created_before.isoformat(),)
+            )
+        return cursor.rowcount
+
+    def session_ids(self, created_before: datetime.datetime) -> List[str]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT session_id FROM sessions WHERE created_at < ?", (created_before.isoformat(),)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def compact(self, min_free_fraction: float = 0.25) -> int:
+        """Return deleted rows' space to the file system; returns the bytes reclaimed.
+
+        Always truncates the write-ahead log, and rewrites the database with VACUUM once
+        at least min_free_fraction of its pages are free. Skipped while another worker
+        holds the database busy.
+        """
+        before = self._file_bytes()
+        with self._lock:
+            try:
+                self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                free_pages = self._conn.execute("PRAGMA freelist_count").fetchone()[0]
+                pages = self._conn.execute("PRAGMA page_count").fetchone()[0]
+                if pages and free_pages / pages >= min_free_fraction:
+                    self._conn.execute("VACUUM")
+                    self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            except sqlite3.OperationalError as e:
+                print(f"Skipped compacting the session store: {e}")
+        return max(0, before - self._file_bytes())
+
+    def _file_bytes(self) -> int:
+        paths = (self.db_path, self.db_path + "-wal")
+        return sum(os.path.getsize(path) for path in paths if os.path.exists(path))
+
+    def count_sessions(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def import_json_files(self, metadata_file: str, chat_sessions_file: str):
+        """One-off migration of the old session_metadata.json/chat_sessions.json files.
+
+        Imported files are renamed with a .migrated suffix so this only happens once,
+        even when several workers start at the same time.
+        """
+        if not os.path.exists(metadata_file):
+            return
+
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Another worker may have imported them while this one waited for the write lock
+                if not os.path.exists(metadata_file):
+                    self._conn.execute("COMMIT")
+                    return
+                with open(metadata_file, "r") as f:
+                    metadata = json.load(f)
+                history = {}
+                if os.path.exists(chat_sessions_file):
+                    with open(chat_sessions_file, "r") as f:
+                        history = json.load(f)
+
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO sessions (session_id, created_at, message_count, device_id) "
+                    "VALUES (?, ?, ?, ?)",
+                    [(key, value["created_at"], value["message_count"], value.get("device_id"))
+                     for key, value in metadata.items()]
+                )
+                self._conn.executemany(
+                    "INSERT INTO messages (session_id, role, content) VALUES (?, ?, ?)",
+                    [(key, msg["role"], msg["content"])
+                     for key, value in history.items() for msg in value.get("chat_history", [])]
+                )
+                os.replace(metadata_file, metadata_file + ".migrated")
+                if os.path.exists(chat_sessions_file):
+                    os.replace(chat_sessions_file, chat_sessions_file + ".migrated")
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        print(f"Imported {len(metadata)} sessions from {metadata_file}")
@@ -0,0 +1,73 @@
+import asyncio
+import hashlib
+import json
+import os
+
+import aiofiles
+
+
+class UploadTooLarge(Exception):
+    """Raised when an upload exceeds the configured maximum size."""
+
+    def __init__(self, max_bytes: int):
+        super().__init__(f"File exceeds the maximum upload size of {max_bytes} bytes")
+        self.max_bytes = max_bytes
+
+
+def _read_and_hash(source, hasher, chunk_size: int) -> bytes:
+    chunk = source.read(chunk_size)
+    hasher.update(chunk)
+    return chunk
+
+
+async def save_upload(source, file_path: str, chunk_size: int, max_bytes: int):
+    """Copy a file-like upload stream to disk in fixed-size chunks without blocking the event loop.
+
+    Reading and hashing run in a worker thread and writes go through aiofiles, so the
+    content hash and byte count come out of the same pass. Stops as soon as more than
+    max_bytes were read, removes the partial file and raises UploadTooLarge.
+    Returns (size, sha256 hex digest).
+    """
+    hasher = hashlib.sha256()
+    file_size = 0
+    try:
+        async with aiofiles.open(file_path, "wb") as buffer:
+            while chunk := await asyncio.to_thread(_read_and_hash, source, hasher, chunk_size):
+                file_size += len(chunk)
+                if file_size > max_bytes:
+                    raise UploadTooLarge(max_bytes)
+                await buffer.write(chunk)
+    except BaseException:
+        # Covers size limit, disk errors and client disconnects (cancellation) alike
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        raise
+    return file_size, hasher.hexdigest()
+
+
+class RequestSizeLimit:
+    """ASGI middleware answering 413 to requests whose Content-Length is over a per-path limit.
+
+    Runs before the multipart body is spooled to disk, so oversized uploads are refused
+    without reading them. Bodies without a Content-Length are left to save_upload.
+    """
+
+    def __init__(self, app, limits: dict):
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope.get("path")) if scope["type"] == "http" else None
+        if limit is not None:
+            length = dict(scope["headers"]).get(b"content-length", b"")
+            if length.isdigit() and int(length) > limit:
+                body = json.dumps({"detail": f"Request body exceeds the limit of {limit} bytes"}).encode()
+                await send({
+                    "type": "http.response.start",
+                    "status": 413,
+                    "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()),
+                                (b"connection", b"close")],
+                })
+                await send({"type": "http.response.body", "body": body})
+                return
+        await self.app(scope, receive, send)
@@ -0,0 +1,118 @@
+import os
+import threading
+from collections import OrderedDict
+
+# Charged per loaded store on top of its files: the open SQLite connection with its page cache,
+# the index mapping and the Python objects around them
+OPEN_STORE_OVERHEAD_BYTES = 256 * 1024
+
+
+def estimate_vectorstore_bytes(vectorstore_path: str) -> int:
+    """Estimate the resident size of a vector store from its files on disk.
+
+    Memory-mapped vectors and chunk databases count in full: they aren't heap memory,
+    but searches page them in and each loaded store holds their file descriptors.
+    """
+    total = OPEN_STORE_OVERHEAD_BYTES
+    for root, _, files in os.walk(vectorstore_path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+class VectorStoreCache:
+    """LRU cache of loaded vector stores bounded by an approximate byte budget and an entry count.
+
+    Evicted stores aren't closed: their files stay open until the last request using them
+    drops them, even if a rebuild has replaced the files meanwhile. With a version function
+    (path -> stamp), a store whose index was rebuilt on disk since it was last loaded, e.g. by
+    another server worker, counts as stale: it is reloaded and on_stale(path) is called first.
+    """
+
+    def __init__(self, max_bytes: int, version=None, max_entries: int = 256, on_stale=None):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.version = version
+        self.on_stale = on_stale
+        self._entries = OrderedDict()  # path -> (vectorstore, size in bytes, version)
+        # Version each path was last loaded at, kept after eviction so a rebuild is noticed on the next load
+        self._loaded_versions = {}
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+
+    def get(self, vectorstore_path: str, loader):
+        """Return the vector store for a path, calling loader(path) on a miss."""
+        version = self.version(vectorstore_path) if self.version else None
+        with self._lock:
+            entry = self._entries.get(vectorstore_path)
+            if entry and entry[2] == version:
+                self._entries.move_to_end(vectorstore_path)
+                self.hits += 1
+                return entry[0]
+            if entry:
+                del self._entries[vectorstore_path]
+                self.current_bytes -= entry[1]
+            loaded_version = self._loaded_versions.get(vectorstore_path, version)
+            stale = loaded_version != version
+            if stale:
+                self.stale += 1
+            self.misses += 1
+        if stale and self.on_stale:
+            self.on_stale(vectorstore_path)
+
+        # Load outside the lock so a slow load doesn't block hits on other indexes
+        vectorstore = loader(vectorstore_path)
+        size = estimate_vectorstore_bytes(vectorstore_path)
+
+        with self._lock:
+            # Another request may have loaded the same index in the meantime
+            if vectorstore_path in self._entries:
+                self._entries.move_to_end(vectorstore_path)
+                existing = self._entries[vectorstore_path][0]
+            else:
+                existing = None
+                self._entries[vectorstore_path] = (vectorstore, size, version)
+                self._loaded_versions[vectorstore_path] = version
+                self.current_bytes += size
+                self._evict()
+        return existing if existing is not None else vectorstore
+
+    def invalidate(self, vectorstore_path: str):
+        """Drop a vector store from the cache, e.g. after it was deleted or rebuilt."""
+        with self._lock:
+            entry = self._entries.pop(vectorstore_path, None)
+            self._loaded_versions.pop(vectorstore_path, None)
+            if entry:
+                self.current_bytes -= entry[1]
+
+    def _evict(self):
+        """Drop least recently used entries until within budget."""
+        # Always keep the most recently used entry, even if it alone exceeds the budget
+        while len(self._entries) > 1 and (self.current_bytes > self.max_bytes
+                                          or len(self._entries) > self.max_entries):
+            _, (_, size, _) = self._entries.popitem(last=False)
+            self.current_bytes -= size
+            self.evictions += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale": self.stale,
+                "evictions": self.evictions,
+            }
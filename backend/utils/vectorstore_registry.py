@@ -0,0 +1,118 @@
+import os
+import sqlite3
+import threading
+from typing import Optional, Tuple
+
+
+class VectorstoreRegistry:
+    """Maps uploaded content hashes to processed vector stores and reference-counts them.
+
+    Documents with identical bytes share one vector store; the store is only
+    removed once the last document referencing it is deleted. Documents that
+    were never registered (older uploads, URLs) own a vector store named after their id.
+    """
+
+    def __init__(self, db_path: str):
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS vectorstores (
+                vectorstore_id TEXT PRIMARY KEY,
+                content_hash TEXT UNIQUE,
+                refs INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS document_refs (
+                doc_id TEXT PRIMARY KEY,
+                vectorstore_id TEXT NOT NULL
+            );
+        """)
+
+    def acquire(self, content_hash: str, doc_id: str) -> Tuple[str, bool]:
+        """Register doc_id for the given content.
+
+        Returns (vectorstore_id, is_duplicate). For new content the document becomes
+        the owner of a vector store named after itself, which still has to be built.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT vectorstore_id FROM vectorstores WHERE content_hash = ?", (content_hash,)
+                ).fetchone()
+                if row:
+                    vectorstore_id, is_duplicate = row[0], True
+                    self._conn.execute(
+                        "UPDATE vectorstores SET refs = refs + 1 WHERE vectorstore_id = ?", (vectorstore_id,)
+                    )
+                else:
+                    vectorstore_id, is_duplicate = doc_id, False
+                    self._conn.execute(
+                        "INSERT INTO vectorstores (vectorstore_id, content_hash, refs) VALUES (?, ?, 1)",
+                        (vectorstore_id, content_hash)
+                    )
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO document_refs (doc_id, vectorstore_id) VALUES (?, ?)",
+                    (doc_id, vectorstore_id)
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return vectorstore_id, is_duplicate
+
+    def vectorstore_id(self, doc_id: str) -> str:
+        """Return the id of the vector store a document reads from."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT vectorstore_id FROM document_refs WHERE doc_id = ?", (doc_id,)
+            ).fetchone()
+        return row[0] if row else doc_id
+
+    def release(self, doc_id: str) -> Optional[str]:
+        """Drop a document's reference.
+
+        Returns the vector store id when nothing references it anymore and it should be
+        removed, or None while other documents still share it.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT vectorstore_id FROM document_refs WHERE doc_id = ?", (doc_id,)
+                ).fetchone()
+                if not row:
+                    self._conn.execute("COMMIT")
+                    return doc_id
+
+                vectorstore_id = row[0]
+                self._conn.execute("DELETE FROM document_refs WHERE doc_id = ?", (doc_id,))
+                self._conn.execute(
+                    "UPDATE vectorstores SET refs = refs - 1 WHERE vectorstore_id = ?", (vectorstore_id,)
+                )
+                refs = self._conn.execute(
+                    "SELECT refs FROM vectorstores WHERE vectorstore_id = ?", (vectorstore_id,)
+                ).fetchone()
+                orphaned = refs is None or refs[0] <= 0
+                if orphaned:
+                    self._conn.execute("DELETE FROM vectorstores WHERE vectorstore_id = ?", (vectorstore_id,))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return vectorstore_id if orphaned else None
+
+    def discard_hash(self, vectorstore_id: str):
+        """Stop deduplicating against a vector store, e.g. because building it failed."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE vectorstores SET content_hash = NULL WHERE vectorstore_id = ?", (vectorstore_id,)
+            )
+
+    def refs(self, vectorstore_id: str) -> int:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT refs FROM vectorstores WHERE vectorstore_id = ?", (vectorstore_id,)
+            ).fetchone()
+        return row[0] if row else 0
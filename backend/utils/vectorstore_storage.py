@@ -0,0 +1,360 @@
+import json
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import uuid
+import weakref
+from collections.abc import Mapping
+from typing import Dict, List, Optional, Tuple
+
+import faiss
+import numpy as np
+from langchain_community.docstore.base import Docstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+# Files of the on-disk format; chunks.sqlite3 is written last and marks a complete store
+INDEX_FILE = "index.faiss"
+VECTORS_FILE = "vectors.npy"
+CHUNKS_FILE = "chunks.sqlite3"
+
+# Same token rule as the FTS5 unicode61 tokenizer: runs of letters and digits, lower-cased
+_TOKEN_RE = re.compile(r"[^\W_]+")
+
+# Newer FAISS builds can also memory-map flat codes inside index files
+_MMAP_FLAGS = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+
+
+class MmapFlatIndex:
+    """Exact L2 search over a memory-mapped float32 matrix.
+
+    Stands in for IndexFlatL2 in a loaded vector store: opening it reads nothing, and
+    the pages touched by searches live in the OS page cache, shared by all processes.
+    """
+
+    def __init__(self, vectors_path: str):
+        # Mapped for the index's lifetime: a replaced vectors.npy stays readable through the mapping until then
+        self.vectors = np.load(vectors_path, mmap_mode="r")
+        self.ntotal, self.d = self.vectors.shape
+        self.is_trained = True
+
+    def search(self, queries, k: int):
+        # Same squared L2 distances and -1 padding as IndexFlatL2.search
+        return faiss.knn(np.ascontiguousarray(queries, dtype=np.float32), self.vectors, k)
+
+    def reconstruct(self, position: int):
+        return np.array(self.vectors[position])
+
+    def reconstruct_n(self, start: int, count: int):
+        return np.array(self.vectors[start:start + count])
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+
+class ChunkDocstore(Docstore):
+    """Read-only docstore that fetches chunks from SQLite by their position in the index.
+
+    Stores written since lexical search was added also carry an FTS5 index of the
+    chunk texts, for BM25 search and token document frequencies.
+
+    The connection is opened once and closed when the docstore is garbage collected,
+    so a store whose files were replaced by a rebuild keeps reading its own chunks,
+    matching its own vectors, for as long as anything still uses it.
+    """
+
+    def __init__(self, db_path: str):
+        # immutable: the file is only ever replaced, never modified in place, so no locking is needed
+        self._conn = sqlite3.connect(f"file:{db_path}?mode=ro&immutable=1", uri=True, check_same_thread=False)
+        weakref.finalize(self, self._conn.close)
+        self._lock = threading.Lock()
+        self.has_lexical_index = self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'chunks_fts'"
+        ).fetchone() is not None
+
+    def search(self, search):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, content, metadata FROM chunks WHERE position = ?", (int(search),)
+            ).fetchone()
+        if row is None:
+            return f"ID {search} not found."
+        return Document(id=row[0], page_content=row[1], metadata=json.loads(row[2]))
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def all_chunks(self) -> List[Tuple[int, Document]]:
+        with self._lock:
+            rows = self._conn.execute("SELECT position, id, content, metadata FROM chunks ORDER BY position").fetchall()
+        return [
+            (position, Document(id=doc_id, page_content=content, metadata=json.loads(metadata)))
+            for position, doc_id, content, metadata in rows
+        ]
+
+    def document_frequencies(self, tokens: List[str]) -> Dict[str, int]:
+        """Number of chunks each token occurs in (0 for unknown tokens)."""
+        tokens = list(dict.fromkeys(tokens))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT term, doc FROM chunks_vocab WHERE term IN ({','.join('?' * len(tokens))})", tokens
+            ).fetchall()
+        frequencies = dict.fromkeys(tokens, 0)
+        frequencies.update(rows)
+        return frequencies
+
+    def lexical_search(self, tokens: List[str], k: int) -> List[Tuple[Document, float]]:
+        """BM25 search for chunks containing any of the tokens, best first.
+
+        Scores are FTS5 bm25() values, where lower is better.
+        """
+        if not tokens:
+            return []
+        match = " OR ".join('"' + token.replace('"', '""') + '"' for token in dict.fromkeys(tokens))
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT c.id, c.content, c.metadata, bm25(chunks_fts) AS score "
+                "FROM chunks_fts JOIN chunks c ON c.position = chunks_fts.rowid "
+                "WHERE chunks_fts MATCH ? ORDER BY score LIMIT ?",
+                (match, k)
+            ).fetchall()
+        return [
+            (Document(id=doc_id, page_content=content, metadata=json.loads(metadata)), score)
+            for doc_id, content, metadata, score in rows
+        ]
+
+
+class _PositionIds(Mapping):
+    """index_to_docstore_id for a ChunkDocstore: chunks are looked up by index position."""
+
+    def __init__(self, size: int):
+        self._size = size
+
+    def __getitem__(self, position):
+        position = int(position)
+        if not 0 <= position < self._size:
+            raise KeyError(position)
+        return position
+
+    def __iter__(self):
+        return iter(range(self._size))
+
+    def __len__(self):
+        return self._size
+
+
+def stored_chunks(vectorstore) -> List[Tuple[int, Document]]:
+    """All chunks of a loaded vector store with their positions in the index."""
+    if isinstance(vectorstore.docstore, ChunkDocstore):
+        return vectorstore.docstore.all_chunks()
+    return [
+        (position, vectorstore.docstore.search(doc_id))
+        for position, doc_id in sorted(vectorstore.index_to_docstore_id.items())
+    ]
+
+
+def is_legacy_vectorstore(vectorstore_path: str) -> bool:
+    return not os.path.exists(os.path.join(vectorstore_path, CHUNKS_FILE))
+
+
+def vectorstore_version(vectorstore_path: str) -> Optional[int]:
+    """Modification time of the file save_vectorstore replaces last, or None if there is none.
+
+    Changes whenever the index is rebuilt, by this process or any other.
+    """
+    for name in (CHUNKS_FILE, "index.pkl"):
+        try:
+            return os.stat(os.path.join(vectorstore_path, name)).st_mtime_ns
+        except OSError:
+            continue
+    return None
+
+
+def _replace_file(path: str, write):
+    # Write next to the target and rename, so readers keep their old mapping intact
+    tmp_path = path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def _create_chunks_table(conn: sqlite3.Connection):
+    conn.execute("""
+        CREATE TABLE chunks (
+            position INTEGER PRIMARY KEY,
+            id TEXT NOT NULL,
+            content TEXT NOT NULL,
+            metadata TEXT NOT NULL
+        )
+    """)
+
+
+def _build_lexical_index(conn: sqlite3.Connection):
+    # BM25 index over the chunk texts; the vocab table exposes per-token chunk counts
+    conn.executescript("""
+        CREATE VIRTUAL TABLE chunks_fts USING fts5(content, content='chunks', content_rowid='position');
+        INSERT INTO chunks_fts (chunks_fts) VALUES ('rebuild');
+        CREATE VIRTUAL TABLE chunks_vocab USING fts5vocab(chunks_fts, 'row');
+    """)
+
+
+def _write_chunks(db_path: str, vectorstore):
+    conn = sqlite3.connect(db_path)
+    try:
+        _create_chunks_table(conn)
+        conn.executemany(
+            "INSERT INTO chunks (position, id, content, metadata) VALUES (?, ?, ?, ?)",
+            (
+                (position, doc_id, doc.page_content, json.dumps(doc.metadata, default=str))
+                for position, doc_id in sorted(vectorstore.index_to_docstore_id.items())
+                for doc in [vectorstore.docstore.search(doc_id)]
+            )
+        )
+        _build_lexical_index(conn)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _remove_stale_files(vectorstore_path: str, flat: bool):
+    # Drop files of a previous format so the directory only describes this index
+    for name in ("index.pkl", INDEX_FILE if flat else VECTORS_FILE):
+        path = os.path.join(vectorstore_path, name)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def save_vectorstore(vectorstore, vectorstore_path: str):
+    """Save an in-memory FAISS vector store in the memory-mappable format.
+
+    Flat indexes are stored as a raw float32 matrix, other index types with
+    faiss.write_index; chunk texts and metadata go to a SQLite table keyed by
+    index position instead of a pickled docstore, together with their BM25 index.
+    """
+    os.makedirs(vectorstore_path, exist_ok=True)
+    index = vectorstore.index
+    flat = isinstance(index, (faiss.IndexFlatL2, MmapFlatIndex))
+
+    if flat:
+        vectors = index.reconstruct_n(0, index.ntotal) if index.ntotal else np.zeros((0, index.d), np.float32)
+        _replace_file(os.path.join(vectorstore_path, VECTORS_FILE), lambda path: _save_npy(path, vectors))
+    else:
+        _replace_file(os.path.join(vectorstore_path, INDEX_FILE), lambda path: faiss.write_index(index, path))
+    _replace_file(os.path.join(vectorstore_path, CHUNKS_FILE), lambda path: _write_chunks(path, vectorstore))
+    _remove_stale_files(vectorstore_path, flat)
+
+
+def _save_npy(path: str, vectors: np.ndarray):
+    with open(path, "wb") as f:
+        np.save(f, np.ascontiguousarray(vectors, dtype=np.float32))
+
+
+class VectorStoreWriter:
+    """Writes a vector store in the on-disk format batch by batch, without holding it in memory.
+
+    Chunks go straight into a temporary chunks database and vectors are appended to a
+    temporary raw float32 file. finish() turns them into the final files, which replace
+    those of any previous store in one rename each, chunks.sqlite3 last.
+    """
+
+    def __init__(self, vectorstore_path: str):
+        os.makedirs(vectorstore_path, exist_ok=True)
+        self.vectorstore_path = vectorstore_path
+        self.count = 0
+        self.dimension = None
+        self._chunks_path = os.path.join(vectorstore_path, CHUNKS_FILE + ".tmp")
+        self._raw_path = os.path.join(vectorstore_path, "vectors.f32.tmp")
+        for path in (self._chunks_path, self._raw_path):
+            if os.path.exists(path):
+                os.remove(path)
+        # Used from worker threads, one call at a time
+        self._conn = sqlite3.connect(self._chunks_path, check_same_thread=False)
+        _create_chunks_table(self._conn)
+        self._raw = open(self._raw_path, "wb")
+
+    def add(self, chunks: List[Document], vectors):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if self.dimension is None:
+            self.dimension = vectors.shape[1]
+        self._conn.executemany(
+            "INSERT INTO chunks (position, id, content, metadata) VALUES (?, ?, ?, ?)",
+            (
+                (self.count + offset, str(uuid.uuid4()), chunk.page_content, json.dumps(chunk.metadata, default=str))
+                for offset, chunk in enumerate(chunks)
+            )
+        )
+        self._conn.commit()
+        self._raw.write(vectors.tobytes())
+        self.count += len(chunks)
+
+    def vectors(self) -> np.ndarray:
+        """All vectors added so far, memory-mapped from the temporary file."""
+        self._raw.flush()
+        return np.memmap(self._raw_path, dtype=np.float32, mode="r", shape=(self.count, self.dimension))
+
+    def finish(self, index=None):
+        """Write the final files: the added vectors as a flat index, or index if given."""
+        self._raw.close()
+        if index is None:
+            _replace_file(os.path.join(self.vectorstore_path, VECTORS_FILE), self._write_npy)
+        else:
+            _replace_file(os.path.join(self.vectorstore_path, INDEX_FILE), lambda path: faiss.write_index(index, path))
+        os.remove(self._raw_path)
+
+        _build_lexical_index(self._conn)
+        self._conn.commit()
+        self._conn.close()
+        os.replace(self._chunks_path, os.path.join(self.vectorstore_path, CHUNKS_FILE))
+        _remove_stale_files(self.vectorstore_path, index is None)
+
+    def discard(self):
+        """Remove the temporary files of an unfinished store."""
+        self._raw.close()
+        self._conn.close()
+        for path in (self._chunks_path, self._raw_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _write_npy(self, path: str):
+        # An .npy file is a header followed by the raw matrix, so the vectors are copied over in blocks
+        with open(path, "wb") as f, open(self._raw_path, "rb") as raw:
+            np.lib.format.write_array_header_1_0(f, {
+                "descr": np.lib.format.dtype_to_descr(np.dtype(np.float32)),
+                "fortran_order": False,
+                "shape": (self.count, self.dimension)
+            })
+            shutil.copyfileobj(raw, f, 1024 * 1024)
+
+
+def load_vectorstore(vectorstore_path: str, embeddings):
+    """Open a saved vector store without reading its vectors or chunks into memory.
+
+    Stores saved by FAISS.save_local before this format existed are still loaded the
+    old way.
+    """
+    if is_legacy_vectorstore(vectorstore_path):
+        return FAISS.load_local(vectorstore_path, embeddings, allow_dangerous_deserialization=True)
+
+    vectors_path = os.path.join(vectorstore_path, VECTORS_FILE)
+    if os.path.exists(vectors_path):
+        index = MmapFlatIndex(vectors_path)
+    else:
+        index_path = os.path.join(vectorstore_path, INDEX_FILE)
+        try:
+            index = faiss.read_index(index_path, _MMAP_FLAGS)
+        except RuntimeError:
+            # Index types whose storage can't be mapped are read into memory
+            index = faiss.read_index(index_path)
+
+    return FAISS(
+        embedding_function=embeddings,
+        index=index,
+        docstore=ChunkDocstore(os.path.join(vectorstore_path, CHUNKS_FILE)),
+        index_to_docstore_id=_PositionIds(index.ntotal)
+    )
+
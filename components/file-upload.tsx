@@ -5,7 +5,7 @@ import type React from "react"
 
 import { useState, useRef } from "react"
 import { Upload, FileText } from "lucide-react"
-import { uploadDocument } from "@/lib/api"
+import { uploadDocument, uploadDocuments } from "@/lib/api"
 import { cn } from "@/lib/utils"
 import { useToast } from "@/hooks/use-toast"
 
@@ -18,6 +18,11 @@ const ACCEPTED_FILE_TYPES = [
   "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
 ]
 
+// Archives are unpacked by the backend; browsers report their MIME types inconsistently
+const ARCHIVE_EXTENSIONS = [".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz"]
+
+const isArchive = (file: File) => ARCHIVE_EXTENSIONS.some((ext) => file.name.toLowerCase().endsWith(ext))
+
 export function FileUpload({ onUploadSuccess }: { onUploadSuccess: () => void }) {
   const [isDragging, setIsDragging] = useState(false)
   const [isUploading, setIsUploading] = useState(false)
@@ -49,13 +54,13 @@ export function FileUpload({ onUploadSuccess }: { onUploadSuccess: () => void })
     }
   }
 
-  const handleFiles = async (files: FileList) => {
-    const file = files[0]
+  const handleFiles = async (fileList: FileList) => {
+    const files = Array.from(fileList)
 
-    if (!ACCEPTED_FILE_TYPES.includes(file.type)) {
+    if (files.some((file) => !ACCEPTED_FILE_TYPES.includes(file.type) && !isArchive(file))) {
       toast({
         title: "Invalid file type",
-        description: "Please upload PDF, DOC, DOCX, TXT, CSV, or XLSX files only.",
+        description: "Please upload PDF, DOC, DOCX, TXT, CSV, XLSX files or ZIP/TAR archives only.",
         variant: "destructive",
       })
       return
@@ -73,13 +78,21 @@ export function FileUpload({ onUploadSuccess }: { onUploadSuccess: () => void })
     }, 300)
 
     try {
-      await uploadDocument(file)
+      // Several files or an archive go to the bulk endpoint in a single request
+      let description = `${files[0].name} has been uploaded successfully.`
+      if (files.length > 1 || isArchive(files[0])) {
+        const results = await uploadDocuments(files)
+        const accepted = results.filter((result) => result.status !== "rejected").length
+        description = `${accepted} of ${results.length} files have been uploaded successfully.`
+      } else {
+        await uploadDocument(files[0])
+      }
       clearInterval(progressInterval)
       setUploadProgress(100)
 
       toast({
         title: "Upload successful",
-        description: `${file.name} has been uploaded successfully.`,
+        description,
       })
 
       // Reset the form
@@ -122,7 +135,8 @@ export function FileUpload({ onUploadSuccess }: { onUploadSuccess: () => void })
           ref={fileInputRef}
           onChange={handleFileInputChange}
           className="hidden"
-          accept=".pdf,.doc,.docx,.txt,.csv,.xlsx"
+          accept=".pdf,.doc,.docx,.txt,.csv,.xlsx,.zip,.tar,.gz,.tgz,.bz2,.xz"
+          multiple
           disabled={isUploading}
         />
 
@@ -145,8 +159,8 @@ export function FileUpload({ onUploadSuccess }: { onUploadSuccess: () => void })
             <div className="flex justify-center">
               <Upload className="h-10 w-10 text-gray-400" />
             </div>
-            <p className="mt-2 text-sm font-medium text-white">Drag and drop your document here, or click to browse</p>
-            <p className="mt-1 text-xs text-gray-400">Supports PDF, DOC, DOCX, TXT, CSV, XLSX</p>
+            <p className="mt-2 text-sm font-medium text-white">Drag and drop your documents here, or click to browse</p>
+            <p className="mt-1 text-xs text-gray-400">Supports PDF, DOC, DOCX, TXT, CSV, XLSX and ZIP/TAR archives</p>
           </>
         )}
       </div>
@@ -57,6 +57,35 @@ export async function uploadDocument(file: File): Promise<Document> {
   return response.json()
 }
 
+export interface BulkUploadResult {
+  id?: string
+  name: string
+  status: "queued" | "duplicate" | "rejected"
+  error?: string
+}
+
+// Upload several documents and/or zip/tar archives in one request
+export async function uploadDocuments(files: File[]): Promise<BulkUploadResult[]> {
+  const formData = new FormData()
+  files.forEach((file) => formData.append("files", file))
+
+  if (currentDeviceId) {
+    formData.append("device_id", currentDeviceId)
+  }
+
+  const response = await fetch(`${API_URL}/upload_bulk`, {
+    method: "POST",
+    body: formData,
+  })
+
+  if (!response.ok) {
+    throw new Error(`Upload failed: ${response.statusText}`)
+  }
+
+  const data = await response.json()
+  return data.files
+}
+
 // Get all documents
 export async function getDocuments(): Promise<Document[]> {
   // Include device_id as a query parameter if available